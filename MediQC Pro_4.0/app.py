@@ -1,156 +1,241 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, Response, stream_with_context
 import os
 import json
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import re
-from werkzeug.utils import secure_filename
-from medical_entities import get_medical_entities, save_medical_entities, recognize_entities
+from medical_entities import get_medical_entities, save_medical_entities, recognize_entities, init_medical_entities
 from export_medical_records import export_medical_records, export_patients, export_admissions
 from text_to_excel import parse_medical_text
 # 导入大模型命名实体识别模块
-from llm_ner import get_llm_config, save_llm_config, recognize_entities_with_api, calculate_entity_statistics, recognize_entities_with_rules
+from model_registry import get_model_registry
+from llm_ner import init_config, get_llm_config, save_llm_config, recognize_entities_with_api, calculate_entity_statistics, recognize_entities_with_rules, load_transformer_model, get_rule_matcher, uses_ner_server, get_ner_mode, recognize_entities_hybrid, NER_MODE_API, NER_MODE_HYBRID, stream_entities_with_api, iter_entity_events
+from llm_stream import format_sse
 from docx_data_check import DocxDataExtractor, DocxResultGenerator
+from artifact_store import get_artifact_store, is_artifact_id
+from config_cache import load_json, save_json
+from data_store import get_data_store, RULES as RULES_NAMESPACE
+from entity_matcher import get_entity_matcher, entity_added, entity_removed
+from entity_highlight import highlight_entities
+import batch_ner as batch_ner_module
+import column_ner
+import gc
+import copy
+import importlib
+import time
+import mimetypes
 import html
 import logging
+import threading
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# 初始化Flask应用
-app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # 用于会话安全的密钥，生产环境应使用强随机密钥
+# 所有页面和接口注册在蓝图上，由create_app()注册到应用实例，
+# 同一进程中可以创建多个配置不同的应用实例（如WSGI入口和测试）
+bp = Blueprint('main', __name__)
 
-# 创建必要的存储目录
-os.makedirs('data', exist_ok=True)    # 用于存储规则和映射数据
-os.makedirs('uploads', exist_ok=True)  # 用于存储上传的文件
-os.makedirs('excel_data', exist_ok=True)  # 用于存储生成的Excel文件
+# 预热状态，由warmup()填写，供/readyz就绪检查使用
+_warmup_state = {
+    'ready': False,
+    'started_at': None,
+    'finished_at': None,
+    'steps': {}
+}
+_warmup_lock = threading.Lock()
 
 # 文件路径常量定义
+# 规则、映射和实体字典保存在SQLite规则库（data/mediqc.db）中，以下JSON文件仅在首次初始化规则库时导入
 RULES_FILE = 'data/rules.json'  # 规则文件路径
 DIAGNOSIS_DEPT_MAPPING_FILE = 'data/diagnosis_department_mapping.json'  # 科室与诊断映射文件路径
 MEDICAL_ENTITIES_FILE = 'data/medical_entities.json'  # 医学实体字典文件路径
 DB_CONFIG_FILE = 'data/db_config.json'  # 数据库配置文件路径
 LLM_CONFIG_FILE = 'data/llm_config.json'  # LLM配置文件路径
+BATCH_NER_MAX_DOCUMENTS = 1000  # 批量实体识别JSON接口单次最多处理的文档数
+COLUMN_NER_WORKERS = os.cpu_count() or 1  # 表格文本列实体识别的工作进程数（文本较少时不启用多进程）
+COLUMN_NER_TOP_ENTITIES = 50  # 表格文本列实体识别接口返回的高频实体数
 
-# 初始化规则文件（如果不存在）
-if not os.path.exists(RULES_FILE):
-    with open(RULES_FILE, 'w', encoding='utf-8') as f:
-        json.dump([], f, ensure_ascii=False)
-
-# 初始化医学实体字典文件（如果不存在）
-if not os.path.exists(MEDICAL_ENTITIES_FILE):
-    medical_entities = {
-        "疾病": ["肺癌", "支气管哮喘", "冠心病", "高血压", "糖尿病", "肝炎", "肺炎"],
-        "症状": ["发热", "咳嗽", "胸痛", "头痛", "腹痛", "呕吐", "腹泻"],
-        "检查": ["血常规", "尿常规", "肝功能", "CT检查", "核磁共振", "X光检查", "超声检查"],
-        "治疗": ["手术", "药物治疗", "放疗", "化疗", "物理治疗", "心理治疗", "康复治疗"],
-        "药物": ["青霉素", "阿莫西林", "头孢", "阿司匹林", "布洛芬", "泼尼松", "胰岛素"]
-    }
-    with open(MEDICAL_ENTITIES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(medical_entities, ensure_ascii=False, indent=2, fp=f)
-
-# 初始化数据库配置文件（如果不存在）
-if not os.path.exists(DB_CONFIG_FILE):
-    db_config = {
-        'host': 'localhost',
-        'user': 'root',
-        'password': '',
-        'database': 'hospital_emr',
-        'charset': 'utf8mb4'
-    }
-    with open(DB_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(db_config, ensure_ascii=False, indent=2, fp=f)
-
-# 初始化大模型配置文件（如果不存在）
-if not os.path.exists(LLM_CONFIG_FILE):
-    llm_config = {
-        'api_mode': False,
-        'api_type': 'deepseek',
-        'api_key': '',
-        'api_url': ''
-    }
-    with open(LLM_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(llm_config, ensure_ascii=False, indent=2, fp=f)
+# 初始化存储目录和配置文件
+def init_storage():
+    """
+    创建数据目录，并为不存在的规则、医学实体字典、数据库配置和大模型配置文件写入默认内容
+    
+    上传文件和生成的Excel、Word、CSV文件统一保存在产物存储（artifacts目录）中，
+    uploads和excel_data目录仅用于兼容旧版下载链接，不再创建。
+    """
+    os.makedirs('data', exist_ok=True)    # 用于存储规则和映射数据
+    
+    # 初始化规则文件（如果不存在）
+    if not os.path.exists(RULES_FILE):
+        with open(RULES_FILE, 'w', encoding='utf-8') as f:
+            json.dump([], f, ensure_ascii=False)
+    
+    # 初始化医学实体字典文件（如果不存在）
+    if not os.path.exists(MEDICAL_ENTITIES_FILE):
+        medical_entities = {
+            "疾病": ["肺癌", "支气管哮喘", "冠心病", "高血压", "糖尿病", "肝炎", "肺炎"],
+            "症状": ["发热", "咳嗽", "胸痛", "头痛", "腹痛", "呕吐", "腹泻"],
+            "检查": ["血常规", "尿常规", "肝功能", "CT检查", "核磁共振", "X光检查", "超声检查"],
+            "治疗": ["手术", "药物治疗", "放疗", "化疗", "物理治疗", "心理治疗", "康复治疗"],
+            "药物": ["青霉素", "阿莫西林", "头孢", "阿司匹林", "布洛芬", "泼尼松", "胰岛素"]
+        }
+        with open(MEDICAL_ENTITIES_FILE, 'w', encoding='utf-8') as f:
+            json.dump(medical_entities, ensure_ascii=False, indent=2, fp=f)
+    
+    # 初始化数据库配置文件（如果不存在）
+    if not os.path.exists(DB_CONFIG_FILE):
+        db_config = {
+            'host': 'localhost',
+            'user': 'root',
+            'password': '',
+            'database': 'hospital_emr',
+            'charset': 'utf8mb4'
+        }
+        with open(DB_CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(db_config, ensure_ascii=False, indent=2, fp=f)
+    
+    # 初始化大模型配置文件（如果不存在）
+    if not os.path.exists(LLM_CONFIG_FILE):
+        llm_config = {
+            'api_mode': False,
+            'api_type': 'deepseek',
+            'api_key': '',
+            'api_url': ''
+        }
+        with open(LLM_CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(llm_config, ensure_ascii=False, indent=2, fp=f)
 
 # 获取所有规则
 def get_rules():
     """
-    从规则文件中读取所有质控规则
+    从规则库中读取所有质控规则
     
-    读取JSON格式的规则文件，解析其中定义的质控规则列表。
-    如果文件不存在或格式错误，则返回空列表并记录错误。
+    规则保存在SQLite规则库中（首次启动时从规则文件导入），
+    规则列表按规则库的变更计数器缓存，返回的列表为缓存共享对象，不应直接修改。
     
     Returns:
         list: 质控规则列表，每个规则为一个字典，包含规则ID、名称、类型、条件等信息
     """
-    try:
-        with open(RULES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取规则文件出错: {str(e)}")
-        return []
+    return get_data_store().list_rules()
+
+# 按ID获取规则
+def get_rule_by_id(rule_id):
+    """
+    按规则ID查找规则
+    
+    Args:
+        rule_id (str): 规则ID
+        
+    Returns:
+        dict: 规则字典，不存在时返回None
+    """
+    return get_data_store().get_rule(rule_id)
+
+# 按名称获取规则
+def get_rule_by_name(rule_name):
+    """
+    按规则名称查找规则（同名规则返回第一条）
+    
+    Args:
+        rule_name (str): 规则名称
+        
+    Returns:
+        dict: 规则字典，不存在时返回None
+    """
+    return get_data_store().get_rule_by_name(rule_name)
+
+# 解析关联规则的值对
+def parse_value_pairs(value_pairs):
+    """
+    解析关联规则的值对文本
+    
+    Args:
+        value_pairs (str): 每行一个"值1=值2"的值对文本
+        
+    Returns:
+        list: [(值1, 值2), ...]，格式错误时抛出ValueError
+    """
+    value_pairs_list = []
+    for pair in value_pairs.strip().split('\n'):
+        if pair.strip():
+            val1, val2 = pair.split('=')
+            value_pairs_list.append((val1.strip(), val2.strip()))
+    return value_pairs_list
+
+# 获取预处理后的规则
+def get_compiled_rules():
+    """
+    获取预处理后的质控规则列表
+    
+    关联规则的值对文本在规则变更后只解析一次，解析结果保存在value_pairs_list中
+    （格式错误时为None，错误信息保存在value_pairs_error中）。结果按规则库的变更计数器缓存，
+    预热阶段构建后由各工作进程共享。
+    
+    Returns:
+        list: 规则字典的副本列表，不应直接修改
+    """
+    def build():
+        compiled = []
+        for rule in get_rules():
+            item = dict(rule)
+            if item.get('type') == 'relation':
+                try:
+                    item['value_pairs_list'] = parse_value_pairs(item.get('value_pairs', ''))
+                except Exception as e:
+                    item['value_pairs_list'] = None
+                    item['value_pairs_error'] = str(e)
+            compiled.append(item)
+        return compiled
+    return get_data_store().cached(RULES_NAMESPACE, 'compiled_rules', build)
 
 # 保存规则
 def save_rules(rules):
     """
-    将规则列表保存到规则文件
+    用规则列表整体替换规则库中的规则
     
-    将质控规则列表序列化为JSON格式并保存到规则文件中。
+    单条规则的增删改请使用规则库的add_rule、update_rule、delete_rule。
     如果保存过程中出现错误，则记录错误信息。
     
     Args:
         rules (list): 要保存的规则列表，每个规则为一个字典
     """
     try:
-        with open(RULES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(rules, ensure_ascii=False, indent=2, fp=f)
+        get_data_store().replace_rules(rules)
     except Exception as e:
         print(f"保存规则文件出错: {str(e)}")
 
 # 获取科室与诊断映射
 def get_diagnosis_dept_mapping():
     """
-    从映射文件中读取科室与诊断的对应关系
+    从规则库中读取科室与诊断的对应关系
     
     Returns:
-        dict: 科室与诊断的映射字典，如果文件不存在或格式错误则返回空字典
+        dict: 科室与诊断的映射字典
     """
-    try:
-        with open(DIAGNOSIS_DEPT_MAPPING_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取科室诊断映射文件出错: {str(e)}")
-        return {}
+    return get_data_store().get_diagnosis_dept_mapping()
 
 # 获取医学实体字典
 def get_medical_entities():
     """
-    从医学实体字典文件中读取医学实体数据
+    从规则库中读取医学实体字典
     
     Returns:
-        dict: 医学实体字典，如果文件不存在或格式错误则返回空字典
+        dict: 医学实体字典，{实体类型: [实体名称, ...]}
     """
-    try:
-        with open(MEDICAL_ENTITIES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取医学实体字典文件出错: {str(e)}")
-        return {}
+    return get_data_store().get_entities()
 
 # 保存医学实体字典
 def save_medical_entities(entities):
     """
-    将医学实体字典保存到文件
+    用给定的字典整体替换规则库中的医学实体字典
     
     Args:
         entities (dict): 要保存的医学实体字典
     """
     try:
-        with open(MEDICAL_ENTITIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(entities, ensure_ascii=False, indent=2, fp=f)
+        get_data_store().replace_entities(entities)
     except Exception as e:
         print(f"保存医学实体字典文件出错: {str(e)}")
 
@@ -162,18 +247,13 @@ def get_db_config():
     Returns:
         dict: 数据库配置字典，如果文件不存在或格式错误则返回默认配置
     """
-    try:
-        with open(DB_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取数据库配置文件出错: {str(e)}")
-        return {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '',
-            'database': 'hospital_emr',
-            'charset': 'utf8mb4'
-        }
+    return load_json(DB_CONFIG_FILE, {
+        'host': 'localhost',
+        'user': 'root',
+        'password': '',
+        'database': 'hospital_emr',
+        'charset': 'utf8mb4'
+    })
 
 # 保存数据库配置
 def save_db_config(config):
@@ -184,33 +264,32 @@ def save_db_config(config):
         config (dict): 要保存的数据库配置
     """
     try:
-        with open(DB_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, ensure_ascii=False, indent=2, fp=f)
+        save_json(DB_CONFIG_FILE, config)
     except Exception as e:
         print(f"保存数据库配置文件出错: {str(e)}")
 
 # 路由定义部分
 # 首页
-@app.route('/')
+@bp.route('/')
 def index():
     """首页路由，显示系统主页"""
     return render_template('index.html')
 
 # 规则管理页面
-@app.route('/rules')
+@bp.route('/rules')
 def rules_page():
     """规则管理页面路由，显示规则管理界面"""
     rules = get_rules()
     return render_template('rules.html', rules=rules)
 
 # 数据库转Excel页面
-@app.route('/database_to_excel')
+@bp.route('/database_to_excel')
 def database_to_excel():
     """数据库转Excel页面路由，显示数据库导出界面"""
     return render_template('database_to_excel.html')
 
 # 处理数据库导出请求
-@app.route('/export_database', methods=['POST'])
+@bp.route('/export_database', methods=['POST'])
 def export_database():
     """处理数据库导出请求的路由"""
     try:
@@ -224,7 +303,7 @@ def export_database():
         
         if not all([export_type, db_type, host, username, database]):
             flash('请填写所有必填字段')
-            return redirect(url_for('database_to_excel'))
+            return redirect(url_for('.database_to_excel'))
         
         # 创建数据库连接
         try:
@@ -277,7 +356,7 @@ def export_database():
                 conn = sqlite3.connect(database)
             else:
                 flash('不支持的数据库类型')
-                return redirect(url_for('database_to_excel'))
+                return redirect(url_for('.database_to_excel'))
             
             # 根据导出类型调用相应的函数
             if export_type == 'patients':
@@ -291,29 +370,34 @@ def export_database():
                 flash('病案首页导出成功')
             else:
                 flash('不支持的导出类型')
-                return redirect(url_for('database_to_excel'))
+                return redirect(url_for('.database_to_excel'))
         
         except Exception as e:
             flash(f'数据库连接或导出错误: {str(e)}')
-            return redirect(url_for('database_to_excel'))
+            return redirect(url_for('.database_to_excel'))
         
         # 关闭连接
         conn.close()
         
-        # 返回下载链接
-        return send_file(result_file, as_attachment=True)
+        if not result_file:
+            flash('导出数据失败，请检查数据库表结构')
+            return redirect(url_for('.database_to_excel'))
+        
+        # 将导出文件移入产物存储后返回
+        artifact = get_artifact_store().put_file(result_file, kind='export', move=True)
+        return send_artifact(artifact)
     except Exception as e:
         flash(f'导出数据库出错: {str(e)}')
-        return redirect(url_for('database_to_excel'))
+        return redirect(url_for('.database_to_excel'))
 
 # 文本转Excel页面
-@app.route('/text_to_excel')
+@bp.route('/text_to_excel')
 def text_to_excel_page():
     """文本转Excel页面路由，显示文本转换界面"""
     return render_template('text_to_excel.html')
 
 # 处理文本转Excel请求
-@app.route('/process_text_to_excel', methods=['POST'])
+@bp.route('/process_text_to_excel', methods=['POST'])
 def process_text_to_excel():
     """
     处理医疗文本转Excel请求的路由
@@ -330,27 +414,26 @@ def process_text_to_excel():
         
         if not text:
             flash('请输入文本')
-            return redirect(url_for('text_to_excel_page'))
+            return redirect(url_for('.text_to_excel_page'))
         
         # 解析文本
         data = parse_medical_text(text)
         
         if not data:
             flash('无法解析文本，请检查文本格式')
-            return redirect(url_for('text_to_excel_page'))
+            return redirect(url_for('.text_to_excel_page'))
         
         # 转换为DataFrame
         df = pd.DataFrame(data)
         
-        # 生成Excel文件
-        if not os.path.exists('excel_data'):
-            os.makedirs('excel_data')
-        
+        # 生成Excel文件并写入产物存储
+        store = get_artifact_store()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"医疗记录_{timestamp}.xlsx"
-        filepath = os.path.join('excel_data', filename)
+        filepath = store.new_temp_path(filename)
         
         df.to_excel(filepath, index=False, engine='openpyxl')
+        artifact = store.put_file(filepath, filename, kind='excel', move=True)
         
         # 生成HTML表格预览
         html_table = df.to_html(classes='table table-striped table-bordered', index=False)
@@ -358,21 +441,22 @@ def process_text_to_excel():
         # 返回预览页面
         return render_template('text_to_excel_result.html', 
                                filename=filename, 
+                               artifact_id=artifact['id'],
                                data=html_table, 
                                record_count=len(data))
     except Exception as e:
         flash(f'处理文本转Excel出错: {str(e)}')
-        return redirect(url_for('text_to_excel_page'))
+        return redirect(url_for('.text_to_excel_page'))
 
 # 实体识别页面
-@app.route('/entity_recognition')
+@bp.route('/entity_recognition')
 def entity_recognition_page():
     """实体识别页面路由，显示实体识别界面"""
     entities = get_medical_entities()
     return render_template('entity_recognition.html', entities=entities)
 
 # 处理医学文本实体识别请求
-@app.route('/recognize_entities', methods=['POST'])
+@bp.route('/recognize_entities', methods=['POST'])
 def recognize_entities():
     """
     处理医学实体识别请求的路由
@@ -389,50 +473,21 @@ def recognize_entities():
         
         if not text:
             flash('请输入医学文本')
-            return redirect(url_for('entity_recognition_page'))
+            return redirect(url_for('.entity_recognition_page'))
         
-        # 获取医学实体字典
-        entities_dict = get_medical_entities()
+        # 使用医学实体字典的多模式匹配自动机一次扫描识别所有实体
+        recognized_entities = get_entity_matcher().recognize(text)
         
-        # 识别实体
-        recognized_entities = {}
-        entity_statistics = {}  # 添加实体统计字典
+        # 统计每个实体类型下各实体的出现次数
+        entity_statistics = {}
+        for entity_type, found_entities in recognized_entities.items():
+            entity_counts = {}
+            for entity_info in found_entities:
+                entity_counts[entity_info['entity']] = entity_counts.get(entity_info['entity'], 0) + 1
+            entity_statistics[entity_type] = entity_counts
         
-        for entity_type, entity_list in entities_dict.items():
-            found_entities = []
-            entity_counts = {}  # 每个实体类型下各实体的计数
-            
-            for entity in entity_list:
-                if entity in text:
-                    # 找出所有匹配位置
-                    positions = [m.start() for m in re.finditer(re.escape(entity), text)]
-                    count = len(positions)  # 该实体出现的次数
-                    
-                    if count > 0:
-                        entity_counts[entity] = count  # 记录该实体的出现次数
-                        
-                    for pos in positions:
-                        found_entities.append({
-                            'entity': entity,
-                            'position': pos,
-                            'context': text[max(0, pos-10):min(len(text), pos+len(entity)+10)]
-                        })
-            
-            if found_entities:
-                recognized_entities[entity_type] = found_entities
-                entity_statistics[entity_type] = entity_counts  # 添加该类型的实体统计
-        
-        # 准备高亮显示的文本
-        highlighted_text = text
-        for entity_type, entities in recognized_entities.items():
-            for entity_info in sorted(entities, key=lambda x: x['position'], reverse=True):
-                entity = entity_info['entity']
-                pos = entity_info['position']
-                highlighted_text = (
-                    highlighted_text[:pos] + 
-                    f'<span class="entity-highlight {entity_type.lower()}" title="{entity_type}">{entity}</span>' + 
-                    highlighted_text[pos+len(entity):]
-                )
+        # 准备高亮显示的文本（一次遍历生成转义后的HTML，重叠实体只高亮最长的一个）
+        highlighted_text = highlight_entities(text, recognized_entities)
         
         return render_template('entity_recognition_result.html', 
                                original_text=text,
@@ -444,10 +499,10 @@ def recognize_entities():
         error_details = traceback.format_exc()
         print(f"实体识别错误: {str(e)}\n{error_details}")
         flash(f'实体识别错误: {str(e)}')
-        return redirect(url_for('entity_recognition_page'))
+        return redirect(url_for('.entity_recognition_page'))
 
 # 添加医学实体
-@app.route('/add_entity', methods=['POST'])
+@bp.route('/add_entity', methods=['POST'])
 def add_entity():
     """
     添加新医学实体的路由
@@ -458,30 +513,22 @@ def add_entity():
         
         if not entity_type or not entity_name:
             flash('实体类型和名称不能为空')
-            return redirect(url_for('entity_recognition_page'))
+            return redirect(url_for('.entity_recognition_page'))
         
-        # 获取现有实体
-        entities = get_medical_entities()
-        
-        # 如果实体类型不存在，创建新类型
-        if entity_type not in entities:
-            entities[entity_type] = []
-        
-        # 如果实体名称不存在，添加到列表
-        if entity_name not in entities[entity_type]:
-            entities[entity_type].append(entity_name)
-            save_medical_entities(entities)
+        # 添加实体（实体类型不存在时自动创建）
+        if get_data_store().add_entity(entity_type, entity_name):
+            entity_added(entity_type, entity_name)
             flash(f'成功添加实体: {entity_name} (类型: {entity_type})')
         else:
             flash(f'实体已存在: {entity_name} (类型: {entity_type})')
         
-        return redirect(url_for('entity_recognition_page'))
+        return redirect(url_for('.entity_recognition_page'))
     except Exception as e:
         flash(f'添加实体失败: {str(e)}')
-        return redirect(url_for('entity_recognition_page'))
+        return redirect(url_for('.entity_recognition_page'))
 
 # 删除医学实体
-@app.route('/delete_entity', methods=['POST'])
+@bp.route('/delete_entity', methods=['POST'])
 def delete_entity():
     """
     删除医学实体的路由
@@ -492,26 +539,142 @@ def delete_entity():
         
         if not entity_type or not entity_name:
             flash('实体类型和名称不能为空')
-            return redirect(url_for('entity_recognition_page'))
-        
-        # 获取现有实体
-        entities = get_medical_entities()
+            return redirect(url_for('.entity_recognition_page'))
         
         # 如果实体类型存在且实体名称存在，删除实体
-        if entity_type in entities and entity_name in entities[entity_type]:
-            entities[entity_type].remove(entity_name)
-            save_medical_entities(entities)
+        if get_data_store().delete_entity(entity_type, entity_name):
+            entity_removed(entity_type, entity_name)
             flash(f'成功删除实体: {entity_name} (类型: {entity_type})')
         else:
             flash(f'实体不存在: {entity_name} (类型: {entity_type})')
         
-        return redirect(url_for('entity_recognition_page'))
+        return redirect(url_for('.entity_recognition_page'))
     except Exception as e:
         flash(f'删除实体失败: {str(e)}')
-        return redirect(url_for('entity_recognition_page'))
+        return redirect(url_for('.entity_recognition_page'))
+
+# 批量实体识别
+@bp.route('/batch_ner', methods=['POST'])
+def batch_ner():
+    """
+    批量医学实体识别接口，返回实体区间表而不是HTML页面
+    
+    支持两种调用方式：
+    1. JSON请求：{"documents": [{"id": ..., "text": ...}, ...] 或 "texts": [...], "method": "dict"|"rules"|"transformer"|"api"|"hybrid"}，
+       直接返回实体区间列表（最多BATCH_NER_MAX_DOCUMENTS个文档）；
+    2. 表单上传JSONL/JSON数组/CSV/Excel文件：file、columns（逗号分隔的文本列名）、id_column、method、
+       format（jsonl/csv/parquet），结果文件保存到产物存储并返回下载链接。
+    
+    大批量文档建议使用命令行工具batch_ner.py多进程处理。
+    """
+    try:
+        if request.is_json:
+            payload = request.get_json(silent=True) or {}
+            method = payload.get('method', batch_ner_module.METHOD_DICT)
+            if 'documents' in payload:
+                documents = [(doc.get('id', i + 1), 'text', doc.get('text') or '')
+                             for i, doc in enumerate(payload['documents'])]
+            else:
+                documents = [(i + 1, 'text', text or '') for i, text in enumerate(payload.get('texts', []))]
+            if len(documents) > BATCH_NER_MAX_DOCUMENTS:
+                return jsonify({'success': False, 'error': f'单次最多处理{BATCH_NER_MAX_DOCUMENTS}个文档'}), 400
+            
+            spans = list(batch_ner_module.run_batch(documents, method))
+            return jsonify({
+                'success': True,
+                'document_count': len(documents),
+                'span_count': len(spans),
+                'spans': spans
+            })
+        
+        file = request.files.get('file')
+        columns = [c.strip() for c in request.form.get('columns', '').split(',') if c.strip()]
+        if not file or not file.filename or not columns:
+            return jsonify({'success': False, 'error': '请上传文件并指定文本列名'}), 400
+        if os.path.splitext(file.filename)[1].lower() not in batch_ner_module.INPUT_EXTENSIONS:
+            return jsonify({'success': False, 'error': '仅支持JSONL、JSON、CSV和Excel文件'}), 400
+        output_format = request.form.get('format', 'jsonl').lower()
+        if f'.{output_format}' not in batch_ner_module.OUTPUT_EXTENSIONS:
+            return jsonify({'success': False, 'error': '输出格式仅支持jsonl、csv和parquet'}), 400
+        method = request.form.get('method', batch_ner_module.METHOD_DICT)
+        id_column = request.form.get('id_column') or None
+        
+        store = get_artifact_store()
+        upload = store.put_stream(file.stream, file.filename, kind='upload')
+        documents = batch_ner_module.read_documents(upload['path'], columns, id_column)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        result_filename = f"实体识别结果_{timestamp}.{output_format}"
+        result_path = store.new_temp_path(result_filename)
+        span_count = batch_ner_module.write_spans(batch_ner_module.run_batch(documents, method), result_path)
+        artifact = store.put_file(result_path, result_filename, kind='ner_spans', move=True)
+        
+        return jsonify({
+            'success': True,
+            'span_count': span_count,
+            'filename': result_filename,
+            'artifact_id': artifact['id'],
+            'download_url': url_for('.download_file', filename=artifact['id'])
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+# 表格文本列实体识别
+@bp.route('/column_ner', methods=['POST'])
+def column_ner_api():
+    """
+    表格文本列实体识别接口：对上传的Excel/CSV文件中的文本列整列识别医学实体
+    
+    表单参数：file、columns（逗号分隔的文本列名，默认为文件中存在的主诉、现病史、出院诊断）。
+    结果Excel文件包含三个工作表：添加“列名_实体类型”派生列后的数据、实体区间表（row列对应数据表的row列）
+    和实体频次表，保存到产物存储并返回下载链接；接口同时返回出现次数最多的COLUMN_NER_TOP_ENTITIES个实体。
+    """
+    try:
+        file = request.files.get('file')
+        if not file or not file.filename:
+            return jsonify({'success': False, 'error': '请上传Excel或CSV文件'}), 400
+        if os.path.splitext(file.filename)[1].lower() not in ('.xlsx', '.xls', '.csv'):
+            return jsonify({'success': False, 'error': '仅支持Excel和CSV文件'}), 400
+        
+        store = get_artifact_store()
+        upload = store.put_stream(file.stream, file.filename, kind='upload')
+        df = column_ner.read_table(upload['path'])
+        columns = [c.strip() for c in request.form.get('columns', '').split(',') if c.strip()]
+        if not columns:
+            columns = [c for c in column_ner.DEFAULT_COLUMNS if c in df.columns]
+        if not columns:
+            return jsonify({'success': False, 'error': '请指定文本列名'}), 400
+        
+        data, spans, frequencies = column_ner.run_column_ner(df, columns, COLUMN_NER_WORKERS)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        result_filename = f"文本列实体识别_{timestamp}.xlsx"
+        result_path = store.new_temp_path(result_filename)
+        column_ner.write_workbook(result_path, data, spans, frequencies)
+        artifact = store.put_file(result_path, result_filename, kind='column_ner', move=True)
+        
+        return jsonify({
+            'success': True,
+            'row_count': len(df),
+            'columns': columns,
+            'span_count': len(spans),
+            'entity_columns': [c for c in data.columns if c not in df.columns],
+            'frequencies': frequencies.head(COLUMN_NER_TOP_ENTITIES).to_dict(orient='records'),
+            'filename': result_filename,
+            'artifact_id': artifact['id'],
+            'download_url': url_for('.download_file', filename=artifact['id'])
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
 
 # 数据检查页面
-@app.route('/check')
+@bp.route('/check')
 def check_page():
     """数据检查页面路由，显示数据检查界面"""
     rules = get_rules()
@@ -542,7 +705,7 @@ def clean_dataframe_for_json(df):
     return df_clean.to_dict(orient='records')
 
 # 上传并检查文件
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
     """
     处理文件上传和规则检查的路由
@@ -550,29 +713,35 @@ def upload_file():
     """
     if 'file' not in request.files:
         flash('没有选择文件')
-        return redirect(url_for('check_page'))
+        return redirect(url_for('.check_page'))
     
     file = request.files['file']
     if file.filename == '':
         flash('没有选择文件')
-        return redirect(url_for('check_page'))
+        return redirect(url_for('.check_page'))
     
     try:
-        # 保存上传的文件
-        file_path = os.path.join('uploads', file.filename)
-        file.save(file_path)
+        if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
+            flash('请上传Excel文件（.xlsx或.xls格式）')
+            return redirect(url_for('.check_page'))
+        
+        # 保存上传的文件到产物存储（相同内容只保存一份）
+        artifact = get_artifact_store().put_stream(file.stream, file.filename, kind='upload')
         
         # 读取Excel文件
-        if file.filename.endswith('.xlsx') or file.filename.endswith('.xls'):
-            df = pd.read_excel(file_path)
-        else:
-            flash('请上传Excel文件（.xlsx或.xls格式）')
-            return redirect(url_for('check_page'))
+        df = pd.read_excel(artifact['path'])
             
         # 确保DataFrame非空
         if df.empty:
             flash('上传的文件不包含任何数据')
-            return redirect(url_for('check_page'))
+            return redirect(url_for('.check_page'))
+        
+        # 识别文本列中的医学实体，添加“列名_实体类型”派生列供规则检查使用
+        if request.form.get('entity_columns'):
+            text_columns = [c for c in column_ner.DEFAULT_COLUMNS if c in df.columns]
+            if text_columns:
+                spans = column_ner.recognize_columns(df, text_columns, COLUMN_NER_WORKERS)
+                df = column_ner.add_entity_columns(df, text_columns, spans)
             
         # 执行规则检查
         results = check_rules(df)
@@ -612,7 +781,7 @@ def upload_file():
         error_details = traceback.format_exc()
         print(f"文件处理错误: {str(e)}\n{error_details}")
         flash(f'文件处理错误: {str(e)}')
-        return redirect(url_for('check_page'))
+        return redirect(url_for('.check_page'))
 
 # 执行规则检查
 def check_rules(data):
@@ -630,7 +799,7 @@ def check_rules(data):
             - 错误列表: 包含每个错误的详细信息（规则名称、错误信息、行号等）
             - 有问题的行索引集合: 包含所有存在问题的行的索引
     """
-    rules = get_rules()
+    rules = get_compiled_rules()
     results = []
     
     for rule in rules:
@@ -816,12 +985,10 @@ def check_rules(data):
                 
                 # 常规关联逻辑检查处理
                 try:
-                    # 解析值对列表
-                    value_pairs_list = []
-                    for pair in value_pairs.strip().split('\n'):
-                        if pair.strip():
-                            val1, val2 = pair.split('=')
-                            value_pairs_list.append((val1.strip(), val2.strip()))
+                    # 值对列表已在规则预处理时解析
+                    value_pairs_list = rule['value_pairs_list']
+                    if value_pairs_list is None:
+                        raise ValueError(rule['value_pairs_error'])
                     
                     # 执行匹配检查
                     if relation == 'match':
@@ -873,7 +1040,7 @@ def check_rules(data):
     return results
 
 # 导出检查结果为CSV的路由
-@app.route('/export_results', methods=['POST'])
+@bp.route('/export_results', methods=['POST'])
 def export_results():
     """
     导出检查结果的路由
@@ -886,16 +1053,17 @@ def export_results():
         
         if not results_data or not original_data:
             flash('没有可导出的数据')
-            return redirect(url_for('check_page'))
+            return redirect(url_for('.check_page'))
             
         # 解析JSON数据
         results = json.loads(results_data)
         original_df = pd.read_json(original_data, orient='records')
         
         # 创建结果文件名（带时间戳）
+        store = get_artifact_store()
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         result_filename = f"质控结果_{timestamp}.csv"
-        result_path = os.path.join('uploads', result_filename)
+        result_path = store.new_temp_path(result_filename)
         
         # 创建结果DataFrame
         result_df = pd.DataFrame(columns=['规则名称', '错误信息', '错误行号'])
@@ -912,12 +1080,14 @@ def export_results():
         
         # 保存结果到CSV
         result_df.to_csv(result_path, index=False, encoding='utf-8-sig')
+        artifact = store.put_file(result_path, result_filename, kind='csv', move=True)
         
         # 返回下载链接
         return jsonify({
             'success': True,
             'filename': result_filename,
-            'download_url': url_for('download_file', filename=result_filename)
+            'artifact_id': artifact['id'],
+            'download_url': url_for('.download_file', filename=artifact['id'])
         })
     except Exception as e:
         return jsonify({
@@ -925,15 +1095,35 @@ def export_results():
             'error': str(e)
         })
 
+# 从产物存储发送文件
+def send_artifact(artifact):
+    """
+    以附件形式发送产物存储中的文件，下载文件名使用产物记录的原始文件名
+    
+    Args:
+        artifact (dict): 产物信息
+    """
+    mimetype = mimetypes.guess_type(artifact['filename'])[0] or 'application/octet-stream'
+    return send_file(artifact['path'], as_attachment=True,
+                     download_name=artifact['filename'], mimetype=mimetype)
+
 # 文件下载路由
-@app.route('/download/<filename>')
+@bp.route('/download/<filename>')
 def download_file(filename):
     """
     文件下载路由
     
     Args:
-        filename (str): 要下载的文件名
+        filename (str): 要下载的产物ID；为兼容旧版链接，也可以是uploads或excel_data目录中的文件名
     """
+    # 优先按产物ID从产物存储中查找
+    if is_artifact_id(filename):
+        artifact = get_artifact_store().get(filename)
+        if artifact:
+            return send_artifact(artifact)
+        flash('文件不存在或已过期清理')
+        return redirect(url_for('.index'))
+    
     # 检查文件是否在uploads目录中
     if os.path.exists(os.path.join('uploads', filename)):
         return send_from_directory('uploads', filename, as_attachment=True)
@@ -942,17 +1132,16 @@ def download_file(filename):
         return send_from_directory('excel_data', filename, as_attachment=True)
     else:
         flash(f'文件不存在: {filename}')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
 
 # 添加规则
-@app.route('/rules/add', methods=['POST'])
+@bp.route('/rules/add', methods=['POST'])
 def add_rule():
     """
     添加新规则的路由
     处理表单提交的规则数据，根据规则类型处理不同的字段
     """
     try:
-        rules = get_rules()
         rule_id = datetime.now().strftime('%Y%m%d%H%M%S')
         
         rule_type = request.form.get('type')
@@ -986,16 +1175,17 @@ def add_rule():
                 'value_pairs': request.form.get('value_pairs')
             })
         
-        rules.append(new_rule)
-        save_rules(rules)
-        flash('规则添加成功！')
+        if get_data_store().add_rule(new_rule):
+            flash('规则添加成功！')
+        else:
+            flash('规则ID已存在，请稍后重试')
     except Exception as e:
         flash(f'添加规则失败: {str(e)}')
     
-    return redirect(url_for('rules_page'))
+    return redirect(url_for('.rules_page'))
 
 # 编辑规则
-@app.route('/rules/edit/<rule_id>', methods=['POST'])
+@bp.route('/rules/edit/<rule_id>', methods=['POST'])
 def edit_rule(rule_id):
     """
     编辑现有规则的路由
@@ -1004,49 +1194,46 @@ def edit_rule(rule_id):
         rule_id (str): 要编辑的规则ID
     """
     try:
-        rules = get_rules()
-        rule_found = False
+        store = get_data_store()
+        rule = store.get_rule(rule_id)
         
-        for rule in rules:
-            if rule['id'] == rule_id:
-                rule_found = True
-                rule_type = request.form.get('type')
-                
-                # 更新基本信息
-                rule['name'] = request.form.get('name')
-                rule['type'] = rule_type
-                rule['message'] = request.form.get('message')
-                
-                # 根据规则类型更新不同的字段
-                if rule_type == 'missing':  # 缺项检查
-                    rule['field'] = request.form.get('field')
-                    rule['condition'] = request.form.get('condition')
-                    rule['value'] = request.form.get('value')
-                elif rule_type == 'logic':  # 逻辑检查
-                    rule['field'] = request.form.get('field')
-                    rule['condition'] = request.form.get('condition')
-                    rule['value'] = request.form.get('value')
-                elif rule_type == 'relation':  # 关联逻辑检查
-                    rule['field1'] = request.form.get('field1')
-                    rule['field2'] = request.form.get('field2')
-                    rule['relation'] = request.form.get('relation')
-                    rule['value_pairs'] = request.form.get('value_pairs')
-                
-                break
+        if rule is None:
+            flash('规则不存在！')
+            return redirect(url_for('.rules_page'))
+        
+        rule_type = request.form.get('type')
+        
+        # 更新基本信息
+        rule['name'] = request.form.get('name')
+        rule['type'] = rule_type
+        rule['message'] = request.form.get('message')
         
-        if not rule_found:
+        # 根据规则类型更新不同的字段
+        if rule_type == 'missing':  # 缺项检查
+            rule['field'] = request.form.get('field')
+            rule['condition'] = request.form.get('condition')
+            rule['value'] = request.form.get('value')
+        elif rule_type == 'logic':  # 逻辑检查
+            rule['field'] = request.form.get('field')
+            rule['condition'] = request.form.get('condition')
+            rule['value'] = request.form.get('value')
+        elif rule_type == 'relation':  # 关联逻辑检查
+            rule['field1'] = request.form.get('field1')
+            rule['field2'] = request.form.get('field2')
+            rule['relation'] = request.form.get('relation')
+            rule['value_pairs'] = request.form.get('value_pairs')
+        
+        if not store.update_rule(rule_id, rule):
             flash('规则不存在！')
-            return redirect(url_for('rules_page'))
-            
-        save_rules(rules)
+            return redirect(url_for('.rules_page'))
         flash('规则更新成功！')
     except Exception as e:
         flash(f'更新规则失败: {str(e)}')
     
-    return redirect(url_for('rules_page'))
+    return redirect(url_for('.rules_page'))
 
 # 删除规则
-@app.route('/rules/delete/<rule_id>')
+@bp.route('/rules/delete/<rule_id>')
 def delete_rule(rule_id):
     """
     删除规则的路由
@@ -1055,17 +1242,17 @@ def delete_rule(rule_id):
         rule_id (str): 要删除的规则ID
     """
     try:
-        rules = get_rules()
-        rules = [rule for rule in rules if rule['id'] != rule_id]
-        save_rules(rules)
-        flash('规则删除成功！')
+        if get_data_store().delete_rule(rule_id):
+            flash('规则删除成功！')
+        else:
+            flash('规则不存在！')
     except Exception as e:
         flash(f'删除规则失败: {str(e)}')
     
-    return redirect(url_for('rules_page'))
+    return redirect(url_for('.rules_page'))
 
 # 大模型命名实体识别页面
-@app.route('/llm_entity_recognition')
+@bp.route('/llm_entity_recognition')
 def llm_entity_recognition_page():
     """大模型命名实体识别页面路由，显示大模型实体识别界面"""
     llm_config = get_llm_config()
@@ -1085,7 +1272,12 @@ def llm_entity_recognition_page():
         })
     
     # 检查是否处于API模式
-    if llm_config.get("api_mode", False) and api_available:
+    if get_ner_mode(llm_config) == NER_MODE_HYBRID and api_available:
+        messages.append({
+            'type': 'info',
+            'content': f'系统当前处于混合模式，先使用规则匹配，只把覆盖不足的句子发给{llm_config.get("api_type", "未指定")} API。'
+        })
+    elif llm_config.get("api_mode", False) and api_available:
         messages.append({
             'type': 'info',
             'content': f'系统当前处于API模式，将使用{llm_config.get("api_type", "未指定")} API进行实体识别。'
@@ -1102,12 +1294,12 @@ def llm_entity_recognition_page():
                            messages=messages)
 
 # 处理大模型命名实体识别请求
-@app.route('/recognize_llm_entities', methods=['POST'])
+@bp.route('/recognize_llm_entities', methods=['POST'])
 def recognize_llm_entities():
     """
     处理基于大模型的医学实体识别请求的路由
     
-    接收用户提交的医学文本，使用API模式或规则匹配方法识别其中的医学实体，
+    接收用户提交的医学文本，使用API模式、混合模式或规则匹配方法识别其中的医学实体，
     并返回高亮显示识别结果的页面，同时生成实体类型分布的饼状图。
     支持文本输入和文件上传两种方式。
     
@@ -1130,21 +1322,26 @@ def recognize_llm_entities():
                         text = file.read().decode('gbk')
                     except:
                         flash('无法解析文件编码，请使用UTF-8或GBK编码的文本文件')
-                        return redirect(url_for('llm_entity_recognition_page'))
+                        return redirect(url_for('.llm_entity_recognition_page'))
             else:
                 flash('仅支持.txt文本文件')
-                return redirect(url_for('llm_entity_recognition_page'))
+                return redirect(url_for('.llm_entity_recognition_page'))
         
         if not text:
             flash('请输入文本或上传文本文件')
-            return redirect(url_for('llm_entity_recognition_page'))
+            return redirect(url_for('.llm_entity_recognition_page'))
         
         # 获取配置
         config = get_llm_config()
-        api_mode = config.get("api_mode", False)
+        ner_mode = get_ner_mode(config)
+        hybrid_stats = None
         
         # 根据选择的模型类型进行实体识别
-        if api_mode:
+        if ner_mode == NER_MODE_HYBRID:
+            # 混合模式：规则匹配为主，覆盖不足的句子使用API识别
+            recognized_entities, hybrid_stats = recognize_entities_hybrid(text, return_stats=True)
+            model_type = f"混合模式（规则匹配+{config.get('api_type', 'API')}）"
+        elif ner_mode == NER_MODE_API:
             # API模式下使用API识别
             recognized_entities = recognize_entities_with_api(text)
             model_type = f"{config.get('api_type', 'API')}模式"
@@ -1155,67 +1352,94 @@ def recognize_llm_entities():
         
         if not recognized_entities:
             flash('未能识别到任何实体，请检查模型配置或尝试其他文本')
-            return redirect(url_for('llm_entity_recognition_page'))
+            return redirect(url_for('.llm_entity_recognition_page'))
         
         # 统计实体频率
         entity_statistics = calculate_entity_statistics(recognized_entities)
         
-        # 准备高亮显示的文本
-        highlighted_text = text
-        
-        # 按位置排序所有实体（从后往前替换，避免位置偏移）
-        all_entities = []
-        for entity_type, entities in recognized_entities.items():
-            for entity_info in entities:
-                all_entities.append({
-                    'entity': entity_info['entity'],
-                    'position': entity_info['position'],
-                    'type': entity_type
-                })
-        
-        # 按位置从大到小排序
-        all_entities.sort(key=lambda x: x['position'], reverse=True)
-        
-        # 替换文本中的实体为高亮标签
-        for entity_info in all_entities:
-            entity = entity_info['entity']
-            pos = entity_info['position']
-            entity_type = entity_info['type']
-            
-            # 确保位置有效
-            if pos >= 0 and pos + len(entity) <= len(highlighted_text):
-                highlighted_text = (
-                    highlighted_text[:pos] + 
-                    f'<span class="entity-highlight {entity_type.lower()}" title="{entity_type}">{entity}</span>' + 
-                    highlighted_text[pos+len(entity):]
-                )
+        # 准备高亮显示的文本（忽略位置与原文不符的实体，重叠实体只高亮最长的一个）
+        highlighted_text = highlight_entities(text, recognized_entities)
         
         return render_template('llm_entity_recognition_result.html', 
                                original_text=text,
                                highlighted_text=highlighted_text,
                                recognized_entities=recognized_entities,
                                entity_statistics=entity_statistics,
-                               model_type=model_type)
+                               model_type=model_type,
+                               hybrid_stats=hybrid_stats)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"大模型实体识别错误: {str(e)}\n{error_details}")
         flash(f'大模型实体识别错误: {str(e)}')
-        return redirect(url_for('llm_entity_recognition_page'))
+        return redirect(url_for('.llm_entity_recognition_page'))
+
+# 流式返回大模型命名实体识别结果
+@bp.route('/recognize_llm_entities/stream', methods=['POST'])
+def recognize_llm_entities_stream():
+    """
+    以Server-Sent Events流式返回实体识别结果，页面随着实体返回逐步高亮
+    
+    API模式下每当模型生成完一个实体就推送一条entity事件；混合模式和规则匹配识别完成后
+    一次推送全部实体。最后推送done事件，包含完整的识别结果、服务端生成的高亮HTML和实体统计；
+    API请求失败时先推送error事件，done事件中为规则匹配的结果。
+    
+    Returns:
+        Response: text/event-stream响应
+    """
+    text = request.form.get('text', '')
+    if not text:
+        return jsonify({'success': False, 'error': '请输入文本'}), 400
+    
+    config = get_llm_config()
+    ner_mode = get_ner_mode(config)
+    
+    def generate():
+        start = time.time()
+        try:
+            if ner_mode == NER_MODE_API:
+                events = stream_entities_with_api(text)
+                model_type = f"{config.get('api_type', 'API')}模式"
+            else:
+                if ner_mode == NER_MODE_HYBRID:
+                    recognized_entities = recognize_entities_hybrid(text)
+                    model_type = f"混合模式（规则匹配+{config.get('api_type', 'API')}）"
+                else:
+                    recognized_entities = recognize_entities_with_rules(text)
+                    model_type = "规则匹配"
+                events = [*iter_entity_events(recognized_entities), ('done', {'entities': recognized_entities})]
+            
+            for event, data in events:
+                if event == 'done':
+                    recognized_entities = data['entities']
+                    data = dict(data,
+                                model_type=model_type,
+                                highlighted_html=highlight_entities(text, recognized_entities),
+                                entity_statistics=calculate_entity_statistics(recognized_entities),
+                                elapsed_seconds=round(time.time() - start, 3))
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"流式实体识别错误: {str(e)}")
+            yield format_sse('error', {'message': f'实体识别错误: {str(e)}'})
+    
+    # 禁止代理缓冲，使每条事件立即发送到浏览器
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # 保存大模型配置
-@app.route('/save_llm_config_route', methods=['POST'])
+@bp.route('/save_llm_config_route', methods=['POST'])
 def save_llm_config_route():
     """
     保存大模型配置的路由
     接收表单数据并更新配置文件
     """
     try:
-        # 获取当前配置
-        config = get_llm_config()
+        # 获取当前配置（复制一份，避免修改缓存中的共享对象）
+        config = copy.deepcopy(get_llm_config())
         
         # 更新配置，只保留API相关配置
         config["api_mode"] = 'api_mode' in request.form
+        config["ner_mode"] = NER_MODE_HYBRID if 'hybrid_mode' in request.form else ""
         config["api_type"] = request.form.get('api_type', 'deepseek')
         config["api_key"] = request.form.get('api_key', '')
         config["api_url"] = request.form.get('api_url', '')
@@ -1227,24 +1451,55 @@ def save_llm_config_route():
     except Exception as e:
         flash(f'保存配置出错: {str(e)}')
     
-    return redirect(url_for('llm_entity_recognition_page'))
+    return redirect(url_for('.llm_entity_recognition_page'))
+
+# 重新加载Transformer模型
+@bp.route('/reload_ner_model', methods=['POST'])
+def reload_ner_model():
+    """
+    重新加载当前配置的Transformer模型（如本地模型文件已更新），只影响处理该请求的进程；
+    使用实体识别服务进程时由服务进程重新加载
+    
+    Returns:
+        JSON: 加载结果和本进程（或服务进程）中已加载的模型
+    """
+    try:
+        start = time.time()
+        config = get_llm_config()
+        if uses_ner_server(config):
+            from ner_server import NERClient
+            client = NERClient(config["ner_server_socket"])
+            result = client.reload()
+            result.update({'seconds': round(time.time() - start, 3), 'models': client.stats()['models']})
+            return jsonify(result), (200 if result['success'] else 503)
+        ner_pipeline = load_transformer_model(reload=True)
+        loaded = ner_pipeline is not None and not isinstance(ner_pipeline, str)
+        return jsonify({
+            'success': loaded,
+            'mode': 'model' if loaded else (ner_pipeline or 'unavailable'),
+            'seconds': round(time.time() - start, 3),
+            'models': get_model_registry().info()
+        }), (200 if loaded else 503)
+    except Exception as e:
+        logger.error(f"重新加载模型出错: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 # Excel数据检查页面
-@app.route('/excel_check')
+@bp.route('/excel_check')
 def excel_check_page():
     """Excel数据检查页面路由，显示Excel数据检查界面"""
     rules = get_rules()
     return render_template('excel_check.html', rules=rules)
 
 # Word文档数据检查页面
-@app.route('/docx_check')
+@bp.route('/docx_check')
 def docx_check_page():
     """Word文档数据检查页面路由，显示Word文档数据检查界面"""
     rules = get_rules()
     return render_template('docx_check.html', rules=rules)
 
 # 上传并检查Word文档
-@app.route('/upload_docx', methods=['POST'])
+@bp.route('/upload_docx', methods=['POST'])
 def upload_docx():
     """
     处理Word文档上传和规则检查的路由
@@ -1252,22 +1507,23 @@ def upload_docx():
     """
     if 'file' not in request.files:
         flash('没有选择文件')
-        return redirect(url_for('docx_check_page'))
+        return redirect(url_for('.docx_check_page'))
     
     file = request.files['file']
     if file.filename == '':
         flash('没有选择文件')
-        return redirect(url_for('docx_check_page'))
+        return redirect(url_for('.docx_check_page'))
     
     try:
-        # 保存上传的文件
-        file_path = os.path.join('uploads', secure_filename(file.filename))
-        file.save(file_path)
-        
         # 检查文件类型
         if not file.filename.endswith('.docx'):
             flash('请上传Word文档(.docx格式)')
-            return redirect(url_for('docx_check_page'))
+            return redirect(url_for('.docx_check_page'))
+        
+        # 保存上传的文件到产物存储（相同内容只保存一份）
+        store = get_artifact_store()
+        artifact = store.put_stream(file.stream, file.filename, kind='upload')
+        file_path = artifact['path']
             
         # 提取数据
         extractor = DocxDataExtractor()
@@ -1276,7 +1532,7 @@ def upload_docx():
         # 确保DataFrame非空
         if df.empty:
             flash('无法从文档中提取有效数据')
-            return redirect(url_for('docx_check_page'))
+            return redirect(url_for('.docx_check_page'))
             
         # 执行规则检查
         results = check_rules(df)
@@ -1299,12 +1555,7 @@ def upload_docx():
                     print(f"规则名称: {rule_name}, 错误消息: {message}")
                     
                     # 从规则中提取类型和字段信息
-                    rules = get_rules()
-                    rule_info = None
-                    for r in rules:
-                        if r['name'] == rule_name:
-                            rule_info = r
-                            break
+                    rule_info = get_rule_by_name(rule_name)
                     
                     if rule_info:
                         rule_type = rule_info['type']
@@ -1350,13 +1601,18 @@ def upload_docx():
         print(f"字段规则类型映射: {field_rule_types}")
         print(f"关联字段映射: {field_related_fields}")
         
-        # 生成标记错误的Word文档
-        result_docx_path = None
+        # 生成标记错误的Word文档并写入产物存储
+        result_docx_id = None
         if results:
+            name = os.path.splitext(file.filename)[0]
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            result_filename = f"{name}_检查结果_{timestamp}.docx"
+            output_path = store.new_temp_path(result_filename)
             result_generator = DocxResultGenerator()
-            result_docx_path = result_generator.highlight_errors(file_path, results)
-            if result_docx_path:
-                result_docx_path = os.path.basename(result_docx_path)
+            if result_generator.highlight_errors(file_path, results, output_path=output_path):
+                result_docx_id = store.put_file(output_path, result_filename, kind='docx_result', move=True)['id']
+            elif os.path.exists(output_path):
+                os.remove(output_path)
         
         # 处理特殊值
         try:
@@ -1394,13 +1650,13 @@ def upload_docx():
                               results=results, 
                               data=data_html, 
                               docx_html=docx_html,
-                              result_docx_path=result_docx_path)
+                              result_docx_id=result_docx_id)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Word文档处理错误: {str(e)}\n{error_details}")
         flash(f'Word文档处理错误: {str(e)}')
-        return redirect(url_for('docx_check_page'))
+        return redirect(url_for('.docx_check_page'))
 
 # 提取Word文档内容为HTML预览
 def extract_docx_html(docx_path, error_fields, field_rule_types, field_related_fields):
@@ -1657,6 +1913,119 @@ def extract_docx_html(docx_path, error_fields, field_rule_types, field_related_f
         print(f"提取Word文档HTML预览时出错: {str(e)}\n{error_details}")
         return f'<div class="alert alert-danger">无法提取文档内容: {str(e)}</div>'
 
+# 存活检查
+@bp.route('/healthz')
+def healthz():
+    """存活检查：进程能处理请求即返回200"""
+    return jsonify({'status': 'ok'})
+
+# 就绪检查
+@bp.route('/readyz')
+def readyz():
+    """
+    就绪检查：预热完成且规则库可访问时返回200，否则返回503
+    
+    负载均衡器应在工作进程就绪后再转发流量，避免部署后首批请求承担预热开销。
+    """
+    state = {
+        'ready': _warmup_state['ready'],
+        'steps': _warmup_state['steps']
+    }
+    if _warmup_state['finished_at'] is not None:
+        state['warmup_seconds'] = round(_warmup_state['finished_at'] - _warmup_state['started_at'], 3)
+    try:
+        get_data_store().get_version(RULES_NAMESPACE)
+    except Exception as e:
+        state['ready'] = False
+        state['error'] = f"规则库不可用: {str(e)}"
+    return jsonify(state), (200 if state['ready'] else 503)
+
+# 预热
+def warmup(load_model=False):
+    """
+    预热应用：加载规则库、预处理规则、加载映射和医学实体字典、构建实体匹配自动机和规则匹配器、打开产物存储，
+    导入python-docx，并可选地加载Transformer模型
+    
+    使用gunicorn的preload_app时在主进程中执行一次，fork出的工作进程通过写时复制共享
+    这些数据，不必在各自的首批请求中重复构建。预热结束后调用gc.freeze()，
+    避免垃圾回收触碰这些对象导致共享内存页被复制。
+    
+    Args:
+        load_model (bool): 是否预加载Transformer模型（需要安装torch和transformers）
+        
+    Returns:
+        dict: 预热状态，包含每个步骤的耗时和错误信息
+    """
+    with _warmup_lock:
+        _warmup_state['ready'] = False
+        _warmup_state['started_at'] = time.time()
+        _warmup_state['finished_at'] = None
+        _warmup_state['steps'] = {}
+        
+        steps = [
+            ('rules', lambda: len(get_compiled_rules())),
+            ('diagnosis_dept_mapping', lambda: len(get_diagnosis_dept_mapping())),
+            ('medical_entities', lambda: sum(len(terms) for terms in get_medical_entities().values())),
+            ('entity_matcher', lambda: len(get_entity_matcher())),
+            ('rule_matcher', lambda: get_rule_matcher().table_rule_count),
+            ('configs', lambda: len(get_llm_config()) + len(get_db_config())),
+            ('artifact_store', lambda: get_artifact_store().total_size()),
+            ('docx', lambda: importlib.import_module('docx').__name__),
+        ]
+        if load_model and not uses_ner_server():
+            # 只加载模型，不在主进程中推理，避免fork前创建推理线程池
+            steps.append(('ner_model', lambda: str(type(load_transformer_model()).__name__)))
+        
+        ok = True
+        for name, step in steps:
+            start = time.time()
+            try:
+                result = step()
+                _warmup_state['steps'][name] = {'seconds': round(time.time() - start, 3), 'result': result}
+            except Exception as e:
+                logger.error(f"预热步骤{name}出错: {str(e)}")
+                _warmup_state['steps'][name] = {'seconds': round(time.time() - start, 3), 'error': str(e)}
+                # python-docx和模型加载失败只影响对应功能，不影响就绪状态
+                if name not in ('docx', 'ner_model'):
+                    ok = False
+        
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        
+        _warmup_state['finished_at'] = time.time()
+        _warmup_state['ready'] = ok
+        logger.info(f"预热完成，耗时{_warmup_state['finished_at'] - _warmup_state['started_at']:.2f}秒")
+        return _warmup_state
+
+# 应用工厂
+def create_app(run_warmup=True, load_model=False):
+    """
+    创建Flask应用实例
+    
+    初始化存储目录和配置文件（导入本模块时不写文件、不创建应用），注册蓝图上的所有路由。
+    flask run会自动调用create_app()，预热完成后/readyz即返回200。
+    
+    Args:
+        run_warmup (bool): 是否在创建后立即预热（WSGI入口在主进程fork前预热；测试可传False）
+        load_model (bool): 预热时是否预加载Transformer模型
+        
+    Returns:
+        Flask: 应用实例
+    """
+    flask_app = Flask(__name__)
+    flask_app.secret_key = 'your_secret_key'  # 用于会话安全的密钥，生产环境应使用强随机密钥
+    
+    # 大模型配置文件先按完整的默认配置创建，init_storage不再覆盖
+    init_config()
+    init_storage()
+    init_medical_entities()
+    flask_app.register_blueprint(bp)
+    
+    if run_warmup:
+        warmup(load_model=load_model)
+    return flask_app
+
 # 应用入口
 if __name__ == '__main__':
-    app.run(debug=True)  # 生产环境应设置debug=False 
\ No newline at end of file
+    create_app().run(debug=True)  # 生产环境应设置debug=False
@@ -0,0 +1,313 @@
+"""
+内容寻址的文件产物存储模块
+
+上传的Excel/Word文件、生成的Excel文件、Word检查结果和CSV导出结果统一保存在
+artifacts目录中：文件按内容的SHA-256摘要命名并去重，索引（文件名、类型、大小、
+创建时间、最近访问时间）保存在SQLite数据库中。存储按TTL（最近访问时间）和
+总容量配额淘汰旧文件，下载时通过产物ID（即内容摘要）定位文件。
+"""
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from sqlite_utils import SQLiteDatabase
+
+# 产物存储目录及索引文件
+ARTIFACT_DIR = 'artifacts'
+ARTIFACT_INDEX_FILE = 'index.db'
+
+# 默认淘汰策略
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600            # 超过7天未访问的产物将被淘汰
+DEFAULT_MAX_TOTAL_BYTES = 2 * 1024 * 1024 * 1024  # 产物总容量上限2GB
+EVICT_INTERVAL_SECONDS = 300                    # 两次自动淘汰之间的最小间隔
+
+# 产物ID格式（SHA-256十六进制摘要）
+ARTIFACT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 读写文件时的分块大小
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id TEXT PRIMARY KEY,
+    relpath TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts(last_access);
+"""
+
+
+def is_artifact_id(value):
+    """判断字符串是否为合法的产物ID"""
+    return bool(value) and ARTIFACT_ID_PATTERN.match(value) is not None
+
+
+class ArtifactStore:
+    """
+    内容寻址的产物存储
+
+    同一内容只保存一份文件，重复写入只会更新文件名和访问时间。
+    索引中的写操作和对应的文件操作在同一个SQLite写事务中完成，
+    多个Web进程同时写入和淘汰时不会产生悬空索引。
+    """
+
+    def __init__(self, root=ARTIFACT_DIR, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_total_bytes=DEFAULT_MAX_TOTAL_BYTES):
+        """
+        初始化产物存储
+
+        Args:
+            root (str): 存储根目录
+            ttl_seconds (int): 产物未被访问的最长保留时间（秒），None表示不按TTL淘汰
+            max_total_bytes (int): 产物总容量上限（字节），None表示不限制
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.index_path = os.path.join(root, ARTIFACT_INDEX_FILE)
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self._last_evict = 0.0
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._db = SQLiteDatabase(self.index_path)
+        self._db.connect().executescript(SCHEMA)
+
+    def new_temp_path(self, filename=''):
+        """
+        在存储的临时目录中分配一个临时文件路径，用于生成结果文件后再写入存储
+
+        Args:
+            filename (str): 原始文件名，用于保留扩展名
+
+        Returns:
+            str: 临时文件路径
+        """
+        ext = os.path.splitext(filename)[1]
+        fd, path = tempfile.mkstemp(suffix=ext, dir=self.tmp_dir)
+        os.close(fd)
+        return path
+
+    def put_stream(self, stream, filename, kind='upload'):
+        """
+        将文件流写入存储
+
+        Args:
+            stream: 可读的二进制文件对象（如上传文件的stream）
+            filename (str): 原始文件名（下载时使用）
+            kind (str): 产物类型，如upload、excel、docx_result、csv
+
+        Returns:
+            dict: 产物信息
+        """
+        tmp_path = self.new_temp_path(filename)
+        try:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            return self.put_file(tmp_path, filename, kind, move=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_bytes(self, data, filename, kind='file'):
+        """将字节内容写入存储，返回产物信息"""
+        tmp_path = self.new_temp_path(filename)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            return self.put_file(tmp_path, filename, kind, move=True)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, src_path, filename=None, kind='file', move=False):
+        """
+        将已有文件写入存储
+
+        Args:
+            src_path (str): 源文件路径
+            filename (str): 下载时使用的文件名，默认为源文件名
+            kind (str): 产物类型
+            move (bool): 是否移动源文件（否则复制）
+
+        Returns:
+            dict: 产物信息
+        """
+        if filename is None:
+            filename = os.path.basename(src_path)
+        artifact_id = _file_digest(src_path)
+        size = os.path.getsize(src_path)
+        now = time.time()
+
+        with self._db.write_transaction() as conn:
+            row = conn.execute('SELECT relpath FROM artifacts WHERE id = ?', (artifact_id,)).fetchone()
+            if row is not None and os.path.exists(os.path.join(self.objects_dir, row['relpath'])):
+                # 内容已存在：只更新文件名、类型和访问时间
+                conn.execute(
+                    'UPDATE artifacts SET filename = ?, kind = ?, last_access = ? WHERE id = ?',
+                    (filename, kind, now, artifact_id)
+                )
+                if move:
+                    os.remove(src_path)
+            else:
+                relpath = os.path.join(artifact_id[:2], artifact_id + os.path.splitext(filename)[1].lower())
+                dst_path = os.path.join(self.objects_dir, relpath)
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                if move:
+                    os.replace(src_path, dst_path)
+                else:
+                    shutil.copyfile(src_path, dst_path)
+                conn.execute(
+                    'INSERT OR REPLACE INTO artifacts (id, relpath, filename, kind, size, created_at, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (artifact_id, relpath, filename, kind, size, now, now)
+                )
+
+        self.maybe_evict()
+        return self.get(artifact_id, touch=False)
+
+    def get(self, artifact_id, touch=True):
+        """
+        获取产物信息
+
+        Args:
+            artifact_id (str): 产物ID
+            touch (bool): 是否更新最近访问时间
+
+        Returns:
+            dict: 产物信息（包含本地文件路径path），不存在时返回None
+        """
+        if not is_artifact_id(artifact_id):
+            return None
+        conn = self._db.connect()
+        row = conn.execute('SELECT * FROM artifacts WHERE id = ?', (artifact_id,)).fetchone()
+        if row is None:
+            return None
+        info = dict(row)
+        info['path'] = os.path.join(self.objects_dir, info['relpath'])
+        if not os.path.exists(info['path']):
+            return None
+        if touch:
+            info['last_access'] = time.time()
+            conn.execute('UPDATE artifacts SET last_access = ? WHERE id = ?', (info['last_access'], artifact_id))
+        return info
+
+    def delete(self, artifact_id):
+        """删除指定产物，返回是否删除成功"""
+        with self._db.write_transaction() as conn:
+            row = conn.execute('SELECT relpath FROM artifacts WHERE id = ?', (artifact_id,)).fetchone()
+            if row is None:
+                return False
+            return self._remove(conn, artifact_id, row['relpath'])
+
+    def _remove(self, conn, artifact_id, relpath):
+        """在写事务中删除产物文件和索引"""
+        try:
+            os.remove(os.path.join(self.objects_dir, relpath))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows下正在下载的文件无法删除，留待下次淘汰
+            print(f"删除产物文件出错: {str(e)}")
+            return False
+        conn.execute('DELETE FROM artifacts WHERE id = ?', (artifact_id,))
+        return True
+
+    def total_size(self):
+        """返回存储中所有产物的总字节数"""
+        row = self._db.connect().execute('SELECT COALESCE(SUM(size), 0) AS total FROM artifacts').fetchone()
+        return row['total']
+
+    def evict(self, now=None):
+        """
+        按TTL和总容量配额淘汰产物
+
+        先删除超过TTL未被访问的产物，再按最近访问时间从旧到新删除，
+        直到总容量不超过配额。
+
+        Args:
+            now (float): 当前时间戳，默认为time.time()
+
+        Returns:
+            int: 被淘汰的产物数量
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        with self._db.write_transaction() as conn:
+            if self.ttl_seconds is not None:
+                expired = conn.execute(
+                    'SELECT id, relpath FROM artifacts WHERE last_access < ?',
+                    (now - self.ttl_seconds,)
+                ).fetchall()
+                for row in expired:
+                    removed += self._remove(conn, row['id'], row['relpath'])
+
+            if self.max_total_bytes is not None:
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+                if total > self.max_total_bytes:
+                    for row in conn.execute('SELECT id, relpath, size FROM artifacts ORDER BY last_access').fetchall():
+                        if total <= self.max_total_bytes:
+                            break
+                        if self._remove(conn, row['id'], row['relpath']):
+                            total -= row['size']
+                            removed += 1
+
+        self._clean_tmp(now)
+        self._last_evict = now
+        return removed
+
+    def maybe_evict(self):
+        """距离上次淘汰超过EVICT_INTERVAL_SECONDS时执行一次淘汰"""
+        if time.time() - self._last_evict >= EVICT_INTERVAL_SECONDS:
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"淘汰产物出错: {str(e)}")
+
+    def _clean_tmp(self, now):
+        """清理进程异常退出后遗留的临时文件"""
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if now - os.path.getmtime(path) > 3600:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _file_digest(path):
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """获取进程内共享的产物存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
+
+
+if __name__ == '__main__':
+    # 供定时任务调用：python artifact_store.py
+    store = get_artifact_store()
+    removed = store.evict()
+    print(f"已淘汰 {removed} 个产物，当前占用 {store.total_size() / 1024 / 1024:.1f} MB")
@@ -0,0 +1,302 @@
+"""
+批量医学实体识别模块
+
+对大量病历文本（如export_admissions导出的住院记录中的现病史、出院小结）批量执行
+实体识别，输出实体区间表（每个实体一行）而不是HTML页面。文档按块分发到多个进程
+并行处理：主进程先构建好实体匹配自动机和规则匹配器，再以fork方式创建工作进程，
+工作进程直接共享已构建的匹配器。
+
+命令行用法（在MediQC Pro_4.0目录下运行）：
+    python batch_ner.py 住院记录.xlsx --column 现病史 --column 出院小结 --id-column 住院号 \\
+        --method rules --output spans.parquet --workers 4
+    python batch_ner.py notes.jsonl --column text --method transformer --workers 1 --output spans.jsonl
+    python batch_ner.py notes.jsonl --column text --output spans.jsonl
+    python batch_ner.py 住院记录.xlsx --column 主诉 --method api --workers 1 --output spans.csv
+
+输入支持JSONL（每行一个JSON对象）、JSON数组、CSV和Excel；输出格式由输出文件扩展名决定，
+支持.jsonl、.csv和.parquet（需要安装pyarrow）。
+"""
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 识别方法
+METHOD_DICT = 'dict'     # 规则库医学实体字典匹配（与/recognize_entities相同）
+METHOD_RULES = 'rules'   # 内置词典+正则规则匹配（与大模型页面的规则匹配相同）
+METHOD_TRANSFORMER = 'transformer'  # Transformer模型（一个任务块中的文本段按长度分组批量推理）
+METHOD_API = 'api'       # 大模型API（一个任务块中的短文本合并为少量请求）
+METHOD_HYBRID = 'hybrid'  # 混合模式（规则匹配为主，覆盖不足的句子合并请求API）
+METHODS = (METHOD_DICT, METHOD_RULES, METHOD_TRANSFORMER, METHOD_API, METHOD_HYBRID)
+
+# 每个任务块包含的文档数
+DEFAULT_CHUNK_SIZE = 200
+
+# 输出列
+SPAN_COLUMNS = ['doc_id', 'field', 'entity_type', 'entity', 'start', 'end']
+
+# 支持的输入和输出格式
+INPUT_EXTENSIONS = ('.jsonl', '.json', '.csv', '.xlsx', '.xls')
+OUTPUT_EXTENSIONS = ('.jsonl', '.csv', '.parquet')
+
+
+def read_documents(path, columns, id_column=None):
+    """
+    从JSONL、JSON数组、CSV或Excel文件中读取待识别的文本
+
+    .json文件以“[”开头时按JSON数组（[{...}, {...}]）读取，否则按JSONL读取。
+
+    Args:
+        path (str): 输入文件路径
+        columns (list): 文本所在的字段（列）名，每个字段作为一个文档
+        id_column (str): 文档ID所在的字段名，默认为行号（从1开始）
+
+    Yields:
+        tuple: (文档ID, 字段名, 文本)，空文本会被跳过
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.json'):
+        for record_number, record in _read_json_records(path, ext):
+            if not isinstance(record, dict):
+                raise ValueError(f"第{record_number}条记录不是JSON对象")
+            doc_id = record.get(id_column, record_number) if id_column else record_number
+            for column in columns:
+                text = record.get(column)
+                if isinstance(text, str) and text:
+                    yield doc_id, column, text
+        return
+
+    import pandas as pd
+    if ext == '.csv':
+        df = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+    elif ext in ('.xlsx', '.xls'):
+        df = pd.read_excel(path, dtype=str)
+    else:
+        raise ValueError(f"不支持的输入文件格式: {ext}，仅支持{', '.join(INPUT_EXTENSIONS)}")
+
+    missing = [column for column in columns + ([id_column] if id_column else []) if column not in df.columns]
+    if missing:
+        raise ValueError(f"输入文件中不存在以下列: {', '.join(missing)}")
+
+    for row_number, row in enumerate(df.itertuples(index=False), 1):
+        record = dict(zip(df.columns, row))
+        doc_id = record[id_column] if id_column else row_number
+        for column in columns:
+            text = record.get(column)
+            if isinstance(text, str) and text:
+                yield doc_id, column, text
+
+
+def _read_json_records(path, ext):
+    """逐条读取JSONL或JSON数组文件中的记录，产生(序号（从1开始）, 记录)"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if ext == '.json':
+            head = f.read(4096).lstrip()
+            f.seek(0)
+            if head.startswith('['):
+                records = json.load(f)
+                yield from enumerate(records, 1)
+                return
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                yield line_number, json.loads(line)
+
+
+def prepare(method):
+    """构建识别方法所需的匹配器（已构建时直接返回）"""
+    from entity_matcher import get_entity_matcher
+    if method == METHOD_DICT:
+        get_entity_matcher()
+    elif method == METHOD_RULES:
+        from llm_ner import get_rule_matcher
+        get_entity_matcher()
+        get_rule_matcher()
+    elif method == METHOD_TRANSFORMER:
+        from llm_ner import load_transformer_model, uses_ner_server
+        # 使用实体识别服务进程时模型由服务进程加载
+        if not uses_ner_server():
+            load_transformer_model()
+    elif method in (METHOD_API, METHOD_HYBRID):
+        # 混合模式先使用规则匹配，API识别失败时也使用规则匹配替代
+        from llm_ner import get_rule_matcher
+        get_entity_matcher()
+        get_rule_matcher()
+    else:
+        raise ValueError(f"不支持的识别方法: {method}，仅支持{', '.join(METHODS)}")
+
+
+def _entities_to_spans(recognized):
+    """将按类型分组的识别结果转换为[(实体类型, 实体, 起始位置, 结束位置), ...]"""
+    return [(entity_type, entity['entity'], entity['position'], entity['position'] + len(entity['entity']))
+            for entity_type, entities in recognized.items()
+            for entity in entities]
+
+
+def recognize_spans(text, method=METHOD_DICT):
+    """
+    识别单个文本中的实体
+
+    Args:
+        text (str): 待识别的文本
+        method (str): 识别方法，dict、rules、transformer、api或hybrid
+
+    Returns:
+        list: [(实体类型, 实体, 起始位置, 结束位置), ...]
+    """
+    if method == METHOD_DICT:
+        from entity_matcher import get_entity_matcher
+        return [(entity_type, term, start, start + len(term))
+                for start, term, _, entity_type in get_entity_matcher().find(text)]
+    if method == METHOD_RULES:
+        from llm_ner import recognize_entities_with_rules
+        return _entities_to_spans(recognize_entities_with_rules(text))
+    if method == METHOD_TRANSFORMER:
+        from llm_ner import recognize_entities_with_transformer
+        return _entities_to_spans(recognize_entities_with_transformer(text))
+    if method == METHOD_API:
+        from llm_ner import recognize_entities_with_api
+        return _entities_to_spans(recognize_entities_with_api(text))
+    if method == METHOD_HYBRID:
+        from llm_ner import recognize_entities_hybrid
+        return _entities_to_spans(recognize_entities_hybrid(text))
+    raise ValueError(f"不支持的识别方法: {method}，仅支持{', '.join(METHODS)}")
+
+
+def _process_chunk(method, documents):
+    """识别一块文档，返回实体区间行"""
+    if method == METHOD_TRANSFORMER:
+        # 整个任务块的文本一起分批推理
+        from llm_ner import recognize_entities_with_transformer_batch
+        spans = [_entities_to_spans(recognized) for recognized in
+                 recognize_entities_with_transformer_batch([text for _, _, text in documents])]
+    elif method == METHOD_API:
+        # 整个任务块的短文本合并为少量API请求
+        from llm_ner import recognize_entities_with_api_batch
+        spans = [_entities_to_spans(recognized) for recognized in
+                 recognize_entities_with_api_batch([text for _, _, text in documents])]
+    elif method == METHOD_HYBRID:
+        from llm_ner import recognize_entities_hybrid_batch
+        spans = [_entities_to_spans(recognized) for recognized in
+                 recognize_entities_hybrid_batch([text for _, _, text in documents])]
+    else:
+        spans = [recognize_spans(text, method) for _, _, text in documents]
+
+    rows = []
+    for (doc_id, field, _), doc_spans in zip(documents, spans):
+        for entity_type, entity, start, end in doc_spans:
+            rows.append({
+                'doc_id': doc_id,
+                'field': field,
+                'entity_type': entity_type,
+                'entity': entity,
+                'start': start,
+                'end': end
+            })
+    return rows
+
+
+def _chunks(documents, chunk_size):
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _pool_context():
+    """优先使用fork方式创建工作进程，使其共享主进程中已构建的匹配器"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def run_batch(documents, method=METHOD_DICT, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    批量识别文档中的实体
+
+    Args:
+        documents (iterable): (文档ID, 字段名, 文本)序列
+        method (str): 识别方法，dict、rules、transformer、api或hybrid
+        workers (int): 工作进程数，1表示在当前进程中处理（transformer方法建议使用1，由模型内部多线程计算）
+        chunk_size (int): 每个任务块包含的文档数
+
+    Yields:
+        dict: 实体区间行，字段见SPAN_COLUMNS，按文档输入顺序输出
+    """
+    prepare(method)
+    if workers <= 1:
+        for chunk in _chunks(documents, chunk_size):
+            yield from _process_chunk(method, chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                             initializer=prepare, initargs=(method,)) as executor:
+        pending = []
+        for chunk in _chunks(documents, chunk_size):
+            pending.append(executor.submit(_process_chunk, method, chunk))
+            # 限制同时提交的任务块数量，避免一次性读入全部文档
+            if len(pending) >= workers * 4:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def write_spans(rows, path):
+    """
+    将实体区间行写入文件，格式由扩展名决定（.jsonl、.csv或.parquet）
+
+    Returns:
+        int: 写入的行数
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.jsonl':
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+                count += 1
+        return count
+
+    import pandas as pd
+    df = pd.DataFrame(list(rows), columns=SPAN_COLUMNS)
+    if ext == '.csv':
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    elif ext == '.parquet':
+        df['doc_id'] = df['doc_id'].astype(str)
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError:
+            raise ImportError("输出Parquet文件需要安装pyarrow：pip install pyarrow")
+    else:
+        raise ValueError(f"不支持的输出文件格式: {ext}，仅支持{', '.join(OUTPUT_EXTENSIONS)}")
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量医学实体识别，输出实体区间表')
+    parser.add_argument('input', help='输入文件（.jsonl、.csv、.xlsx）')
+    parser.add_argument('--column', action='append', required=True, help='文本所在的列名，可指定多次')
+    parser.add_argument('--id-column', help='文档ID所在的列名，默认使用行号')
+    parser.add_argument('--method', choices=METHODS, default=METHOD_DICT, help='识别方法，默认dict')
+    parser.add_argument('--output', required=True, help='输出文件（.jsonl、.csv、.parquet）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每个任务块包含的文档数')
+    args = parser.parse_args(argv)
+    if os.path.splitext(args.output)[1].lower() not in OUTPUT_EXTENSIONS:
+        parser.error(f"不支持的输出文件格式，仅支持{', '.join(OUTPUT_EXTENSIONS)}")
+
+    documents = read_documents(args.input, args.column, args.id_column)
+    rows = run_batch(documents, args.method, args.workers, args.chunk_size)
+    count = write_spans(rows, args.output)
+    print(f"识别完成，共输出 {count} 个实体到 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
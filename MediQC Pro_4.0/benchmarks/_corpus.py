@@ -0,0 +1,48 @@
+"""
+基准脚本共用的测试语料
+
+导入本模块时把MediQC Pro_4.0目录加入sys.path，基准脚本随后即可导入被测模块。
+"""
+import os
+import sys
+import json
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# 测试语料
+TEST_DATA_FILE = os.path.join(APP_DIR, 'test_data.txt')
+
+# 与generate_hospital_data.py相同的主诉
+CHIEF_COMPLAINTS = ['头痛', '发热', '咳嗽', '胸痛', '腹痛', '恶心呕吐', '关节疼痛', '皮疹', '乏力', '头晕']
+
+
+def iter_records():
+    """逐条读取test_data.txt中的标注病历（{"originalText": ..., "entities": [...]}）"""
+    with open(TEST_DATA_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_texts():
+    """读取test_data.txt中的病历文本"""
+    return [record['originalText'] for record in iter_records()]
+
+
+def load_annotated():
+    """
+    读取test_data.txt中的病历文本和标注实体边界
+
+    Returns:
+        tuple: (病历文本列表, {(文本序号, 起始位置, 结束位置), ...})
+    """
+    texts = []
+    gold = set()
+    for record in iter_records():
+        for entity in record.get('entities', []):
+            gold.add((len(texts), entity['start_pos'], entity['end_pos']))
+        texts.append(record['originalText'])
+    return texts, gold
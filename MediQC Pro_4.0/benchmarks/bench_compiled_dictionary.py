@@ -0,0 +1,107 @@
+"""
+编译词典文件基准
+
+用随机生成的大规模词典（模拟ICD-10+药品目录）对比进程内自动机与映射编译文件的
+构建耗时、内存占用（RSS增量）和匹配耗时，并校验两者的识别结果完全一致。
+测试文本由test_data.txt中的病历文本拼接而成。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_compiled_dictionary.py
+    python benchmarks/bench_compiled_dictionary.py --terms 500000 --repeat 5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+# 导入_corpus时把MediQC Pro_4.0目录加入sys.path
+from _corpus import load_texts
+
+from entity_matcher import EntityMatcher, SOURCE_CUSTOM
+from compiled_automaton import CompiledAutomaton, write_compiled_automaton
+
+
+def random_dictionary(term_count, seed=0):
+    """生成随机词典：词条为2~8个常用汉字，平均分为两个实体类型"""
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    terms = set()
+    while len(terms) < term_count:
+        terms.add(''.join(rng.choice(chars) for _ in range(rng.randint(2, 8))))
+    terms = sorted(terms)
+    rng.shuffle(terms)
+    half = term_count // 2
+    return {'疾病': terms[:half], '药品': terms[half:]}
+
+
+def rss_mb():
+    """当前进程的常驻内存（MB），仅支持Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def best_time(func, text, repeat):
+    """多次运行取最短耗时（秒）和结果"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='编译词典文件基准')
+    parser.add_argument('--terms', type=int, default=300000, help='词典词条数')
+    parser.add_argument('--repeat', type=int, default=3, help='匹配的运行次数，取最短耗时')
+    args = parser.parse_args()
+
+    dictionary = random_dictionary(args.terms)
+    text = ''.join(load_texts())
+
+    before = rss_mb()
+    start = time.perf_counter()
+    in_memory = EntityMatcher.from_dicts({SOURCE_CUSTOM: dictionary})
+    build_time = time.perf_counter() - start
+    in_memory_rss = rss_mb() - before
+
+    path = os.path.join(tempfile.mkdtemp(), 'dictionary.bin')
+    start = time.perf_counter()
+    write_compiled_automaton(in_memory._automaton, path, 'bench', in_memory._term_order, metadata={
+        'type_order': {SOURCE_CUSTOM: list(dictionary)}
+    })
+    write_time = time.perf_counter() - start
+
+    before = rss_mb()
+    start = time.perf_counter()
+    compiled = EntityMatcher(compiled=CompiledAutomaton(path))
+    map_time = time.perf_counter() - start
+    compiled_rss = rss_mb() - before
+
+    print(f"词条数: {args.terms}，状态数: {len(in_memory._automaton._goto)}，"
+          f"编译文件: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+    print(f"{'':>10} {'加载耗时':>10} {'RSS增量':>10} {'匹配耗时':>10}")
+    memory_time, memory_result = best_time(in_memory.recognize, text, args.repeat)
+    compiled_time, compiled_result = best_time(compiled.recognize, text, args.repeat)
+    print(f"{'进程内':>10} {build_time:>9.1f}s {in_memory_rss:>8.0f}MB {memory_time * 1000:>8.1f}ms")
+    print(f"{'编译文件':>10} {map_time:>9.3f}s {compiled_rss:>8.0f}MB {compiled_time * 1000:>8.1f}ms"
+          f"  （编译写入 {write_time:.1f}s）")
+
+    same = memory_result == compiled_result
+    print(f"文本长度: {len(text)}，识别结果{'一致' if same else '不一致!'}")
+    os.remove(path)
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
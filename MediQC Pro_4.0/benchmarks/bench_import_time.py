@@ -0,0 +1,118 @@
+"""
+应用启动导入耗时基准
+
+使用 python -X importtime 在全新的解释器中导入app模块，统计导入总耗时和
+耗时最多的模块，并检查：
+1. 导入总耗时（多次运行取最小值）不超过预算；
+2. torch、transformers、python-docx等重量级依赖没有在启动时被导入。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --budget-ms 1500 --runs 5 --top 15
+
+超出预算或导入了禁止的模块时以非零状态码退出，可直接用于CI检查。
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# 应用目录（benchmarks的上一级）
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认导入耗时预算（毫秒），可通过环境变量IMPORT_TIME_BUDGET_MS覆盖
+DEFAULT_BUDGET_MS = 1500
+
+# 启动时不允许导入的重量级模块（应在首次使用时按需导入）
+FORBIDDEN_MODULES = ['torch', 'transformers', 'docx', 'mysql', 'requests']
+
+# -X importtime输出格式：import time: self [us] | cumulative | imported package
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def run_importtime(module):
+    """
+    在子进程中导入指定模块并解析-X importtime输出
+
+    Returns:
+        list: [(模块名, 自身耗时us, 累计耗时us, 嵌套层级), ...]
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, capture_output=True, text=True, encoding='utf-8', errors='replace'
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise RuntimeError(f"导入{module}失败，退出码{result.returncode}")
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+
+def direct_children(records, module):
+    """
+    返回被测模块直接导入的依赖
+
+    -X importtime先输出子模块再输出父模块，因此被测模块的直接依赖是它之前、
+    上一个顶层模块之后、嵌套层级为1的记录（解释器启动时由site导入的模块不计入）。
+    """
+    index = next((i for i, r in enumerate(records) if r[0] == module and r[3] == 0), None)
+    if index is None:
+        return []
+    children = []
+    for record in reversed(records[:index]):
+        if record[3] == 0:
+            break
+        if record[3] == 1:
+            children.append(record)
+    return children
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动导入耗时基准')
+    parser.add_argument('--module', default='app', help='要导入的模块，默认app')
+    parser.add_argument('--runs', type=int, default=5, help='运行次数，取最小耗时')
+    parser.add_argument('--top', type=int, default=15, help='显示耗时最多的前N个顶层依赖')
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.environ.get('IMPORT_TIME_BUDGET_MS', DEFAULT_BUDGET_MS)),
+                        help='导入总耗时预算（毫秒）')
+    args = parser.parse_args()
+
+    best_total = None
+    best_records = None
+    for i in range(args.runs):
+        records = run_importtime(args.module)
+        total = next((cum for name, _, cum, _ in records if name == args.module), 0)
+        print(f"第{i + 1}次: {total / 1000:.1f} ms")
+        if best_total is None or total < best_total:
+            best_total, best_records = total, records
+
+    direct = sorted(direct_children(best_records, args.module), key=lambda r: r[2], reverse=True)
+    print(f"\n{args.module} 直接依赖耗时（前{args.top}个，最快一次）:")
+    for name, _, cumulative, _ in direct[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    imported = {r[0] for r in best_records}
+    forbidden = sorted(m for m in FORBIDDEN_MODULES if m in imported)
+
+    print(f"\n导入总耗时: {best_total / 1000:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+    failed = False
+    if best_total / 1000 > args.budget_ms:
+        print("失败: 导入耗时超出预算")
+        failed = True
+    if forbidden:
+        print(f"失败: 启动时导入了重量级模块: {', '.join(forbidden)}")
+        failed = True
+    if not failed:
+        print("通过")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+API识别路径的吞吐量与延迟基准
+
+在本地模拟大模型API服务（mock_llm_server.py）上测量llm_ner的API识别路径（构建提示词、
+经连接池发送请求、重试、解析JSON、校正实体位置，不使用识别结果缓存）：
+1. 逐条请求：test_data.txt中的病历文本（长文本按api_chunk_chars切分并发请求）分别以
+   不同的并发数识别，报告吞吐量、单文本延迟的P50/P95、请求数、重试数和失败数
+2. 合并请求：短文本（主诉）以多条合并为一次请求的方式识别，与逐条请求对比请求数和耗时
+
+可调整模拟服务的延迟、出错比例和并发上限，以及连接池大小、合并请求的token预算，
+离线调优连接池和合并请求的参数。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_llm_api.py
+    python benchmarks/bench_llm_api.py --docs 200 --concurrency 1 4 16 --latency-ms 800 --error-rate 0.05
+    python benchmarks/bench_llm_api.py --url http://127.0.0.1:8765/v1   # 使用单独启动的模拟服务
+"""
+import io
+import sys
+import time
+import random
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 导入_corpus时把MediQC Pro_4.0目录加入sys.path
+from _corpus import CHIEF_COMPLAINTS, load_texts
+
+from llm_ner import DEFAULT_CONFIG, _request_api_entities_chunked, _recognize_api_records
+from llm_client import get_llm_client
+from mock_llm_server import start_mock_server
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def client_stats(config):
+    return dict(get_llm_client(config).stats)
+
+
+def run_per_record(texts, config, concurrency):
+    """
+    以指定并发数逐条识别
+
+    Returns:
+        tuple: (总耗时, 每个文本的耗时列表, 失败的文本数)
+    """
+    def recognize(text):
+        start = time.perf_counter()
+        entities, _ = _request_api_entities_chunked(text, config)
+        return time.perf_counter() - start, entities is None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(recognize, texts))
+    elapsed = time.perf_counter() - start
+    return elapsed, [latency for latency, _ in outcomes], sum(1 for _, failed in outcomes if failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API识别路径的吞吐量与延迟基准')
+    parser.add_argument('--url', help='已启动的模拟服务（或其他API）的api_url，默认在本进程中启动模拟服务')
+    parser.add_argument('--api-type', default='deepseek', help='API类型：deepseek、douban或自定义')
+    parser.add_argument('--docs', type=int, default=100, help='逐条请求的病历文本数')
+    parser.add_argument('--short-docs', type=int, default=200, help='合并请求的短文本数')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='并发数，可指定多个')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_CONFIG['api_pool_maxsize'], help='连接池大小')
+    parser.add_argument('--chunk-chars', type=int, default=DEFAULT_CONFIG['api_chunk_chars'], help='长文本的文本块大小')
+    parser.add_argument('--batch-tokens', type=int, default=DEFAULT_CONFIG['api_batch_tokens'], help='合并请求的token预算')
+    parser.add_argument('--latency-ms', type=float, default=300, help='模拟服务开始返回结果前的延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=100, help='模拟服务延迟的随机波动范围（毫秒）')
+    parser.add_argument('--per-char-ms', type=float, default=0.5, help='模拟服务每个输出字符的生成时间（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务返回错误状态码的比例')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='模拟服务同时处理的请求数上限')
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = start_mock_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                   per_char_ms=args.per_char_ms, error_rate=args.error_rate,
+                                   max_concurrency=args.max_concurrency)
+        url = server.url
+
+    config = dict(DEFAULT_CONFIG, api_mode=True, api_type=args.api_type, api_key='benchmark', api_url=url,
+                  api_pool_maxsize=args.pool_size, api_chunk_chars=args.chunk_chars,
+                  api_batch_tokens=args.batch_tokens)
+    rng = random.Random(0)
+    corpus = load_texts()
+    texts = [corpus[i % len(corpus)] for i in range(args.docs)]
+    short_texts = [f"{rng.choice(CHIEF_COMPLAINTS)}{rng.randint(1, 30)}天" for _ in range(args.short_docs)]
+    print(f"API: {url}（{args.api_type}），病历文本{len(texts)}条（平均{sum(map(len, texts)) // len(texts)}字），"
+          f"短文本{len(short_texts)}条，连接池大小{args.pool_size}")
+
+    # 识别过程中的日志不输出
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        run_per_record(texts[:2], config, 2)   # 预热连接
+
+    print(f"{'方式':<10} {'并发':>4} {'总耗时':>8} {'吞吐量':>10} {'P50':>8} {'P95':>8} {'请求数':>6} {'重试':>4} {'失败':>4}")
+    for concurrency in args.concurrency:
+        before = client_stats(config)
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, latencies, failed = run_per_record(texts, config, concurrency)
+        after = client_stats(config)
+        print(f"{'逐条请求':<10} {concurrency:>4} {elapsed:>7.2f}s {len(texts) / elapsed:>7.1f}条/s "
+              f"{percentile(latencies, 0.5) * 1000:>6.0f}ms {percentile(latencies, 0.95) * 1000:>6.0f}ms "
+              f"{after['requests'] - before['requests']:>6} {after['retries'] - before['retries']:>4} {failed:>4}")
+
+    for label, batch_records in (('短文本逐条', 1), ('短文本合并', DEFAULT_CONFIG['api_batch_records'])):
+        for concurrency in args.concurrency:
+            run_config = dict(config, api_batch_records=batch_records, api_max_concurrency=concurrency)
+            before = client_stats(run_config)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = _recognize_api_records(short_texts, run_config)
+            elapsed = time.perf_counter() - start
+            after = client_stats(run_config)
+            failed = sum(1 for result in results if result is None)
+            print(f"{label:<10} {concurrency:>4} {elapsed:>7.2f}s {len(short_texts) / elapsed:>7.1f}条/s "
+                  f"{'-':>8} {'-':>8} {after['requests'] - before['requests']:>6} "
+                  f"{after['retries'] - before['retries']:>4} {failed:>4}")
+
+    if server is not None:
+        print(f"模拟服务统计: {server.snapshot()}")
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+ONNX Runtime推理后端的精度与耗时对比
+
+在test_data.txt的病历文本上分别运行：
+1. PyTorch fp32（transformers pipeline，即原实现）
+2. ONNX Runtime fp32
+3. ONNX Runtime int8动态量化
+报告每个后端处理全部文本的耗时、相对PyTorch的加速比、与PyTorch结果的一致程度
+（按(位置, 类型)计算的F1），以及与test_data.txt标注实体的边界F1（模型标签与标注
+类型体系不同，因此只比较实体边界）。
+
+需要安装torch、transformers和onnxruntime；ONNX模型不存在时会先导出。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_onnx_ner.py
+    python benchmarks/bench_onnx_ner.py --model trueto/medbert-kd-chinese --batch-size 16 --threads 4
+"""
+import os
+import sys
+import time
+import argparse
+
+# 导入_corpus时把MediQC Pro_4.0目录加入sys.path
+from _corpus import APP_DIR, load_annotated
+os.chdir(APP_DIR)
+
+import onnx_ner
+from llm_ner import get_llm_config, _segment_text, _run_pipeline_batched
+
+
+def default_model():
+    """与llm_ner加载模型时相同的模型来源"""
+    config = get_llm_config()
+    local_model_path = config.get('local_model_path', '')
+    if local_model_path and os.path.exists(local_model_path):
+        return local_model_path
+    model_name = config['model_name']
+    if 'chinese' in model_name.lower() or 'med' in model_name.lower() or 'zh' in model_name.lower():
+        return config.get('chinese_medical_model', 'trueto/medbert-kd-chinese')
+    return model_name
+
+
+def run(ner_pipeline, segments, batch_size):
+    """
+    批量识别所有文本段
+
+    Returns:
+        set: {(文本序号, 起始位置, 结束位置, 类型), ...}
+    """
+    entities_by_text = _run_pipeline_batched(ner_pipeline, segments, batch_size)
+    return {(index, entity['start'], entity['end'], entity['entity_group'])
+            for index, entities in entities_by_text.items() for entity in entities}
+
+
+def f1(predicted, reference):
+    """集合F1"""
+    if not predicted and not reference:
+        return 1.0
+    correct = len(predicted & reference)
+    precision = correct / len(predicted) if predicted else 0.0
+    recall = correct / len(reference) if reference else 0.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ONNX Runtime推理后端的精度与耗时对比')
+    parser.add_argument('--model', help='模型名称或本地路径，默认使用data/llm_config.json中的配置')
+    parser.add_argument('--onnx-dir', help='ONNX模型目录，默认为model_cache/onnx/<模型名称>')
+    parser.add_argument('--batch-size', type=int, default=8, help='每批推理的文本段数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个后端的运行次数，取最短耗时')
+    parser.add_argument('--threads', type=int, help='推理线程数（torch和ONNX Runtime），默认使用全部CPU核')
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='int8模型与PyTorch结果的F1低于该值时返回非零退出码')
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model_name = args.model or default_model()
+    onnx_dir = args.onnx_dir or onnx_ner.model_dir_for(model_name)
+    cache_dir = os.path.join(APP_DIR, 'model_cache')
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir, use_fast=True)
+    texts, gold = load_annotated()
+    segments = [(i, offset, segment) for i, text in enumerate(texts)
+                for offset, segment in _segment_text(text, tokenizer)]
+    print(f"模型: {model_name}，文本数: {len(texts)}，文本段数: {len(segments)}，标注实体数: {len(gold)}")
+
+    model = AutoModelForTokenClassification.from_pretrained(model_name, cache_dir=cache_dir)
+    if not os.path.exists(os.path.join(onnx_dir, onnx_ner.INT8_MODEL_FILE)):
+        # 导出int8模型时会同时生成fp32模型
+        onnx_ner.export_onnx(model_name, onnx_dir, quantize=True, cache_dir=cache_dir)
+    backends = [
+        ('PyTorch fp32', pipeline('ner', model=model, tokenizer=tokenizer, device=-1, aggregation_strategy='simple')),
+        ('ONNX fp32', onnx_ner.OnnxNERPipeline(onnx_dir, quantized=False, num_threads=args.threads)),
+        ('ONNX int8', onnx_ner.OnnxNERPipeline(onnx_dir, quantized=True, num_threads=args.threads))
+    ]
+
+    print(f"{'后端':<14} {'总耗时':>9} {'每文本':>9} {'加速比':>7} {'与PyTorch一致F1':>16} {'标注边界F1':>10}")
+    reference = None
+    reference_time = None
+    agreement = 1.0
+    for name, ner_pipeline in backends:
+        run(ner_pipeline, segments[:1], args.batch_size)  # 预热
+        best = None
+        spans = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            spans = run(ner_pipeline, segments, args.batch_size)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if reference is None:
+            reference, reference_time = spans, best
+        agreement = f1(spans, reference)
+        boundary = f1({span[:3] for span in spans}, gold)
+        print(f"{name:<14} {best:>8.2f}s {best / len(texts) * 1000:>7.0f}ms {reference_time / best:>6.1f}x "
+              f"{agreement:>16.3f} {boundary:>10.3f}")
+
+    return 0 if agreement >= args.min_agreement else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
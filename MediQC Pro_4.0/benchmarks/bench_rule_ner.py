@@ -0,0 +1,68 @@
+"""
+正则规则实体识别基准
+
+对比逐条规则调用re.finditer（原实现）与rule_matcher.RuleMatcher单次扫描的耗时，
+并校验两者的匹配结果完全一致。测试文本由test_data.txt中的病历文本重复拼接而成。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_rule_ner.py
+    python benchmarks/bench_rule_ner.py --sizes 10000 100000 1000000 --repeat 5
+"""
+import re
+import sys
+import time
+import argparse
+
+# 导入_corpus时把MediQC Pro_4.0目录加入sys.path
+from _corpus import load_texts
+
+from llm_ner import MEDICAL_ENTITY_RULES
+from rule_matcher import RuleMatcher
+
+
+def legacy_find(text):
+    """原实现：对每条规则分别调用re.finditer"""
+    return [(match.start(), match.end(), entity_type)
+            for entity_type, patterns in MEDICAL_ENTITY_RULES.items()
+            for pattern in patterns
+            for match in re.finditer(pattern, text)]
+
+
+def best_time(func, text, repeat):
+    """多次运行取最短耗时（秒）和结果"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='正则规则实体识别基准')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='测试文本长度（字符数）')
+    parser.add_argument('--repeat', type=int, default=3, help='每种长度的运行次数，取最短耗时')
+    args = parser.parse_args()
+
+    corpus = ''.join(load_texts())
+    matcher = RuleMatcher(MEDICAL_ENTITY_RULES)
+    print(f"规则数: 查找表 {matcher.table_rule_count}，正则 {matcher.regex_rule_count}")
+    print(f"{'文本长度':>10} {'匹配数':>8} {'re.finditer':>12} {'RuleMatcher':>12} {'加速比':>8}")
+
+    ok = True
+    for size in args.sizes:
+        text = (corpus * (size // len(corpus) + 1))[:size]
+        legacy_time, legacy_result = best_time(legacy_find, text, args.repeat)
+        new_time, new_result = best_time(matcher.find, text, args.repeat)
+        same = set(legacy_result) == set(new_result)
+        ok = ok and same
+        print(f"{size:>10} {len(set(new_result)):>8} {legacy_time * 1000:>10.1f}ms {new_time * 1000:>10.1f}ms "
+              f"{legacy_time / new_time:>7.1f}x{'' if same else '  结果不一致!'}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+句子级识别结果缓存基准
+
+按generate_hospital_data.py的模板生成病历文本（主诉不同、现病史和一般情况为固定表述，
+再拼接test_data.txt中的一段病历），统计重复句子的比例，对比规则匹配直接识别与按句子
+缓存识别的耗时，并校验两者的识别结果完全一致。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python benchmarks/bench_sentence_memo.py
+    python benchmarks/bench_sentence_memo.py --docs 5000
+"""
+import sys
+import time
+import random
+import argparse
+
+# 导入_corpus时把MediQC Pro_4.0目录加入sys.path
+from _corpus import CHIEF_COMPLAINTS, load_texts
+
+from llm_ner import recognize_entities_with_rules, _match_rules, _match_rules_sentences
+from sentence_memo import SentenceMemo, split_sentences
+
+
+def generate_documents(count, seed=0):
+    """生成模板化的病历文本"""
+    rng = random.Random(seed)
+    records = load_texts()
+    documents = []
+    for _ in range(count):
+        chief_complaint = f"{rng.choice(CHIEF_COMPLAINTS)}{rng.randint(1, 10)}天"
+        record = rng.choice(records)
+        start = rng.randrange(0, max(1, len(record) - 200))
+        documents.append(
+            f"患者{chief_complaint}。无发热，无恶心呕吐，无胸闷气短，无腹痛腹泻。"
+            f"{record[start:start + rng.randint(50, 200)]}\n"
+            f"患者一般情况可，饮食睡眠可，大小便正常。"
+        )
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='句子级识别结果缓存基准')
+    parser.add_argument('--docs', type=int, default=2000, help='生成的病历文本数')
+    args = parser.parse_args()
+
+    documents = generate_documents(args.docs)
+    sentences = [sentence for document in documents for _, sentence in split_sentences(document)]
+    duplicate = 1 - len(set(sentences)) / len(sentences)
+    print(f"文本数: {len(documents)}，句子数: {len(sentences)}，重复句子比例: {duplicate:.1%}")
+
+    start = time.perf_counter()
+    direct = [_match_rules(document, True) for document in documents]
+    direct_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    memoized = [recognize_entities_with_rules(document) for document in documents]
+    memo_time = time.perf_counter() - start
+
+    # 每篇文本使用新的缓存，只去除文本内部的重复句子，衡量分句和组装本身的开销
+    start = time.perf_counter()
+    for document in documents:
+        SentenceMemo('bench').recognize(
+            [document], 'bench', lambda items: _match_rules_sentences(items, True))
+    overhead_time = time.perf_counter() - start
+
+    print(f"{'直接识别':>12} {direct_time * 1000:>8.0f}ms")
+    print(f"{'按句子缓存':>12} {memo_time * 1000:>8.0f}ms  （{direct_time / memo_time:.1f}x）")
+    print(f"{'无跨文本复用':>12} {overhead_time * 1000:>8.0f}ms")
+    same = direct == memoized
+    print(f"识别结果{'一致' if same else '不一致!'}")
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
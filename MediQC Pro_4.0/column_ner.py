@@ -0,0 +1,252 @@
+"""
+表格文本列实体识别模块
+
+对上传的工作簿（如export_admissions导出的住院记录）中的自由文本列（主诉、现病史、出院诊断等）
+整列识别医学实体，不再逐条粘贴到/recognize_entities：
+- 一列的所有文本以分隔符连接为一个字符串，词典匹配自动机对整列只扫描一次，
+  再按各行文本在连接串中的起始位置（numpy二分查找）把实体位置换算回行号和行内位置
+- 行数较多时按行分块，由多个进程并行匹配（fork方式共享主进程中已构建的匹配器）
+- 输出实体区间表（每个实体一行，row列为原表的行索引，可与原表关联）、
+  实体频次表（每列每个实体的出现次数和出现的记录数），
+  以及“列名_实体类型”派生列（该行识别到的实体，以顿号连接），派生列可直接作为质控规则的字段
+
+命令行用法（在MediQC Pro_4.0目录下运行）：
+    python column_ner.py 住院记录.xlsx --column 主诉 --column 现病史 --column 出院诊断 \\
+        --output 住院记录_实体.xlsx --workers 4
+"""
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_ner import METHOD_DICT, prepare, _pool_context
+
+# 连接同一列各行文本的分隔符（词典实体中不会出现，匹配不会跨行）
+ROW_SEPARATOR = '\x00'
+
+# 默认识别的文本列（export_admissions导出的住院记录）
+DEFAULT_COLUMNS = ['主诉', '现病史', '出院诊断']
+
+# 文本总字数达到该值时使用多进程，较小的表格在当前进程中识别更快
+PARALLEL_MIN_CHARS = 2000000
+
+# 多进程时每个任务块包含的行数
+ROWS_PER_TASK = 5000
+
+# 派生列中连接多个实体的分隔符
+ENTITY_JOINER = '、'
+
+# 实体区间表和实体频次表的列
+SPAN_COLUMNS = ['row', 'field', 'entity_type', 'entity', 'start', 'end']
+FREQUENCY_COLUMNS = ['field', 'entity_type', 'entity', 'mentions', 'rows']
+
+
+def entity_column_name(field, entity_type):
+    """派生列的列名，如“主诉_症状”"""
+    return f"{field}_{entity_type}"
+
+
+def _check_index(df):
+    """实体区间表和派生列按行索引关联回原表，行索引必须唯一"""
+    if not df.index.is_unique:
+        raise ValueError("表格的行索引不唯一，请先调用reset_index()")
+
+
+def _column_texts(series):
+    """取出一列的文本，空值为空字符串，文本中的分隔符替换为空格（不改变长度）"""
+    texts = series.where(series.notna(), '').astype(str)
+    return texts.str.replace(ROW_SEPARATOR, ' ', regex=False).tolist()
+
+
+def _match_block(texts):
+    """
+    一次扫描识别一块文本中的词典实体
+
+    Args:
+        texts (list): 各行文本
+
+    Returns:
+        tuple: 各数组一一对应（行在块中的序号、实体类型、实体、行内起始位置），
+            按实体在连接串中的结束位置排列
+    """
+    from entity_matcher import get_entity_matcher
+    lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    matches = get_entity_matcher().find(ROW_SEPARATOR.join(texts))
+    if not matches:
+        return np.empty(0, dtype=np.int64), [], [], np.empty(0, dtype=np.int64)
+    starts = np.fromiter((match[0] for match in matches), dtype=np.int64, count=len(matches))
+    rows = np.searchsorted(offsets, starts, side='right') - 1
+    return rows, [match[3] for match in matches], [match[1] for match in matches], starts - offsets[rows]
+
+
+def _block_spans(field, index, texts, first_row):
+    """识别一块文本，返回该块的实体区间表（_position列为行在原表中的序号，用于排序）"""
+    rows, entity_types, entities, starts = _match_block(texts)
+    return pd.DataFrame({
+        'row': np.asarray(index)[rows],
+        '_position': first_row + rows,
+        'field': field,
+        'entity_type': entity_types,
+        'entity': entities,
+        'start': starts,
+        'end': starts + np.fromiter(map(len, entities), dtype=np.int64, count=len(entities))
+    })
+
+
+def _tasks(df, columns, rows_per_task):
+    for field in columns:
+        texts = _column_texts(df[field])
+        index = df.index.tolist()
+        for start in range(0, len(texts), rows_per_task):
+            yield field, index[start:start + rows_per_task], texts[start:start + rows_per_task], start
+
+
+def recognize_columns(df, columns, workers=1, rows_per_task=ROWS_PER_TASK):
+    """
+    识别表格中若干文本列的词典实体
+
+    Args:
+        df (pandas.DataFrame): 表格，每行为一条记录
+        columns (list): 文本列名
+        workers (int): 工作进程数，文本总字数不足PARALLEL_MIN_CHARS时在当前进程中识别
+        rows_per_task (int): 多进程时每个任务块包含的行数
+
+    Returns:
+        pandas.DataFrame: 实体区间表，列见SPAN_COLUMNS，row为df的行索引，
+            start、end为实体在该行该列文本中的位置；按列、行、位置排列
+
+    Raises:
+        ValueError: 文本列不存在或df的行索引不唯一
+    """
+    _check_index(df)
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"表格中不存在以下列: {', '.join(missing)}")
+
+    prepare(METHOD_DICT)
+    total_chars = sum(int(df[column].astype(str).str.len().sum()) for column in columns) if len(df) else 0
+    if workers <= 1 or total_chars < PARALLEL_MIN_CHARS:
+        # 每列整列一次扫描
+        blocks = [_block_spans(*task) for task in _tasks(df, columns, max(len(df), 1))]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                 initializer=prepare, initargs=(METHOD_DICT,)) as executor:
+            futures = [executor.submit(_block_spans, *task) for task in _tasks(df, columns, rows_per_task)]
+            blocks = [future.result() for future in futures]
+
+    blocks = [block for block in blocks if len(block)]
+    if not blocks:
+        return pd.DataFrame(columns=SPAN_COLUMNS)
+    # 各块按列、行的顺序提交，块内再按行和位置排列（匹配结果按实体在连接串中的结束位置排列）
+    spans = pd.concat(blocks, ignore_index=True)
+    spans['_field'] = spans['field'].map({field: rank for rank, field in enumerate(columns)})
+    spans = spans.sort_values(['_field', '_position', 'start', 'end'], kind='stable')
+    return spans[SPAN_COLUMNS].reset_index(drop=True)
+
+
+def entity_frequencies(spans):
+    """
+    实体频次表：每列每个实体的出现次数（mentions）和出现该实体的记录数（rows），按出现次数降序排列
+
+    可按field、entity与实体区间表关联，再按row关联回原表。
+    """
+    if spans.empty:
+        return pd.DataFrame(columns=FREQUENCY_COLUMNS)
+    grouped = spans.groupby(['field', 'entity_type', 'entity'], sort=False)['row']
+    frequencies = grouped.agg(mentions='size', rows='nunique').reset_index()
+    return frequencies.sort_values(['mentions', 'rows'], ascending=False, kind='stable').reset_index(drop=True)
+
+
+def add_entity_columns(df, columns, spans, entity_types=None):
+    """
+    为每个文本列和实体类型添加“列名_实体类型”派生列：该行识别到的实体（去重，按出现顺序以顿号连接），
+    没有识别到实体时为空字符串，可用于缺项检查（如“主诉_症状”为空）和包含检查
+
+    Args:
+        df (pandas.DataFrame): 原表
+        columns (list): 文本列名
+        spans (pandas.DataFrame): recognize_columns返回的实体区间表
+        entity_types (list): 实体类型，默认为词典中的全部类型（没有识别到的类型也生成派生列）
+
+    Returns:
+        pandas.DataFrame: 添加派生列后的新表（原表不变）
+
+    Raises:
+        ValueError: df的行索引不唯一
+    """
+    _check_index(df)
+    if entity_types is None:
+        from entity_matcher import get_entity_matcher
+        entity_types = get_entity_matcher().entity_types()
+    joined = {}
+    unique = spans.drop_duplicates(['field', 'entity_type', 'row', 'entity'])
+    for (field, entity_type), group in unique.groupby(['field', 'entity_type'], sort=False):
+        joined[(field, entity_type)] = group.groupby('row', sort=False)['entity'].agg(ENTITY_JOINER.join)
+
+    derived = {}
+    for field in columns:
+        for entity_type in entity_types:
+            values = joined.get((field, entity_type))
+            if values is None:
+                derived[entity_column_name(field, entity_type)] = [''] * len(df)
+            else:
+                derived[entity_column_name(field, entity_type)] = values.reindex(df.index).fillna('').to_numpy()
+    # 再次识别已含派生列的表格时替换原有的派生列
+    df = df.drop(columns=[name for name in derived if name in df.columns])
+    return pd.concat([df, pd.DataFrame(derived, index=df.index)], axis=1)
+
+
+def run_column_ner(df, columns, workers=1):
+    """
+    整列识别并生成派生列和实体频次表
+
+    Returns:
+        tuple: (添加派生列后的表, 实体区间表, 实体频次表)
+    """
+    spans = recognize_columns(df, columns, workers)
+    return add_entity_columns(df, columns, spans), spans, entity_frequencies(spans)
+
+
+def write_workbook(path, data, spans, frequencies):
+    """
+    将添加派生列后的表、实体区间表和实体频次表写入一个Excel文件的三个工作表，
+    数据表的第一列为行索引（row），与实体区间表的row列对应
+    """
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        data.to_excel(writer, sheet_name='数据', index_label='row')
+        spans.to_excel(writer, sheet_name='实体区间', index=False)
+        frequencies.to_excel(writer, sheet_name='实体频次', index=False)
+
+
+def read_table(path):
+    """读取CSV或Excel表格"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(path, encoding='utf-8-sig')
+    if ext in ('.xlsx', '.xls'):
+        return pd.read_excel(path)
+    raise ValueError(f"不支持的文件格式: {ext}，仅支持.csv、.xlsx和.xls")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='表格文本列实体识别，输出派生列、实体区间表和实体频次表')
+    parser.add_argument('input', help='输入文件（.xlsx、.csv）')
+    parser.add_argument('--column', action='append', help=f"文本列名，可指定多次，默认{'、'.join(DEFAULT_COLUMNS)}")
+    parser.add_argument('--output', required=True, help='输出Excel文件（.xlsx）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数，默认为CPU核数')
+    args = parser.parse_args(argv)
+
+    df = read_table(args.input)
+    columns = args.column or [column for column in DEFAULT_COLUMNS if column in df.columns]
+    data, spans, frequencies = run_column_ner(df, columns, args.workers)
+    write_workbook(args.output, data, spans, frequencies)
+    print(f"识别完成，{len(df)}行，共{len(spans)}个实体，结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+编译后的实体匹配自动机文件模块
+
+将Aho-Corasick自动机序列化为只读的二进制文件，由各个工作进程通过mmap映射后直接
+在文件上匹配：自动机数据位于操作系统页缓存中，所有进程共享同一份物理内存，
+不会在每个工作进程中各复制一份几十万词条的词典。
+
+文件格式（小端序）：
+    魔数 b'MQEA' | 格式版本 uint32 | 头部长度 uint32 | 头部JSON | 对齐填充 | 各数组
+头部JSON记录词典指纹、状态数、模式数、来源和实体类型名称表以及各数组的偏移量。数组：
+    fail      uint32[状态数]        失败链接
+    link      uint32[状态数]        输出链接
+    plen      uint32[状态数]        以该状态结尾的模式长度（0表示不是模式终点）
+    out_start uint32[状态数+1]      该状态载荷在out中的起止位置
+    out       uint32[载荷数*3]      载荷(来源序号, 实体类型序号, 词典顺序)
+    keys      uint64[哈希表大小]    转移表的键：状态 * 0x110000 + 字符码 + 1，0表示空槽
+    targets   uint32[哈希表大小]    转移表的目标状态
+    root_chars / root_targets uint32[根状态转移数]  根状态的转移（加载后转为字典）
+转移表为开放寻址（线性探测）哈希表，单次转移的查找为常数时间。文本中的大多数字符
+都从根状态转移，根状态的转移表只有几千项，加载时读入进程内的字典以加快匹配。
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import tempfile
+
+MAGIC = b'MQEA'
+FORMAT_VERSION = 1
+
+# 字符码空间大小（Unicode最大码位+1）
+CODEPOINT_SPACE = 0x110000
+
+# 哈希表装载因子上限
+MAX_LOAD_FACTOR = 0.5
+
+_PREFIX = struct.Struct('<4sII')
+
+
+def _slot(key, bits):
+    """Fibonacci哈希：返回键在2**bits大小的哈希表中的初始槽位"""
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+
+
+def _array(typecode, values):
+    """构建指定类型的数组并转换为小端序字节"""
+    from array import array
+    data = array(typecode, values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def write_compiled_automaton(automaton, path, fingerprint, term_order=None, metadata=None):
+    """
+    将已构建的内存自动机写入二进制文件（先写临时文件再原子替换）
+
+    Args:
+        automaton (entity_matcher.AhoCorasick): 内存中的自动机，载荷为(来源, 实体类型)
+        path (str): 输出文件路径
+        fingerprint (str): 词典指纹，加载时用于校验文件与词典是否一致
+        term_order (dict): {(来源, 实体类型, 实体): 词典顺序}，缺省为0
+        metadata (dict): 随文件保存的附加信息（需可JSON序列化）
+    """
+    if automaton._dirty:
+        automaton.build()
+    goto, fail, link, pattern, payloads = (automaton._goto, automaton._fail, automaton._link,
+                                           automaton._pattern, automaton._payloads)
+    term_order = term_order or {}
+    state_count = len(goto)
+    source_ids = {}
+    type_ids = {}
+
+    plen = [len(pattern[s]) if payloads[s] else 0 for s in range(state_count)]
+    out_start = [0]
+    out = []
+    for s in range(state_count):
+        for source, entity_type in payloads[s]:
+            out.extend((source_ids.setdefault(source, len(source_ids)),
+                        type_ids.setdefault(entity_type, len(type_ids)),
+                        term_order.get((source, entity_type, pattern[s]), 0)))
+        out_start.append(len(out) // 3)
+
+    edge_count = sum(len(edges) for edges in goto)
+    bits = 4
+    while (1 << bits) * MAX_LOAD_FACTOR < max(edge_count, 1):
+        bits += 1
+    size = 1 << bits
+    mask = size - 1
+    keys = [0] * size
+    targets = [0] * size
+    for state, edges in enumerate(goto):
+        base = state * CODEPOINT_SPACE + 1
+        for char, target in edges.items():
+            key = base + ord(char)
+            slot = _slot(key, bits)
+            while keys[slot]:
+                slot = (slot + 1) & mask
+            keys[slot] = key
+            targets[slot] = target
+
+    arrays = [
+        ('fail', 'I', fail),
+        ('link', 'I', link),
+        ('plen', 'I', plen),
+        ('out_start', 'I', out_start),
+        ('out', 'I', out),
+        ('keys', 'Q', keys),
+        ('targets', 'I', targets),
+        ('root_chars', 'I', [ord(char) for char in goto[0]]),
+        ('root_targets', 'I', list(goto[0].values())),
+    ]
+    blobs = [(name, typecode, _array(typecode, values)) for name, typecode, values in arrays]
+
+    header = {
+        'fingerprint': fingerprint,
+        'state_count': state_count,
+        'pattern_count': automaton.pattern_count,
+        'hash_bits': bits,
+        'sources': list(source_ids),
+        'entity_types': list(type_ids),
+        'metadata': metadata or {},
+        'arrays': {}
+    }
+    # 头部长度依赖数组偏移量，偏移量又依赖头部长度：预留足够的填充后再计算
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    reserve = len(header_bytes) + 64 * len(blobs) + 256
+    offset = (_PREFIX.size + reserve + 7) // 8 * 8
+    for name, typecode, blob in blobs:
+        header['arrays'][name] = [offset, typecode, len(blob)]
+        offset += (len(blob) + 7) // 8 * 8
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8').ljust(reserve, b' ')
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, typecode, blob in blobs:
+                f.seek(header['arrays'][name][0])
+                f.write(blob)
+            f.write(b'\0' * ((8 - f.tell() % 8) % 8))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_fingerprint(path):
+    """读取文件头部中的词典指纹，文件不存在或格式不符时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            return json.loads(f.read(header_length).decode('utf-8'))['fingerprint']
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+
+class CompiledAutomaton:
+    """
+    映射到内存的只读自动机，匹配接口与entity_matcher.AhoCorasick一致
+
+    载荷为(来源, 实体类型, 词典顺序)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"不是有效的实体自动机文件: {path}")
+        header = json.loads(bytes(self._mmap[_PREFIX.size:_PREFIX.size + header_length]).decode('utf-8'))
+        self.fingerprint = header['fingerprint']
+        self.pattern_count = header['pattern_count']
+        self.state_count = header['state_count']
+        self.sources = header['sources']
+        self.entity_types = header['entity_types']
+        self.metadata = header['metadata']
+        self._bits = header['hash_bits']
+
+        view = memoryview(self._mmap)
+        if sys.byteorder != 'little':
+            raise ValueError("实体自动机文件仅支持小端序平台")
+        for name, (offset, typecode, length) in header['arrays'].items():
+            setattr(self, '_' + name, view[offset:offset + length].cast(typecode))
+        self._root = {chr(code): target for code, target in zip(self._root_chars, self._root_targets)}
+
+    def __len__(self):
+        return self.pattern_count
+
+    def _goto(self, state, char):
+        """返回状态经字符转移后的状态，不存在时返回0"""
+        if not state:
+            return self._root.get(char, 0)
+        key = state * CODEPOINT_SPACE + 1 + ord(char)
+        keys = self._keys
+        mask = len(keys) - 1
+        slot = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - self._bits)
+        while True:
+            found = keys[slot]
+            if found == key:
+                return self._targets[slot]
+            if not found:
+                return 0
+            slot = (slot + 1) & mask
+
+    def lookup(self, pattern):
+        """返回模式的载荷列表，模式不存在时返回空列表"""
+        state = 0
+        for char in pattern:
+            state = self._goto(state, char)
+            if not state:
+                return []
+        return self.payloads(state) if self._plen[state] else []
+
+    def payloads(self, state):
+        """返回状态的载荷列表[(来源, 实体类型, 词典顺序), ...]"""
+        out = self._out
+        sources = self.sources
+        entity_types = self.entity_types
+        return [(sources[out[i]], entity_types[out[i + 1]], out[i + 2])
+                for i in range(self._out_start[state] * 3, self._out_start[state + 1] * 3, 3)]
+
+    def iter_matches(self, text):
+        """
+        扫描文本，按结束位置顺序产生所有匹配
+
+        Yields:
+            tuple: (起始位置, 模式, 载荷列表)
+        """
+        root = self._root
+        keys, targets = self._keys, self._targets
+        mask = len(keys) - 1
+        shift = 64 - self._bits
+        fail, link, plen = self._fail, self._link, self._plen
+        state = 0
+        for i, char in enumerate(text):
+            code = 1 + ord(char)
+            while state:
+                # 内联的_goto
+                key = state * CODEPOINT_SPACE + code
+                slot = ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> shift
+                found = keys[slot]
+                while found and found != key:
+                    slot = (slot + 1) & mask
+                    found = keys[slot]
+                if found:
+                    state = targets[slot]
+                    break
+                state = fail[state]
+            else:
+                state = root.get(char, 0)
+            s = state if plen[state] else link[state]
+            while s:
+                length = plen[s]
+                if length:
+                    start = i - length + 1
+                    yield start, text[start:i + 1], self.payloads(s)
+                s = link[s]
@@ -0,0 +1,141 @@
+"""
+配置文件缓存模块
+
+规则、科室诊断映射和医学实体字典已保存在规则库（data_store，SQLite）中，
+数据库配置和大模型配置仍为JSON文件（由用户在页面上修改，也可直接编辑文件）。
+本模块为每个配置文件维护一份进程内缓存：文件只在首次访问和修改时间变化后重新解析，
+保存时使用临时文件+原子替换写入并同步更新缓存。
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+
+# 两次检查文件修改时间之间的最小间隔（秒），本进程内的保存会立即生效
+DEFAULT_CHECK_INTERVAL = 0.5
+
+
+class CachedJsonFile:
+    """
+    带修改检测的JSON文件缓存
+
+    get()返回的是缓存中的共享对象，调用方如需修改，应先复制再通过write()保存。
+    """
+
+    def __init__(self, path, default=None, check_interval=DEFAULT_CHECK_INTERVAL):
+        """
+        Args:
+            path (str): JSON文件路径
+            default: 文件不存在或首次读取失败时返回的默认值
+            check_interval (float): 检查文件修改时间的最小间隔（秒）
+        """
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._data = None
+        self._stamp = None
+        self._loaded = False
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    def _file_stamp(self):
+        """返回文件的(修改时间, 大小)，文件不存在时返回None"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self):
+        """获取文件内容，文件被修改后自动重新加载"""
+        now = time.monotonic()
+        if self._loaded and now - self._last_check < self.check_interval:
+            return self._data
+
+        with self._lock:
+            self._last_check = now
+            stamp = self._file_stamp()
+            if self._loaded and stamp == self._stamp:
+                return self._data
+
+            if stamp is None:
+                if not self._loaded or self._stamp is not None:
+                    self._set(self.default, None)
+                return self._data
+
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                # 文件可能正被其他进程写入，保留上一次成功加载的内容
+                print(f"读取文件出错({self.path}): {str(e)}")
+                if not self._loaded:
+                    self._set(self.default, None)
+                return self._data
+
+            self._set(data, stamp)
+            return self._data
+
+    def _set(self, data, stamp):
+        """更新缓存内容"""
+        self._data = data
+        self._stamp = stamp
+        self._loaded = True
+
+    def write(self, data):
+        """
+        原子地保存文件内容并更新缓存
+
+        Args:
+            data: 要保存的JSON可序列化对象
+        """
+        with self._lock:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._set(data, self._file_stamp())
+            self._last_check = time.monotonic()
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+def get_json_file(path, default=None):
+    """
+    获取指定路径的共享文件缓存，同一路径在进程内只有一个缓存实例
+
+    Args:
+        path (str): JSON文件路径
+        default: 文件不存在或读取失败时的默认值（仅首次创建缓存时生效）
+
+    Returns:
+        CachedJsonFile: 文件缓存
+    """
+    key = os.path.abspath(path)
+    cached = _files.get(key)
+    if cached is None:
+        with _files_lock:
+            cached = _files.get(key)
+            if cached is None:
+                cached = _files[key] = CachedJsonFile(path, default)
+    return cached
+
+
+def load_json(path, default=None):
+    """读取JSON文件内容（带缓存），返回的对象不应被直接修改"""
+    return get_json_file(path, default).get()
+
+
+def save_json(path, data):
+    """原子地保存JSON文件并更新缓存"""
+    get_json_file(path).write(data)
@@ -0,0 +1,517 @@
+"""
+规则与字典存储模块
+
+质控规则、医学实体字典和科室-诊断映射保存在嵌入式SQLite数据库（data/mediqc.db）中：
+- 规则按ID索引，并建立名称索引；每次修改规则时版本号加1，历史版本保存在rule_history表
+- 医学实体按(实体类型, 实体名称)为主键保存，增删单个实体不需要重写整个字典
+- 所有写操作都在BEGIN IMMEDIATE事务中完成，多个进程同时写入不会互相覆盖
+- 每个命名空间（rules、entities、mapping）维护一个变更计数器，任何修改都会使计数器加1，
+  基于这些数据编译出的缓存（规则索引、实体匹配自动机等）可以据此判断是否需要重建
+
+首次打开数据库时，会从原有的JSON文件（data/rules.json、data/medical_entities.json、
+data/diagnosis_department_mapping.json）导入数据。
+"""
+import json
+import hashlib
+import threading
+from datetime import datetime
+from sqlite_utils import SQLiteDatabase
+
+# 数据库文件路径
+DATA_STORE_FILE = 'data/mediqc.db'
+
+# 首次初始化时导入的JSON文件
+RULES_JSON_FILE = 'data/rules.json'
+MEDICAL_ENTITIES_JSON_FILE = 'data/medical_entities.json'
+DIAGNOSIS_DEPT_MAPPING_JSON_FILE = 'data/diagnosis_department_mapping.json'
+
+# 变更计数器命名空间
+RULES = 'rules'
+ENTITIES = 'entities'
+MAPPING = 'mapping'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS change_counters (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    body TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rules_name ON rules(name);
+CREATE INDEX IF NOT EXISTS idx_rules_position ON rules(position);
+CREATE TABLE IF NOT EXISTS rule_history (
+    id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    body TEXT,
+    changed_at TEXT NOT NULL,
+    PRIMARY KEY (id, version)
+);
+CREATE TABLE IF NOT EXISTS entity_types (
+    entity_type TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entities (
+    entity_type TEXT NOT NULL,
+    term TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (entity_type, term)
+);
+CREATE INDEX IF NOT EXISTS idx_entities_term ON entities(term);
+CREATE TABLE IF NOT EXISTS dept_diagnosis (
+    dept TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (dept, diagnosis)
+);
+"""
+
+
+def _now():
+    """当前时间字符串"""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _read_json(path, default):
+    """读取用于初始导入的JSON文件"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        print(f"读取文件出错({path}): {str(e)}")
+        return default
+
+
+def _unique_rules(rules):
+    """去除ID重复的规则（保留第一条）"""
+    seen = set()
+    unique = []
+    for rule in rules:
+        if rule['id'] not in seen:
+            seen.add(rule['id'])
+            unique.append(rule)
+    return unique
+
+
+class DataStore:
+    """
+    基于SQLite的规则与字典存储
+
+    读取方法返回的列表/字典按变更计数器缓存，属于共享对象，调用方不应直接修改。
+    """
+
+    def __init__(self, path=DATA_STORE_FILE):
+        """
+        Args:
+            path (str): 数据库文件路径
+        """
+        self.path = path
+        self._db = SQLiteDatabase(path)
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self):
+        """创建数据表，并在首次初始化时从JSON文件导入数据"""
+        self._db.connect().executescript(SCHEMA)
+        with self._db.write_transaction() as conn:
+            initialized = {row['namespace'] for row in conn.execute('SELECT namespace FROM change_counters')}
+            if RULES not in initialized:
+                for position, rule in enumerate(_unique_rules(_read_json(RULES_JSON_FILE, []))):
+                    self._create_rule(conn, rule, position)
+                conn.execute('INSERT INTO change_counters VALUES (?, 1)', (RULES,))
+            if ENTITIES not in initialized:
+                self._insert_entities(conn, _read_json(MEDICAL_ENTITIES_JSON_FILE, {}))
+                conn.execute('INSERT INTO change_counters VALUES (?, 1)', (ENTITIES,))
+            if MAPPING not in initialized:
+                self._insert_mapping(conn, _read_json(DIAGNOSIS_DEPT_MAPPING_JSON_FILE, {}))
+                conn.execute('INSERT INTO change_counters VALUES (?, 1)', (MAPPING,))
+
+    # ---------- 变更计数器与缓存 ----------
+
+    def get_version(self, namespace):
+        """
+        获取命名空间的变更计数器
+
+        Args:
+            namespace (str): rules、entities或mapping
+
+        Returns:
+            int: 当前版本号，每次修改后加1
+        """
+        row = self._db.connect().execute(
+            'SELECT version FROM change_counters WHERE namespace = ?', (namespace,)
+        ).fetchone()
+        return row['version'] if row else 0
+
+    def _bump(self, conn, namespace):
+        """在写事务中将命名空间的变更计数器加1"""
+        conn.execute('UPDATE change_counters SET version = version + 1 WHERE namespace = ?', (namespace,))
+
+    def cached(self, namespace, name, builder):
+        """
+        获取按变更计数器缓存的派生数据，数据被修改（包括其他进程的修改）后自动重建
+
+        Args:
+            namespace (str): 派生数据依赖的命名空间
+            name (str): 派生数据名称
+            builder (callable): 无参数、返回派生数据的函数
+
+        Returns:
+            builder的返回值
+        """
+        version = self.get_version(namespace)
+        key = (namespace, name)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        value = builder()
+        with self._cache_lock:
+            self._cache[key] = (version, value)
+        return value
+
+    # ---------- 质控规则 ----------
+
+    def _create_rule(self, conn, rule, position):
+        """在写事务中插入一条新规则"""
+        last_version = conn.execute(
+            'SELECT COALESCE(MAX(version), 0) FROM rule_history WHERE id = ?', (rule['id'],)
+        ).fetchone()[0]
+        body = json.dumps(rule, ensure_ascii=False)
+        now = _now()
+        conn.execute(
+            'INSERT INTO rules (id, name, type, body, position, version, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (rule['id'], rule.get('name') or '', rule.get('type') or '', body, position, last_version + 1, now)
+        )
+        conn.execute(
+            'INSERT INTO rule_history (id, version, action, body, changed_at) VALUES (?, ?, ?, ?, ?)',
+            (rule['id'], last_version + 1, 'create', body, now)
+        )
+
+    def _update_rule(self, conn, rule, version, position=None):
+        """在写事务中更新一条已有规则，version为更新前的版本号"""
+        body = json.dumps(rule, ensure_ascii=False)
+        now = _now()
+        conn.execute(
+            'UPDATE rules SET name = ?, type = ?, body = ?, version = ?, updated_at = ?, '
+            'position = COALESCE(?, position) WHERE id = ?',
+            (rule.get('name') or '', rule.get('type') or '', body, version + 1, now, position, rule['id'])
+        )
+        conn.execute(
+            'INSERT INTO rule_history (id, version, action, body, changed_at) VALUES (?, ?, ?, ?, ?)',
+            (rule['id'], version + 1, 'update', body, now)
+        )
+
+    def _delete_rule(self, conn, rule_id, version):
+        """在写事务中删除一条规则，version为删除前的版本号"""
+        conn.execute('DELETE FROM rules WHERE id = ?', (rule_id,))
+        conn.execute(
+            'INSERT INTO rule_history (id, version, action, body, changed_at) VALUES (?, ?, ?, NULL, ?)',
+            (rule_id, version + 1, 'delete', _now())
+        )
+
+    def list_rules(self):
+        """
+        获取所有规则（按添加顺序）
+
+        Returns:
+            list: 规则字典列表
+        """
+        return self.cached(RULES, 'list', lambda: [
+            json.loads(row['body'])
+            for row in self._db.connect().execute('SELECT body FROM rules ORDER BY position')
+        ])
+
+    def get_rule(self, rule_id):
+        """按ID获取规则，不存在时返回None"""
+        row = self._db.connect().execute('SELECT body FROM rules WHERE id = ?', (rule_id,)).fetchone()
+        return json.loads(row['body']) if row else None
+
+    def get_rule_by_name(self, name):
+        """按名称获取规则（同名规则返回最早添加的一条），不存在时返回None"""
+        row = self._db.connect().execute(
+            'SELECT body FROM rules WHERE name = ? ORDER BY position LIMIT 1', (name,)
+        ).fetchone()
+        return json.loads(row['body']) if row else None
+
+    def get_rule_version(self, rule_id):
+        """获取规则的当前版本号，不存在时返回0"""
+        row = self._db.connect().execute('SELECT version FROM rules WHERE id = ?', (rule_id,)).fetchone()
+        return row['version'] if row else 0
+
+    def get_rule_history(self, rule_id):
+        """
+        获取规则的历史版本
+
+        Returns:
+            list: 按版本号排序的历史记录，每项包含version、action、rule、changed_at
+        """
+        rows = self._db.connect().execute(
+            'SELECT version, action, body, changed_at FROM rule_history WHERE id = ? ORDER BY version',
+            (rule_id,)
+        ).fetchall()
+        return [{
+            'version': row['version'],
+            'action': row['action'],
+            'rule': json.loads(row['body']) if row['body'] else None,
+            'changed_at': row['changed_at']
+        } for row in rows]
+
+    def add_rule(self, rule):
+        """
+        添加规则
+
+        Args:
+            rule (dict): 规则字典，必须包含id
+
+        Returns:
+            bool: 添加成功返回True，ID已存在返回False
+        """
+        with self._db.write_transaction() as conn:
+            if conn.execute('SELECT 1 FROM rules WHERE id = ?', (rule['id'],)).fetchone():
+                return False
+            position = conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM rules').fetchone()[0]
+            self._create_rule(conn, rule, position)
+            self._bump(conn, RULES)
+        return True
+
+    def update_rule(self, rule_id, rule):
+        """
+        更新规则（整条替换），版本号加1
+
+        Args:
+            rule_id (str): 规则ID
+            rule (dict): 新的规则内容，其id会被设置为rule_id
+
+        Returns:
+            bool: 更新成功返回True，规则不存在返回False
+        """
+        with self._db.write_transaction() as conn:
+            row = conn.execute('SELECT version FROM rules WHERE id = ?', (rule_id,)).fetchone()
+            if row is None:
+                return False
+            self._update_rule(conn, dict(rule, id=rule_id), row['version'])
+            self._bump(conn, RULES)
+        return True
+
+    def delete_rule(self, rule_id):
+        """
+        删除规则（历史版本中保留删除记录）
+
+        Returns:
+            bool: 删除成功返回True，规则不存在返回False
+        """
+        with self._db.write_transaction() as conn:
+            row = conn.execute('SELECT version FROM rules WHERE id = ?', (rule_id,)).fetchone()
+            if row is None:
+                return False
+            self._delete_rule(conn, rule_id, row['version'])
+            self._bump(conn, RULES)
+        return True
+
+    def replace_rules(self, rules):
+        """
+        用给定的规则列表整体替换所有规则（兼容旧的save_rules接口）
+
+        只有内容或顺序发生变化的规则才会产生新版本。
+
+        Args:
+            rules (list): 规则字典列表
+        """
+        rules = _unique_rules(rules)
+        with self._db.write_transaction() as conn:
+            existing = {row['id']: row for row in conn.execute('SELECT id, body, position, version FROM rules')}
+            new_ids = {rule['id'] for rule in rules}
+            for rule_id, row in existing.items():
+                if rule_id not in new_ids:
+                    self._delete_rule(conn, rule_id, row['version'])
+            for position, rule in enumerate(rules):
+                row = existing.get(rule['id'])
+                if row is None:
+                    self._create_rule(conn, rule, position)
+                elif json.loads(row['body']) != rule:
+                    self._update_rule(conn, rule, row['version'], position)
+                elif row['position'] != position:
+                    conn.execute('UPDATE rules SET position = ? WHERE id = ?', (position, rule['id']))
+            self._bump(conn, RULES)
+
+    # ---------- 医学实体字典 ----------
+
+    def _insert_entities(self, conn, entities):
+        """在写事务中批量插入实体字典"""
+        for type_position, (entity_type, terms) in enumerate(entities.items()):
+            conn.execute('INSERT OR REPLACE INTO entity_types VALUES (?, ?)', (entity_type, type_position))
+            conn.executemany(
+                'INSERT OR IGNORE INTO entities (entity_type, term, position) VALUES (?, ?, ?)',
+                [(entity_type, term, position) for position, term in enumerate(terms)]
+            )
+
+    def get_entities(self):
+        """
+        获取完整的医学实体字典
+
+        Returns:
+            dict: {实体类型: [实体名称, ...]}，类型和实体均保持添加顺序
+        """
+        def build():
+            conn = self._db.connect()
+            entities = {row['entity_type']: [] for row in
+                        conn.execute('SELECT entity_type FROM entity_types ORDER BY position')}
+            for row in conn.execute('SELECT entity_type, term FROM entities ORDER BY entity_type, position'):
+                entities.setdefault(row['entity_type'], []).append(row['term'])
+            return entities
+        return self.cached(ENTITIES, 'dict', build)
+
+    def iter_entities(self):
+        """
+        按类型顺序、添加顺序逐条读取实体，不缓存（用于编译大规模词典）
+
+        Yields:
+            tuple: (实体类型, 实体名称)
+        """
+        conn = self._db.connect()
+        yield from ((row['entity_type'], row['term']) for row in conn.execute(
+            'SELECT e.entity_type, e.term FROM entities e '
+            'LEFT JOIN entity_types t ON t.entity_type = e.entity_type '
+            'ORDER BY t.position IS NULL, t.position, e.entity_type, e.position'
+        ))
+
+    def get_entity_types(self):
+        """获取所有实体类型，按添加顺序排列"""
+        return [row['entity_type'] for row in
+                self._db.connect().execute('SELECT entity_type FROM entity_types ORDER BY position')]
+
+    def count_entities(self):
+        """实体总数"""
+        return self._db.connect().execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+    def get_entities_digest(self):
+        """
+        返回实体字典内容的SHA-256摘要（按类型顺序、添加顺序逐条计算实体类型和实体名称）
+
+        实体改名（即使长度不变）、调换顺序、增删实体类型都会改变摘要。与变更计数器一起标识字典的
+        一个版本，数据库重建后计数器重复时也不会误用旧的编译结果。不缓存，每次读取全部实体。
+        """
+        digest = hashlib.sha256()
+        for entity_type in self.get_entity_types():
+            digest.update(b'T' + entity_type.encode('utf-8') + b'\0')
+        for entity_type, term in self.iter_entities():
+            digest.update(b'E' + entity_type.encode('utf-8') + b'\0' + term.encode('utf-8') + b'\0')
+        return digest.hexdigest()
+
+    def has_entity(self, entity_type, term):
+        """判断实体是否存在"""
+        return self._db.connect().execute(
+            'SELECT 1 FROM entities WHERE entity_type = ? AND term = ?', (entity_type, term)
+        ).fetchone() is not None
+
+    def find_entity_types(self, term):
+        """查找包含指定实体名称的所有实体类型"""
+        return [row['entity_type'] for row in self._db.connect().execute(
+            'SELECT entity_type FROM entities WHERE term = ?', (term,)
+        )]
+
+    def add_entity(self, entity_type, term):
+        """
+        添加实体，实体类型不存在时自动创建
+
+        Returns:
+            bool: 添加成功返回True，实体已存在返回False
+        """
+        with self._db.write_transaction() as conn:
+            if conn.execute('SELECT 1 FROM entity_types WHERE entity_type = ?', (entity_type,)).fetchone() is None:
+                type_position = conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM entity_types').fetchone()[0]
+                conn.execute('INSERT INTO entity_types VALUES (?, ?)', (entity_type, type_position))
+            position = conn.execute(
+                'SELECT COALESCE(MAX(position), -1) + 1 FROM entities WHERE entity_type = ?', (entity_type,)
+            ).fetchone()[0]
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO entities (entity_type, term, position) VALUES (?, ?, ?)',
+                (entity_type, term, position)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._bump(conn, ENTITIES)
+        return True
+
+    def delete_entity(self, entity_type, term):
+        """
+        删除实体
+
+        Returns:
+            bool: 删除成功返回True，实体不存在返回False
+        """
+        with self._db.write_transaction() as conn:
+            cursor = conn.execute('DELETE FROM entities WHERE entity_type = ? AND term = ?', (entity_type, term))
+            if cursor.rowcount == 0:
+                return False
+            self._bump(conn, ENTITIES)
+        return True
+
+    def replace_entities(self, entities):
+        """
+        用给定的字典整体替换医学实体字典（兼容旧的save_medical_entities接口）
+
+        Args:
+            entities (dict): {实体类型: [实体名称, ...]}
+        """
+        with self._db.write_transaction() as conn:
+            conn.execute('DELETE FROM entities')
+            conn.execute('DELETE FROM entity_types')
+            self._insert_entities(conn, entities)
+            self._bump(conn, ENTITIES)
+
+    # ---------- 科室与诊断映射 ----------
+
+    def _insert_mapping(self, conn, mapping):
+        """在写事务中批量插入科室与诊断映射"""
+        for dept, diagnoses in mapping.items():
+            conn.executemany(
+                'INSERT OR IGNORE INTO dept_diagnosis (dept, diagnosis, position) VALUES (?, ?, ?)',
+                [(dept, diagnosis, position) for position, diagnosis in enumerate(diagnoses)]
+            )
+
+    def get_diagnosis_dept_mapping(self):
+        """
+        获取科室与诊断映射
+
+        Returns:
+            dict: {科室: [诊断关键词, ...]}
+        """
+        def build():
+            mapping = {}
+            for row in self._db.connect().execute(
+                    'SELECT dept, diagnosis FROM dept_diagnosis ORDER BY rowid'):
+                mapping.setdefault(row['dept'], []).append(row['diagnosis'])
+            return mapping
+        return self.cached(MAPPING, 'dict', build)
+
+    def replace_diagnosis_dept_mapping(self, mapping):
+        """用给定的字典整体替换科室与诊断映射"""
+        with self._db.write_transaction() as conn:
+            conn.execute('DELETE FROM dept_diagnosis')
+            self._insert_mapping(conn, mapping)
+            self._bump(conn, MAPPING)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_data_store():
+    """获取进程内共享的规则与字典存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DataStore()
+    return _store
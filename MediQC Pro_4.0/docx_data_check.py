@@ -1,7 +1,6 @@
 import os
 import re
 import pandas as pd
-from docx import Document
 import json
 from datetime import datetime
 import logging
@@ -720,6 +719,9 @@ class DocxDataExtractor:
             dict: 提取的数据字段及其值
         """
         try:
+            # python-docx仅在处理Word文档时导入，避免拖慢应用启动
+            from docx import Document
+            
             # 打开Word文档
             doc = Document(docx_path)
             
@@ -1112,6 +1114,7 @@ class DocxResultGenerator:
         """
         try:
             # 打开原始文档
+            from docx import Document
             doc = Document(docx_path)
             
             # 如果未指定输出路径，则自动生成
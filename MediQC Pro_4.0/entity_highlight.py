@@ -0,0 +1,131 @@
+"""
+实体高亮HTML生成模块
+
+将识别结果转换为(起始位置, 结束位置, 实体类型)区间，按位置顺序一次遍历原文生成
+高亮HTML：原文和实体都经过HTML转义，耗时与文本长度加实体数量成正比。
+超长文本可使用分块生成器逐段输出。
+"""
+import html
+
+# 分块输出时每块的目标字符数
+DEFAULT_CHUNK_SIZE = 8192
+
+
+def spans_from_entities(text, recognized_entities):
+    """
+    将按类型分组的识别结果转换为区间列表
+
+    位置越界或原文在该位置不是该实体的结果会被忽略。
+
+    Args:
+        text (str): 原文
+        recognized_entities (dict): {实体类型: [{'entity': 实体, 'position': 位置, ...}, ...]}
+
+    Returns:
+        list: [(起始位置, 结束位置, 实体类型), ...]，未排序
+    """
+    spans = []
+    for entity_type, entities in recognized_entities.items():
+        for entity_info in entities:
+            entity = entity_info.get('entity')
+            pos = entity_info.get('position')
+            if not entity or not isinstance(pos, int) or pos < 0:
+                continue
+            end = pos + len(entity)
+            if end <= len(text) and text[pos:end] == entity:
+                spans.append((pos, end, entity_type))
+    return spans
+
+
+def non_overlapping(spans):
+    """
+    从可能重叠的区间中选出互不重叠的区间：从左到右，起始位置相同时保留最长的区间
+
+    Args:
+        spans (list): [(起始位置, 结束位置, 实体类型), ...]
+
+    Returns:
+        list: 按起始位置排序、互不重叠的区间列表
+    """
+    selected = []
+    last_end = 0
+    for span in sorted(spans, key=lambda s: (s[0], -s[1])):
+        if span[0] >= last_end and span[1] > span[0]:
+            selected.append(span)
+            last_end = span[1]
+    return selected
+
+
+def _span_html(text, span):
+    start, end, entity_type = span
+    entity_type = str(entity_type)
+    return (f'<span class="entity-highlight {html.escape(entity_type.lower())}" '
+            f'title="{html.escape(entity_type)}">{html.escape(text[start:end], quote=False)}</span>')
+
+
+def iter_highlighted_html(text, spans, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    分块生成高亮HTML
+
+    Args:
+        text (str): 原文
+        spans (list): 按起始位置排序、互不重叠的区间列表（可先调用non_overlapping）
+        chunk_size (int): 每块的目标字符数
+
+    Yields:
+        str: HTML片段，依次拼接即为完整的高亮HTML
+    """
+    buffer = []
+    size = 0
+    pos = 0
+    for span in list(spans) + [(len(text), len(text), None)]:
+        start = span[0]
+        # 实体之前的普通文本，过长时按块切分
+        while pos < start:
+            piece_end = min(start, pos + chunk_size)
+            piece = html.escape(text[pos:piece_end], quote=False)
+            buffer.append(piece)
+            size += len(piece)
+            pos = piece_end
+            if size >= chunk_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if span[2] is None:
+            break
+        piece = _span_html(text, span)
+        buffer.append(piece)
+        size += len(piece)
+        pos = span[1]
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def render_highlighted_html(text, spans):
+    """
+    一次生成完整的高亮HTML
+
+    Args:
+        text (str): 原文
+        spans (list): 按起始位置排序、互不重叠的区间列表
+
+    Returns:
+        str: 转义后的高亮HTML
+    """
+    return ''.join(iter_highlighted_html(text, spans, chunk_size=len(text) + 1))
+
+
+def highlight_entities(text, recognized_entities):
+    """
+    根据按类型分组的识别结果生成高亮HTML，重叠的实体只高亮从左到右最先开始的最长实体
+
+    Args:
+        text (str): 原文
+        recognized_entities (dict): {实体类型: [{'entity': 实体, 'position': 位置, ...}, ...]}
+
+    Returns:
+        str: 转义后的高亮HTML
+    """
+    return render_highlighted_html(text, non_overlapping(spans_from_entities(text, recognized_entities)))
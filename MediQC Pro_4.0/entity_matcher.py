@@ -0,0 +1,551 @@
+"""
+医学实体词典匹配模块
+
+将规则库中的医学实体字典（由medical_entities.json导入）和llm_ner.MEDICAL_ENTITY_DICT
+编译为一个Aho-Corasick多模式匹配自动机，一次线性扫描即可找出文本中所有词典实体，
+耗时与文本长度和匹配数量成正比，与词典规模基本无关。
+
+自动机与规则库的实体变更计数器绑定：本进程通过/add_entity、/delete_entity修改字典时
+增量更新自动机（新增实体后失败链接在下一次匹配前重建），其他进程修改字典后计数器变化，
+下一次匹配前整体重建。
+
+词条数达到COMPILED_DICTIONARY_MIN_TERMS（如导入ICD-10和药品目录后的几十万词条）时，
+自动机编译为按词典指纹命名的二进制文件（见compiled_automaton），各工作进程以只读方式
+映射同一个文件，不再各自构建一份；只有词典变化后才重新编译。
+"""
+import os
+import json
+import time
+import heapq
+import hashlib
+import threading
+from data_store import get_data_store, ENTITIES
+from compiled_automaton import CompiledAutomaton, write_compiled_automaton, read_fingerprint
+
+# 词典来源
+SOURCE_CUSTOM = 'custom'    # 规则库中的医学实体字典（可在实体识别页面维护）
+SOURCE_BUILTIN = 'builtin'  # llm_ner.MEDICAL_ENTITY_DICT内置词典
+
+# 上下文窗口：实体前后各保留的字符数
+CONTEXT_SIZE = 10
+
+# 编译后的词典文件目录（文件按词典指纹命名）
+COMPILED_DICTIONARY_DIR = 'artifacts/compiled_dictionary'
+
+# 词条总数达到该值时使用编译文件，较小的词典直接在进程内构建
+COMPILED_DICTIONARY_MIN_TERMS = 50000
+
+# 编译锁文件超过该时间（秒）视为失效；等待其他进程编译时的重试间隔（秒）
+COMPILE_LOCK_TIMEOUT_SECONDS = 600
+COMPILE_RETRY_SECONDS = 1.0
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick多模式字符串匹配自动机
+
+    每个模式可以携带多个载荷（如实体类型），匹配结果为(起始位置, 模式, 载荷列表)。
+    """
+
+    def __init__(self):
+        self._goto = [{}]         # 每个状态的转移表 {字符: 状态}
+        self._fail = [0]          # 失败链接
+        self._link = [0]          # 输出链接：最近的、有载荷的后缀状态
+        self._pattern = [None]    # 以该状态结尾的模式
+        self._payloads = [[]]     # 以该状态结尾的模式的载荷
+        self._dirty = False
+        self.pattern_count = 0
+
+    def __len__(self):
+        return self.pattern_count
+
+    def _state_of(self, pattern, create=False):
+        """返回模式对应的状态，create为True时沿途创建缺失的状态"""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                if not create:
+                    return None
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._link.append(0)
+                self._pattern.append(None)
+                self._payloads.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        return state
+
+    def add(self, pattern, payload):
+        """
+        添加模式及其载荷，已存在相同载荷时忽略
+
+        Returns:
+            bool: 是否添加了新的载荷
+        """
+        if not pattern:
+            return False
+        state = self._state_of(pattern, create=True)
+        if payload in self._payloads[state]:
+            return False
+        if not self._payloads[state]:
+            # 状态第一次成为模式终点：需要重建输出链接
+            self.pattern_count += 1
+            self._pattern[state] = pattern
+            self._dirty = True
+        self._payloads[state].append(payload)
+        return True
+
+    def remove(self, pattern, payload):
+        """
+        删除模式的一个载荷，模式的载荷全部删除后不再被匹配
+
+        只清空终点状态的载荷，不改变状态结构，因此无需重建失败链接；
+        输出链接可能经过已无载荷的状态，匹配时会跳过这些状态。
+
+        Returns:
+            bool: 是否删除成功
+        """
+        state = self._state_of(pattern)
+        if state is None or payload not in self._payloads[state]:
+            return False
+        self._payloads[state].remove(payload)
+        if not self._payloads[state]:
+            self.pattern_count -= 1
+        return True
+
+    def build(self):
+        """按广度优先顺序计算失败链接和输出链接"""
+        goto, fail, link, payloads = self._goto, self._fail, self._link, self._payloads
+        queue = []
+        for state in goto[0].values():
+            fail[state] = 0
+            link[state] = 0
+            queue.append(state)
+        for state in queue:
+            for char, next_state in goto[state].items():
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(char, 0)
+                fail[next_state] = f
+                link[next_state] = f if payloads[f] else link[f]
+                queue.append(next_state)
+        self._dirty = False
+
+    def iter_matches(self, text):
+        """
+        扫描文本，按结束位置顺序产生所有匹配
+
+        Yields:
+            tuple: (起始位置, 模式, 载荷列表)
+        """
+        if self._dirty:
+            self.build()
+        goto, fail, link, pattern, payloads = self._goto, self._fail, self._link, self._pattern, self._payloads
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            s = state if payloads[state] else link[state]
+            while s:
+                if payloads[s]:
+                    matched = pattern[s]
+                    yield i - len(matched) + 1, matched, payloads[s]
+                s = link[s]
+
+
+class EntityMatcher:
+    """
+    基于Aho-Corasick自动机的医学实体词典匹配器
+
+    载荷为(来源, 实体类型)，实体类型和实体在词典中的顺序另行记录，
+    识别结果的顺序与逐词查找时一致：按实体类型、词典顺序、出现位置排列。
+
+    大规模词典使用映射到内存的编译文件（compiled_automaton.CompiledAutomaton）作为基础
+    自动机，此时增量添加的实体保存在进程内的小自动机中，删除的实体记录为墓碑，
+    直到下一次编译文件时合并。
+    """
+
+    def __init__(self, version=None, compiled=None):
+        self.version = version
+        self._automaton = AhoCorasick()
+        self._compiled = compiled
+        self._removed = set()     # 从编译文件中删除的实体 {(来源, 实体类型, 实体)}
+        self._type_order = {}     # {来源: {实体类型: 序号}}
+        self._term_order = {}     # {(来源, 实体类型, 实体): 序号}，仅记录进程内自动机中的实体
+        self._next_term = {}      # {(来源, 实体类型): 下一个实体序号}
+        self._lock = threading.RLock()
+        if compiled is not None:
+            for source, entity_types in compiled.metadata.get('type_order', {}).items():
+                for entity_type in entity_types:
+                    self._register_type(source, entity_type)
+            for source, entity_type, count in compiled.metadata.get('next_term', []):
+                self._next_term[(source, entity_type)] = count
+
+    @classmethod
+    def from_dicts(cls, dictionaries, version=None):
+        """
+        从多个来源的实体字典构建匹配器
+
+        Args:
+            dictionaries (dict): {来源: {实体类型: [实体, ...]}}
+            version: 构建时的实体变更计数器
+
+        Returns:
+            EntityMatcher: 匹配器
+        """
+        matcher = cls(version)
+        for source, entity_dict in dictionaries.items():
+            for entity_type, terms in entity_dict.items():
+                matcher._register_type(source, entity_type)
+                for term in terms:
+                    matcher._add(source, entity_type, term)
+        matcher._automaton.build()
+        return matcher
+
+    def __len__(self):
+        count = len(self._automaton)
+        if self._compiled is not None:
+            count += len(self._compiled) - len(self._removed)
+        return count
+
+    @property
+    def compiled(self):
+        """是否使用编译后的词典文件"""
+        return self._compiled is not None
+
+    def entity_types(self, sources=(SOURCE_CUSTOM,)):
+        """词典中的实体类型，按来源和词典顺序排列（不重复）"""
+        with self._lock:
+            types = []
+            for source in sources:
+                for entity_type in sorted(self._type_order.get(source, {}), key=self._type_order[source].get):
+                    if entity_type not in types:
+                        types.append(entity_type)
+            return types
+
+    def _register_type(self, source, entity_type):
+        types = self._type_order.setdefault(source, {})
+        if entity_type not in types:
+            types[entity_type] = len(types)
+
+    def _in_compiled(self, source, entity_type, term):
+        if self._compiled is None or (source, entity_type, term) in self._removed:
+            return False
+        return any(p[0] == source and p[1] == entity_type for p in self._compiled.lookup(term))
+
+    def _add(self, source, entity_type, term):
+        if self._in_compiled(source, entity_type, term):
+            return False
+        if not self._automaton.add(term, (source, entity_type)):
+            return False
+        key = (source, entity_type)
+        self._term_order[(source, entity_type, term)] = self._next_term.get(key, 0)
+        self._next_term[key] = self._next_term.get(key, 0) + 1
+        return True
+
+    def add(self, entity_type, term, source=SOURCE_CUSTOM):
+        """增量添加实体（新实体排在该类型末尾），返回是否添加成功"""
+        with self._lock:
+            self._register_type(source, entity_type)
+            return self._add(source, entity_type, term)
+
+    def remove(self, entity_type, term, source=SOURCE_CUSTOM):
+        """增量删除实体，返回是否删除成功"""
+        with self._lock:
+            if self._automaton.remove(term, (source, entity_type)):
+                self._term_order.pop((source, entity_type, term), None)
+                return True
+            if self._in_compiled(source, entity_type, term):
+                self._removed.add((source, entity_type, term))
+                return True
+            return False
+
+    def _iter_matches(self, text):
+        """合并编译文件和进程内自动机的匹配，产生(起始位置, 实体, [(来源, 实体类型, 词典顺序), ...])"""
+        term_order = self._term_order
+        local = ((start, term, [(source, entity_type, term_order.get((source, entity_type, term), 0))
+                                for source, entity_type in payloads])
+                 for start, term, payloads in self._automaton.iter_matches(text))
+        if self._compiled is None:
+            return local
+        removed = self._removed
+        base = self._compiled.iter_matches(text)
+        if removed:
+            base = ((start, term, [p for p in payloads if (p[0], p[1], term) not in removed])
+                    for start, term, payloads in base)
+        if not len(self._automaton):
+            return base
+        return heapq.merge(base, local, key=lambda match: match[0] + len(match[1]))
+
+    def _find(self, text, sources):
+        last_end = {}
+        for start, term, payloads in self._iter_matches(text):
+            if start < last_end.get(term, 0):
+                continue
+            selected = [p for p in payloads if p[0] in sources]
+            if not selected:
+                continue
+            last_end[term] = start + len(term)
+            for source, entity_type, order in selected:
+                yield start, term, source, entity_type, order
+
+    def find(self, text, sources=(SOURCE_CUSTOM,)):
+        """
+        找出文本中所有词典实体
+
+        同一实体的多次出现互不重叠（与逐词调用str.find的结果一致），
+        不同实体之间可以重叠（如“头”和“头痛”）。
+
+        Args:
+            text (str): 待识别的文本
+            sources (tuple): 参与匹配的词典来源
+
+        Returns:
+            list: [(起始位置, 实体, 来源, 实体类型), ...]，按结束位置排序
+        """
+        with self._lock:
+            return [match[:4] for match in self._find(text, sources)]
+
+    def recognize(self, text, sources=(SOURCE_CUSTOM,), context_size=CONTEXT_SIZE):
+        """
+        识别文本中的医学实体
+
+        多个来源包含同一实体类型时合并为一组，同一位置的相同实体只保留一次。
+
+        Args:
+            text (str): 待识别的文本
+            sources (tuple): 参与匹配的词典来源，排在前面的来源决定实体类型的顺序
+            context_size (int): 上下文窗口大小
+
+        Returns:
+            dict: 识别到的实体字典，按实体类型分组
+                  {实体类型: [{'entity': 实体, 'position': 位置, 'context': 上下文}, ...]}
+        """
+        keyed = []
+        seen = set()
+        with self._lock:
+            type_ranks = {}
+            for source_rank, source in enumerate(sources):
+                for entity_type, order in self._type_order.get(source, {}).items():
+                    type_ranks.setdefault(entity_type, (source_rank, order))
+            for start, term, source, entity_type, order in self._find(text, sources):
+                if (entity_type, term, start) in seen:
+                    continue
+                seen.add((entity_type, term, start))
+                keyed.append((type_ranks[entity_type], (sources.index(source), order), start, entity_type, term))
+        keyed.sort()
+
+        recognized = {}
+        for _, _, start, entity_type, term in keyed:
+            context_start = max(0, start - context_size)
+            context_end = min(len(text), start + len(term) + context_size)
+            recognized.setdefault(entity_type, []).append({
+                'entity': term,
+                'position': start,
+                'context': text[context_start:context_end]
+            })
+        return recognized
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+_retry_at = 0.0
+_builtin_digest = None
+
+
+def _builtin_dict():
+    """内置词典（llm_ner依赖本模块，因此在函数内导入）"""
+    from llm_ner import MEDICAL_ENTITY_DICT
+    return MEDICAL_ENTITY_DICT
+
+
+def _fingerprint(store):
+    """
+    计算当前词典的指纹：实体变更计数器、规则库字典内容摘要和内置词典摘要
+
+    Returns:
+        tuple: (指纹, 实体变更计数器)
+    """
+    global _builtin_digest
+    if _builtin_digest is None:
+        _builtin_digest = hashlib.sha1(json.dumps(_builtin_dict(), ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+    version = store.get_version(ENTITIES)
+    return f'{version}-{store.get_entities_digest()[:16]}-{_builtin_digest}', version
+
+
+def _term_count(store):
+    """规则库字典和内置词典的词条总数"""
+    return store.count_entities() + sum(len(terms) for terms in _builtin_dict().values())
+
+
+def _compiled_path(fingerprint):
+    return os.path.join(COMPILED_DICTIONARY_DIR, fingerprint + '.bin')
+
+
+def _build_in_memory(store, version):
+    """在进程内构建匹配器（逐条读取规则库字典，不缓存完整字典）"""
+    matcher = EntityMatcher(version)
+    for entity_type in store.get_entity_types():
+        matcher._register_type(SOURCE_CUSTOM, entity_type)
+    for entity_type, term in store.iter_entities():
+        matcher._register_type(SOURCE_CUSTOM, entity_type)
+        matcher._add(SOURCE_CUSTOM, entity_type, term)
+    for entity_type, terms in _builtin_dict().items():
+        matcher._register_type(SOURCE_BUILTIN, entity_type)
+        for term in terms:
+            matcher._add(SOURCE_BUILTIN, entity_type, term)
+    matcher._automaton.build()
+    return matcher
+
+
+def compile_dictionary(store):
+    """
+    将当前词典编译为文件（文件已是最新时直接返回）
+
+    用锁文件保证同一版本只由一个进程编译，编译完成后删除其他版本的文件。
+    编译期间词典被修改时放弃本次结果，避免文件内容与指纹不符。
+
+    Returns:
+        tuple: (编译文件路径, 实体变更计数器)；其他进程正在编译或编译期间词典被修改时路径为None
+    """
+    fingerprint, version = _fingerprint(store)
+    path = _compiled_path(fingerprint)
+    if read_fingerprint(path) == fingerprint:
+        return path, version
+
+    os.makedirs(COMPILED_DICTIONARY_DIR, exist_ok=True)
+    lock_path = path + '.lock'
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) < COMPILE_LOCK_TIMEOUT_SECONDS:
+                return None, version
+            os.remove(lock_path)
+        except OSError:
+            return None, version
+        return compile_dictionary(store)
+
+    try:
+        os.close(fd)
+        if read_fingerprint(path) == fingerprint:
+            return path, version
+        started = time.time()
+        matcher = _build_in_memory(store, version)
+        write_compiled_automaton(matcher._automaton, path, fingerprint, matcher._term_order, metadata={
+            'type_order': {source: list(types) for source, types in matcher._type_order.items()},
+            'next_term': [[source, entity_type, count] for (source, entity_type), count in matcher._next_term.items()]
+        })
+        print(f"实体词典已编译: {path}（{len(matcher)} 个词条，耗时 {time.time() - started:.1f}s）")
+        del matcher
+        if _fingerprint(store)[0] != fingerprint:
+            os.remove(path)
+            return None, version
+        for name in os.listdir(COMPILED_DICTIONARY_DIR):
+            if name.endswith('.bin') and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(COMPILED_DICTIONARY_DIR, name))
+                except OSError:
+                    # Windows下其他进程仍在映射旧文件时无法删除，留待下次清理
+                    pass
+        return path, version
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def _load_matcher(store, version, current):
+    """
+    加载当前版本的匹配器
+
+    小词典直接在进程内构建；大词典映射编译文件，文件不存在时由本进程编译。其他进程
+    正在编译时，若已有旧版本的匹配器则暂时继续使用，否则等待编译完成。
+    """
+    global _retry_at
+    if _term_count(store) < COMPILED_DICTIONARY_MIN_TERMS:
+        return EntityMatcher.from_dicts({
+            SOURCE_CUSTOM: store.get_entities(),
+            SOURCE_BUILTIN: _builtin_dict()
+        }, version=version)
+
+    deadline = time.time() + COMPILE_LOCK_TIMEOUT_SECONDS
+    while True:
+        path, compiled_version = compile_dictionary(store)
+        if path is not None:
+            return EntityMatcher(compiled_version, compiled=CompiledAutomaton(path))
+        if current is not None:
+            _retry_at = time.monotonic() + COMPILE_RETRY_SECONDS
+            return current
+        if time.time() > deadline:
+            return _build_in_memory(store, version)
+        time.sleep(COMPILE_RETRY_SECONDS)
+
+
+def get_entity_matcher():
+    """
+    获取与规则库实体字典同步的共享匹配器，字典被其他进程修改后自动重建
+
+    Returns:
+        EntityMatcher: 匹配器
+    """
+    global _matcher
+    store = get_data_store()
+    version = store.get_version(ENTITIES)
+    matcher = _matcher
+    if matcher is not None and (matcher.version == version or time.monotonic() < _retry_at):
+        return matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher.version != version:
+            _matcher = _load_matcher(store, version, _matcher)
+        return _matcher
+
+
+def _recompile():
+    """后台编译本进程修改后的词典，完成后改用新的编译文件（丢弃进程内的增量部分）"""
+    global _matcher
+    try:
+        path, version = compile_dictionary(get_data_store())
+    except Exception as e:
+        print(f"编译实体词典出错: {str(e)}")
+        return
+    if path is None:
+        return
+    with _matcher_lock:
+        if _matcher is not None and _matcher.version == version:
+            _matcher = EntityMatcher(version, compiled=CompiledAutomaton(path))
+
+
+def _apply_change(apply):
+    """
+    将本进程刚提交的一次字典修改增量应用到共享匹配器
+
+    只有当变更计数器恰好比匹配器的版本大1（即期间没有其他修改）时才增量更新，
+    否则保持原样，由下一次get_entity_matcher()整体重建。使用编译文件时，
+    随后在后台重新编译，其他进程在新文件就绪前继续使用旧版本。
+    """
+    with _matcher_lock:
+        matcher = _matcher
+        if matcher is None:
+            return
+        version = get_data_store().get_version(ENTITIES)
+        if matcher.version is not None and version == matcher.version + 1:
+            apply(matcher)
+            matcher.version = version
+            if matcher.compiled:
+                threading.Thread(target=_recompile, daemon=True).start()
+
+
+def entity_added(entity_type, term):
+    """规则库添加实体后调用，增量更新共享匹配器"""
+    _apply_change(lambda matcher: matcher.add(entity_type, term))
+
+
+def entity_removed(entity_type, term):
+    """规则库删除实体后调用，增量更新共享匹配器"""
+    _apply_change(lambda matcher: matcher.remove(entity_type, term))
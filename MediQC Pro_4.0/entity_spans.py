@@ -0,0 +1,129 @@
+"""
+实体区间集合模块
+
+规则和词典识别的结果统一表示为(起始位置, 结束位置, 实体类型)区间，用集合去重，
+并消解重叠：resolve()按“最长者优先、等长时优先级高者优先”的策略，resolve_layers()按优先级
+分层（如词典结果优先，正则规则只补充词典未覆盖的部分），整体耗时为O(n log n)，
+不再对每个匹配线性扫描已有结果。
+"""
+from bisect import bisect_right
+
+# 上下文窗口：实体前后各保留的字符数
+CONTEXT_SIZE = 10
+
+
+class SpanSet:
+    """按(起始位置, 结束位置, 实体类型)去重的实体区间集合，每个区间带有优先级"""
+
+    def __init__(self):
+        self._spans = {}    # {(起始位置, 结束位置, 实体类型): 优先级}，保持添加顺序
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, span):
+        return span in self._spans
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def priority(self, span):
+        """区间的优先级"""
+        return self._spans[span]
+
+    def add(self, start, end, entity_type, priority=0):
+        """
+        添加区间，重复添加时保留较高的优先级
+
+        Returns:
+            bool: 是否为新区间
+        """
+        if end <= start:
+            return False
+        key = (start, end, entity_type)
+        old = self._spans.get(key)
+        if old is None:
+            self._spans[key] = priority
+            return True
+        if priority > old:
+            self._spans[key] = priority
+        return False
+
+    def spans(self):
+        """返回所有区间（可能重叠），按起始位置、结束位置排序"""
+        return sorted(self._spans, key=lambda s: (s[0], s[1]))
+
+    def resolve(self):
+        """
+        消解重叠区间：较长者优先，等长时优先级高者优先，仍相同时先添加者优先
+
+        Returns:
+            list: 互不重叠的区间列表，按起始位置排序
+        """
+        ordered = sorted(self._spans.items(), key=lambda item: (item[0][0] - item[0][1], -item[1]))
+        return merge_layers([span for span, _ in ordered])
+
+    def resolve_layers(self):
+        """
+        按优先级分层消解重叠区间：优先级高的区间先选（同一优先级中较长者优先，仍相同时先添加者优先），
+        优先级低的区间只能填补未被覆盖的位置
+
+        Returns:
+            list: 互不重叠的区间列表，按起始位置排序
+        """
+        layers = {}
+        for span, priority in self._spans.items():
+            layers.setdefault(priority, []).append(span)
+        return merge_layers(*(sorted(layers[priority], key=lambda s: s[0] - s[1])
+                              for priority in sorted(layers, reverse=True)))
+
+
+def merge_layers(*layers):
+    """
+    按层合并区间：前面的层优先，后面的层中与已选区间重叠的区间被丢弃
+
+    Args:
+        layers: 若干个区间列表（如SpanSet.resolve()的结果），按优先级从高到低排列；
+            同一层中重叠的区间先出现者优先
+
+    Returns:
+        list: 互不重叠的区间列表，按起始位置排序
+    """
+    starts = []
+    ends = []
+    selected = []
+    for layer in layers:
+        for span in layer:
+            start, end = span[0], span[1]
+            i = bisect_right(starts, start)
+            if i and ends[i - 1] > start:
+                continue
+            if i < len(starts) and starts[i] < end:
+                continue
+            starts.insert(i, start)
+            ends.insert(i, end)
+            selected.insert(i, span)
+    return selected
+
+
+def spans_to_entities(text, spans, entity_types=(), context_size=CONTEXT_SIZE):
+    """
+    将区间列表转换为按类型分组的识别结果
+
+    Args:
+        text (str): 原文
+        spans (list): 按起始位置排序的区间列表
+        entity_types (iterable): 结果中需要保留（即使没有实体）的实体类型，决定类型顺序
+        context_size (int): 上下文窗口大小
+
+    Returns:
+        dict: {实体类型: [{'entity': 实体, 'position': 位置, 'context': 上下文}, ...]}
+    """
+    entities_by_type = {entity_type: [] for entity_type in entity_types}
+    for start, end, entity_type in spans:
+        entities_by_type.setdefault(entity_type, []).append({
+            'entity': text[start:end],
+            'position': start,
+            'context': text[max(0, start - context_size):min(len(text), end + context_size)]
+        })
+    return entities_by_type
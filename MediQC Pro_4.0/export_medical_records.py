@@ -6,7 +6,6 @@
 将病案首页数据导出为Excel格式，以便与电子病历质控系统集成
 """
 
-import mysql.connector
 import pandas as pd
 import sys
 import getpass
@@ -14,6 +13,9 @@ from datetime import datetime
 
 # 获取数据库连接配置
 def get_db_config():
+    # MySQL驱动只在命令行导出时需要，Web应用导入本模块时不加载
+    import mysql.connector
+    
     print("请输入MySQL数据库连接信息：")
     host = input("主机地址 (默认: localhost): ") or "localhost"
     user = input("用户名 (默认: root): ") or "root"
@@ -183,6 +185,8 @@ def export_admissions(conn):
 
 # 主函数
 def main():
+    import mysql.connector
+    
     try:
         print("="*50)
         print("医院电子病历数据导出脚本")
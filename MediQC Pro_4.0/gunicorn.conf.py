@@ -0,0 +1,25 @@
+"""
+gunicorn配置文件
+
+主进程加载wsgi模块时完成预热（preload_app），然后fork工作进程，工作进程通过写时复制
+共享预热好的规则、医学实体字典和模型。用法（在MediQC Pro_4.0目录下运行）：
+
+    gunicorn -c gunicorn.conf.py
+"""
+import os
+import multiprocessing
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('MEDIQC_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MEDIQC_WORKERS', multiprocessing.cpu_count()))
+
+# 在主进程中导入应用并预热，再fork工作进程
+preload_app = True
+
+# Word检查和实体识别请求可能较慢
+timeout = int(os.environ.get('MEDIQC_TIMEOUT', 120))
+
+# 工作进程处理一定数量的请求后重启，加上随机抖动避免同时重启
+max_requests = int(os.environ.get('MEDIQC_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
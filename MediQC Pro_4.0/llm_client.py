@@ -0,0 +1,259 @@
+"""
+大模型API客户端模块
+
+原来每次调用API都新建一个requests会话：每次都要重新建立TLS连接，没有超时（API无响应时
+工作线程会一直阻塞），没有重试。本模块为每个API地址维护一个长期使用的客户端：
+- 连接池：同一地址的请求复用keep-alive连接
+- 超时：分别设置连接超时和读取超时
+- 重试：连接失败、超时以及429/5xx响应时有限次重试，退避时间加随机抖动，避免多个工作进程同时重试；
+  响应带Retry-After时按其等待
+- 限流：可按地址限制每秒请求数（令牌桶），并发分块请求时不会超过API的速率限制
+- 熔断：连续失败达到阈值后一段时间内直接失败（调用方降级为规则匹配），之后放行一个试探请求，
+  成功则恢复
+
+日志中只输出地址、状态码和耗时，不输出请求头（含API密钥）和请求内容（含病历文本）。
+"""
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+# 超时（秒）
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS = 60
+
+# 重试：最多重试次数和退避时间（秒）
+MAX_RETRIES = 2
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8
+RETRY_AFTER_MAX_SECONDS = 30
+
+# 需要重试的响应状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 连接池大小（每个地址）
+POOL_MAXSIZE = 16
+
+# 熔断：连续失败次数阈值和熔断持续时间（秒）
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝的请求"""
+
+
+class RateLimiter:
+    """令牌桶限流：平均每秒rate个请求，最多允许burst个突发请求"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，没有令牌时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TokenUsage:
+    """一次识别中各API请求的token用量（线程安全，并发请求可共用一个）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, completion_tokens):
+        """记录一次成功请求的token用量"""
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，熔断结束后放行一个试探请求"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许发送请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                # 熔断结束，只放行一个试探请求
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"API连续失败{self.failures}次，暂停请求{self.reset_seconds}秒")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    """一个API地址的客户端（线程安全，可在多个线程中共用）"""
+
+    def __init__(self, verify_ssl=False, connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                 read_timeout=READ_TIMEOUT_SECONDS, max_retries=MAX_RETRIES, rate_limit=0,
+                 pool_maxsize=POOL_MAXSIZE, breaker=None):
+        """
+        Args:
+            verify_ssl (bool): 是否验证SSL证书
+            connect_timeout (float): 连接超时（秒）
+            read_timeout (float): 读取超时（秒）
+            max_retries (int): 最多重试次数
+            rate_limit (float): 每秒最多请求数（含重试），0表示不限制
+            pool_maxsize (int): 连接池大小
+            breaker (CircuitBreaker): 熔断器，默认新建
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.session = requests.Session()
+        self.session.verify = verify_ssl
+        if not verify_ssl:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        # 重试由post()处理，适配器本身不重试
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._retryable = (requests.ConnectionError, requests.Timeout)
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _backoff(self, attempt, response=None):
+        """第attempt次重试前的等待时间：指数退避加全随机抖动，响应带Retry-After时按其等待"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(int(retry_after), RETRY_AFTER_MAX_SECONDS)
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    def post(self, url, payload, headers=None, stream=False):
+        """
+        发送JSON请求
+
+        Args:
+            stream (bool): 是否流式读取响应（只在收到响应之前重试，调用方读取完毕后需关闭响应）
+
+        Returns:
+            requests.Response: 最后一次请求的响应（重试用尽时可能仍为429/5xx）
+
+        Raises:
+            CircuitOpenError: 熔断期间
+            requests.ConnectionError/requests.Timeout: 重试用尽后仍无法连接或超时
+        """
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError(f"API暂不可用（连续失败，{self.breaker.reset_seconds}秒内不再请求）")
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            self._count('requests')
+            start = time.time()
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout, stream=stream)
+            except self._retryable as e:
+                print(f"API请求失败（第{attempt + 1}次）: {type(e).__name__}")
+                if attempt == self.max_retries:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            except Exception:
+                self._count('failures')
+                self.breaker.record_failure()
+                raise
+
+            print(f"API响应状态码: {response.status_code}，耗时 {time.time() - start:.2f} 秒")
+            if response.status_code not in RETRY_STATUS_CODES:
+                self.breaker.record_success()
+                return response
+            if attempt == self.max_retries:
+                self._count('failures')
+                self.breaker.record_failure()
+                return response
+            response.close()
+            time.sleep(self._backoff(attempt, response))
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(config):
+    """
+    获取配置的API地址对应的客户端（每个进程中每个地址和客户端设置只创建一个）
+
+    Args:
+        config (dict): 大模型配置，使用api_url、api_verify_ssl、api_connect_timeout、
+            api_read_timeout、api_max_retries、api_rate_limit、api_pool_maxsize
+    """
+    parts = urlsplit(config.get("api_url", ""))
+    settings = {
+        'verify_ssl': bool(config.get("api_verify_ssl", False)),
+        'connect_timeout': config.get("api_connect_timeout", CONNECT_TIMEOUT_SECONDS),
+        'read_timeout': config.get("api_read_timeout", READ_TIMEOUT_SECONDS),
+        'max_retries': config.get("api_max_retries", MAX_RETRIES),
+        'rate_limit': config.get("api_rate_limit", 0),
+        'pool_maxsize': config.get("api_pool_maxsize", POOL_MAXSIZE),
+    }
+    key = (parts.scheme, parts.netloc) + tuple(settings.values())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = LLMClient(**settings)
+    return client
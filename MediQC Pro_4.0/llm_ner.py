@@ -4,26 +4,55 @@
 import os
 import json
 import re
+import time
+import queue
+import bisect
+import hashlib
+import importlib.util
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from config_cache import load_json, save_json
+from entity_matcher import get_entity_matcher, SOURCE_BUILTIN
+from entity_spans import SpanSet, merge_layers, spans_to_entities, CONTEXT_SIZE
+from rule_matcher import RuleMatcher
+from ner_cache import get_ner_cache
+from sentence_memo import get_sentence_memo, split_sentences
+from model_registry import get_model_registry
+from llm_client import get_llm_client, TokenUsage
+from llm_stream import IncrementalEntityParser, iter_stream_content
 
-# 尝试导入大模型相关库
-TRANSFORMER_AVAILABLE = False
-
-try:
-    import torch
-    from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline, BertTokenizer, BertForTokenClassification
-    TRANSFORMER_AVAILABLE = True
-except ImportError:
+# 大模型相关库（torch、transformers）和网络请求库体积较大，导入需要数秒。
+# 模块加载时只检查库是否已安装，真正的导入推迟到首次使用对应后端时，
+# 这样只做Excel/Word检查的进程和Web工作进程启动时不必承担这部分开销。
+TRANSFORMER_AVAILABLE = (importlib.util.find_spec('torch') is not None
+                         and importlib.util.find_spec('transformers') is not None)
+if not TRANSFORMER_AVAILABLE:
     print("警告: transformers 或 torch 库未安装，Transformer模型功能将不可用")
 
-# 尝试导入网络请求库
-API_AVAILABLE = False
-try:
-    import requests
-    API_AVAILABLE = True
-except ImportError:
+API_AVAILABLE = importlib.util.find_spec('requests') is not None
+if not API_AVAILABLE:
     print("警告: requests库未安装，API调用功能将不可用")
 
+# 可选的ONNX Runtime推理后端（配置inference_backend为onnx时使用，运行时不需要torch）
+ONNX_AVAILABLE = (importlib.util.find_spec('onnxruntime') is not None
+                  and importlib.util.find_spec('transformers') is not None)
+
+# 推理后端
+BACKEND_PYTORCH = 'pytorch'
+BACKEND_ONNX = 'onnx'
+
+
+def _import_transformers():
+    """
+    按需导入torch和transformers（首次调用时导入，之后由sys.modules缓存）
+
+    Returns:
+        tuple: (torch模块, AutoTokenizer, AutoModelForTokenClassification, pipeline)
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+    return torch, AutoTokenizer, AutoModelForTokenClassification, pipeline
+
 # 配置文件路径
 LLM_CONFIG_FILE = 'data/llm_config.json'
 
@@ -34,10 +63,29 @@ DEFAULT_CONFIG = {
     "offline_mode": False,                 # 是否使用离线模式
     "local_model_path": "",                # 本地模型路径，如果设置则优先从本地加载
     "api_mode": False,                     # 是否使用API模式
+    "ner_mode": "",                        # 识别方式：rules、api或hybrid（先本地匹配，只把覆盖不足的句子发给API），为空时由api_mode决定
+    "hybrid_coverage_threshold": 0.8,      # 混合模式下句子的本地覆盖率低于该值时发给API
     "api_type": "deepseek",                # API类型：deepseek或douban
     "api_key": "",                         # API密钥
     "api_url": "",                         # API地址
+    "api_verify_ssl": False,               # 是否验证API的SSL证书
+    "api_connect_timeout": 5,              # API连接超时（秒）
+    "api_read_timeout": 60,                # API读取超时（秒）
+    "api_max_retries": 2,                  # API请求失败（连接失败、超时、429/5xx）时的最多重试次数
+    "api_chunk_chars": 1000,               # 长文本按句子切分为不超过该字符数的文本块，分别请求API
+    "api_max_concurrency": 4,              # 同一文本的文本块最多同时请求数
+    "api_rate_limit": 0,                   # 每个进程每秒最多API请求数，0表示不限制
+    "api_pool_maxsize": 16,                # 每个API地址保持的连接数（同时请求数超过时多出的连接用完即关闭）
+    "api_batch_tokens": 1000,              # 批量识别时多条短文本合并为一次请求，每次请求的文本最多约这么多token
+    "api_batch_records": 20,               # 批量识别时每次请求最多合并的文本数
     "chinese_medical_model": "trueto/medbert-kd-chinese", # 中文医学模型
+    "transformer_batch_size": 8,           # Transformer推理时每批处理的文本段数
+    "transformer_stride": 32,              # 相邻文本段重叠的token数，避免实体在分段处被截断
+    "sentence_memo": True,                 # 按句子识别并缓存，重复的模板句子不再重新推理
+    "inference_backend": "pytorch",        # 推理后端：pytorch或onnx（ONNX Runtime，CPU上更快）
+    "onnx_model_dir": "",                  # ONNX模型目录，为空时使用model_cache/onnx/<模型名称>
+    "onnx_quantize": True,                 # ONNX后端是否使用int8动态量化模型
+    "ner_server_socket": "",               # 实体识别服务进程的Unix套接字路径（见ner_server），为空时在本进程中加载模型
     "medical_entity_types": {              # 医学实体类型映射
         "DISEASE": "疾病",
         "SYMPTOM": "症状",
@@ -106,6 +154,10 @@ MEDICAL_ENTITY_RULES = {
     ]
 }
 
+# 重叠实体消解时的优先级：等长的重叠实体中词典匹配优先于正则规则匹配
+DICT_PRIORITY = 1
+RULE_PRIORITY = 0
+
 # 特定医学实体词典
 MEDICAL_ENTITY_DICT = {
     "疾病": ["肺炎", "肺不张", "糖尿病", "高血压", "心脏病", "脑梗", "肝炎", "肾炎", "胃炎", "肠炎", "结核", "白血病", "贫血", "抑郁症", "焦虑症", "痛风", "哮喘", "癫痫", "帕金森", "老年痴呆"],
@@ -113,6 +165,112 @@ MEDICAL_ENTITY_DICT = {
     "身体部位": ["头部", "颈部", "胸部", "腹部", "背部", "腰部", "臀部", "四肢", "上肢", "下肢", "手部", "足部", "头", "颈", "胸", "腹", "背", "腰", "臀", "肩", "臂", "肘", "腕", "手", "指", "髋", "膝", "踝", "足", "趾", "脑", "心", "肺", "肝", "脾", "胃", "肠", "肾", "膀胱", "子宫", "卵巢", "睾丸", "前列腺", "甲状腺", "胰腺", "胆囊", "胆管", "食管", "气管", "支气管", "血管", "神经", "肌肉", "骨骼", "关节", "韧带", "软骨", "椎间盘", "脊髓", "脊柱", "椎体", "颅骨", "眼", "耳", "鼻", "口", "舌", "牙", "喉", "咽", "扁桃体", "声带", "会厌", "气道", "呼吸道", "消化道", "泌尿道", "生殖道", "呼吸肌", "呼吸中枢"],
 }
 
+# 识别结果缓存的后端名称
+CACHE_BACKEND_RULES = 'rules'
+CACHE_BACKEND_API = 'api'
+CACHE_BACKEND_TRANSFORMER = 'transformer'
+
+# API提示词版本，修改提示词后需要加1，使旧提示词的缓存结果失效
+API_PROMPT_VERSION = 1
+
+# API请求的默认文本块大小（字符数）和并发数（可在配置文件中通过api_chunk_chars、api_max_concurrency修改）
+API_CHUNK_CHARS = 1000
+API_MAX_CONCURRENCY = 4
+
+# 批量识别时合并请求的默认token预算和文本数（可在配置文件中通过api_batch_tokens、api_batch_records修改）
+API_BATCH_TOKENS = 1000
+API_BATCH_RECORDS = 20
+
+# 合并请求的提示词版本，修改后需要加1
+API_BATCH_PROMPT_VERSION = 1
+
+# 单次请求和合并请求允许模型返回的最大token数
+API_MAX_TOKENS = 2000
+API_BATCH_MAX_TOKENS = 4000
+
+# 合并请求中每条文本的编号标记
+RECORD_MARKER = re.compile(r'【\d+】')
+
+# 识别方式
+NER_MODE_RULES = 'rules'
+NER_MODE_API = 'api'
+NER_MODE_HYBRID = 'hybrid'
+
+# 混合模式下句子本地覆盖率的默认阈值（可在配置文件中通过hybrid_coverage_threshold修改）
+HYBRID_COVERAGE_THRESHOLD = 0.8
+
+# 医学术语中常见的字和英文缩写，未被本地匹配覆盖时说明句子中可能有词典未收录的实体
+UNCOVERED_TERM_HINT = re.compile(r'[炎癌瘤症疹疡痹瘫痛肿]|[A-Za-z]{2,}')
+
+# 混合模式合并结果时，与词典结果等长重叠的API结果的优先级（低于词典）
+API_PRIORITY = 0
+
+# Transformer推理的默认批大小（可在配置文件中通过transformer_batch_size修改）
+TRANSFORMER_BATCH_SIZE = 8
+
+# 相邻文本段默认重叠的token数（可在配置文件中通过transformer_stride修改）
+TRANSFORMER_STRIDE = 32
+
+# 模型最大输入长度（tokenizer未设置时使用）
+TRANSFORMER_MAX_LENGTH = 512
+
+# 文本分段方式的版本，修改分段方式后需要加1，使旧分段方式的缓存结果失效
+SEGMENTER_VERSION = 2
+
+# 优先在这些字符之后分段
+SENTENCE_DELIMITERS = set('。！？；.!?;\n')
+
+# 由MEDICAL_ENTITY_RULES编译的规则匹配器
+_rule_matcher = None
+_rules_cache_version = None
+
+def get_rule_matcher():
+    """获取由MEDICAL_ENTITY_RULES编译的规则匹配器（首次调用时编译）"""
+    global _rule_matcher
+    if _rule_matcher is None:
+        _rule_matcher = RuleMatcher(MEDICAL_ENTITY_RULES)
+    return _rule_matcher
+
+def _digest(value):
+    """计算可JSON序列化对象的摘要，用作缓存版本"""
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def get_ner_mode(config=None):
+    """当前配置的识别方式：rules、api或hybrid（未设置ner_mode时由api_mode决定）"""
+    config = config or get_llm_config()
+    mode = config.get("ner_mode") or ""
+    if mode in (NER_MODE_RULES, NER_MODE_API, NER_MODE_HYBRID):
+        return mode
+    return NER_MODE_API if config.get("api_mode", False) else NER_MODE_RULES
+
+def get_rules_cache_version():
+    """规则匹配结果的缓存版本：内置词典和正则规则的摘要"""
+    global _rules_cache_version
+    if _rules_cache_version is None:
+        _rules_cache_version = _digest([MEDICAL_ENTITY_DICT, MEDICAL_ENTITY_RULES])
+    return _rules_cache_version
+
+def get_api_cache_version(config):
+    """API识别结果的缓存版本：API类型、地址、提示词版本、是否按句子识别和文本块大小（不包含API密钥）"""
+    return _digest([config.get("api_type", "deepseek"), config.get("api_url", ""), API_PROMPT_VERSION,
+                    API_BATCH_PROMPT_VERSION, config.get("sentence_memo", True),
+                    config.get("api_chunk_chars", API_CHUNK_CHARS)])
+
+def get_transformer_cache_version(config, model_name):
+    """Transformer识别结果的缓存版本：模型及实体类型映射"""
+    return _digest([
+        model_name,
+        config.get("inference_backend", BACKEND_PYTORCH),
+        config.get("onnx_quantize", True),
+        config.get("transformer_stride", TRANSFORMER_STRIDE),
+        config.get("sentence_memo", True),
+        SEGMENTER_VERSION,
+        config.get("local_model_path", ""),
+        config.get("chinese_medical_model"),
+        config.get("custom_entity_types", {}),
+        config.get("chinese_medical_entity_types", {})
+    ])
+
 # 初始化配置文件
 def init_config():
     """初始化LLM配置文件"""
@@ -125,59 +283,105 @@ def init_config():
 
 # 获取LLM配置
 def get_llm_config():
-    """获取LLM配置"""
-    try:
-        with open(LLM_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"读取LLM配置文件出错: {str(e)}")
-        return DEFAULT_CONFIG
+    """获取LLM配置（带缓存，配置文件修改后自动重新加载；返回的字典不应被直接修改）"""
+    return load_json(LLM_CONFIG_FILE, DEFAULT_CONFIG)
 
 # 保存LLM配置
 def save_llm_config(config):
     """保存LLM配置"""
     try:
-        with open(LLM_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        save_json(LLM_CONFIG_FILE, config)
     except Exception as e:
         print(f"保存LLM配置文件出错: {str(e)}")
 
+def transformer_backend_available(config=None):
+    """配置的推理后端所需的库是否已安装（onnx后端需要onnxruntime，pytorch后端需要torch）"""
+    config = config or get_llm_config()
+    if config.get("inference_backend", BACKEND_PYTORCH) == BACKEND_ONNX:
+        return ONNX_AVAILABLE
+    return TRANSFORMER_AVAILABLE
+
+def uses_ner_server(config=None):
+    """Transformer识别是否由实体识别服务进程执行（此时本进程不需要加载模型）"""
+    config = config or get_llm_config()
+    return bool(config.get("ner_server_socket")) and not config.get("api_mode", False)
+
 # 加载Transformer模型
-def load_transformer_model(model_name=None):
+def load_transformer_model(model_name=None, reload=False):
     """
     加载Transformer模型
     
+    模型由模型注册表按(模型名称, 本地模型路径, 中文医学模型, 是否使用GPU)缓存，
+    每个进程只加载一次。配置inference_backend为onnx时加载ONNX Runtime后端（见onnx_ner）。
+    
     Args:
         model_name: 模型名称，如果为None则使用配置文件中的模型
+        reload: 是否强制重新加载（如本地模型文件已更新）
     
     Returns:
         NER pipeline
     """
-    if not TRANSFORMER_AVAILABLE:
-        print("Transformer模型不可用，请安装transformers和torch库")
+    config = get_llm_config()
+    if not transformer_backend_available(config):
+        if config.get("inference_backend", BACKEND_PYTORCH) == BACKEND_ONNX:
+            print("ONNX推理后端不可用，请安装onnxruntime和transformers库")
+        else:
+            print("Transformer模型不可用，请安装transformers和torch库")
         return None
         
-    config = get_llm_config()
     if model_name is None:
         model_name = config["model_name"]
     
+    # API模式和离线模式不需要加载模型，无需导入torch
+    if config.get("api_mode", False) and API_AVAILABLE:
+        print(f"使用API模式: {config.get('api_type', 'deepseek')}")
+        return "API_MODE"
+    if config.get("offline_mode", False):
+        print(f"使用离线模式，将使用规则匹配替代模型")
+        return "RULE_BASED"
+    
+    registry = get_model_registry()
+    local_model_path = config.get("local_model_path", "")
+    
+    if config.get("inference_backend", BACKEND_PYTORCH) == BACKEND_ONNX:
+        quantized = config.get("onnx_quantize", True)
+        key = (BACKEND_ONNX, model_name, local_model_path, config.get("chinese_medical_model"),
+               config.get("onnx_model_dir", ""), quantized)
+        loader = lambda: _load_onnx_pipeline(model_name, config)
+        ner_pipeline = registry.reload(key, loader) if reload else registry.get(key, loader)
+        if ner_pipeline is None:
+            print("将使用规则匹配替代模型")
+            return "RULE_BASED"
+        return ner_pipeline
+    
+    try:
+        torch, AutoTokenizer, AutoModelForTokenClassification, pipeline = _import_transformers()
+    except Exception as e:
+        print(f"导入transformers或torch出错: {str(e)}")
+        print("将使用规则匹配替代模型")
+        return "RULE_BASED"
+    
     use_gpu = config["use_gpu"] and torch.cuda.is_available()
     device = 0 if use_gpu else -1
-    offline_mode = config.get("offline_mode", False)
+    
+    key = (model_name, local_model_path, config.get("chinese_medical_model"), use_gpu)
+    loader = lambda: _load_pipeline(model_name, config, device, AutoTokenizer, AutoModelForTokenClassification, pipeline)
+    ner_pipeline = registry.reload(key, loader) if reload else registry.get(key, loader)
+    if ner_pipeline is None:
+        print("将使用规则匹配替代模型")
+        return "RULE_BASED"
+    return ner_pipeline
+
+def _load_pipeline(model_name, config, device, AutoTokenizer, AutoModelForTokenClassification, pipeline):
+    """
+    从本地路径或在线加载模型并创建NER pipeline
+    
+    Returns:
+        NER pipeline，加载失败时返回None
+    """
     local_model_path = config.get("local_model_path", "")
-    api_mode = config.get("api_mode", False)
     
     try:
-        # 检查是否使用API模式
-        if api_mode and API_AVAILABLE:
-            print(f"使用API模式: {config.get('api_type', 'deepseek')}")
-            return "API_MODE"
-            
-        # 检查是否使用离线模式
-        if offline_mode:
-            print(f"使用离线模式，将使用规则匹配替代模型")
-            return "RULE_BASED"
-            
         # 检查是否是中文文本，如果是，使用中文医学模型
         is_chinese_model = "chinese" in model_name.lower() or "med" in model_name.lower() or "zh" in model_name.lower()
         
@@ -246,25 +450,39 @@ def load_transformer_model(model_name=None):
             return ner_pipeline
         except Exception as inner_e:
             print(f"在线加载模型失败: {str(inner_e)}")
-            print("将使用规则匹配替代模型")
-            return "RULE_BASED"
+            return None
     except Exception as e:
         print(f"加载Transformer模型出错: {str(e)}")
-        print("将使用规则匹配替代模型")
-        return "RULE_BASED"
+        return None
 
-# 创建不验证SSL证书的会话
-def _create_unverified_session():
-    """创建一个不验证SSL证书的请求会话"""
-    import requests
-    from requests.packages.urllib3.exceptions import InsecureRequestWarning
+def _load_onnx_pipeline(model_name, config):
+    """
+    加载ONNX Runtime推理后端，模型尚未导出时先导出并量化（与_load_pipeline使用相同的模型来源）
+    
+    Returns:
+        onnx_ner.OnnxNERPipeline，加载失败时返回None
+    """
+    import onnx_ner
     
-    # 禁用不安全请求的警告
-    requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+    local_model_path = config.get("local_model_path", "")
+    if local_model_path and os.path.exists(local_model_path):
+        source = local_model_path
+    elif "chinese" in model_name.lower() or "med" in model_name.lower() or "zh" in model_name.lower():
+        source = config.get("chinese_medical_model", "trueto/medbert-kd-chinese")
+    else:
+        source = model_name
     
-    session = requests.Session()
-    session.verify = False
-    return session
+    try:
+        print(f"加载ONNX模型: {source}")
+        return onnx_ner.load_onnx_pipeline(
+            source,
+            model_dir=config.get("onnx_model_dir") or None,
+            quantized=config.get("onnx_quantize", True),
+            cache_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache')
+        )
+    except Exception as e:
+        print(f"加载ONNX模型出错: {str(e)}")
+        return None
 
 # 使用词典匹配进行医学实体识别
 def recognize_entities_with_dict(text):
@@ -277,83 +495,116 @@ def recognize_entities_with_dict(text):
     Returns:
         dict: 识别到的实体字典，按实体类型分组
     """
-    entities_by_type = {}
-    
-    # 对每种实体类型应用词典匹配
-    for entity_type, words in MEDICAL_ENTITY_DICT.items():
-        entities = []
-        for word in words:
-            # 查找所有匹配位置
-            start = 0
-            while True:
-                position = text.find(word, start)
-                if position == -1:
-                    break
-                
-                # 获取上下文
-                context_start = max(0, position - 10)
-                context_end = min(len(text), position + len(word) + 10)
-                context = text[context_start:context_end]
-                
-                # 检查是否已存在相同实体
-                if not any(e['entity'] == word and e['position'] == position for e in entities):
-                    entities.append({
-                        'entity': word,
-                        'position': position,
-                        'context': context
-                    })
-                
-                start = position + len(word)
-        
-        if entities:
-            entities_by_type[entity_type] = entities
-    
-    return entities_by_type
+    # 内置词典与规则库实体字典编译在同一个自动机中，这里只使用内置词典
+    return get_entity_matcher().recognize(text, sources=(SOURCE_BUILTIN,))
 
 # 使用规则匹配进行医学实体识别
-def recognize_entities_with_rules(text):
+def recognize_entities_with_rules(text, resolve_overlaps=True):
     """
     使用规则匹配进行医学实体识别
     
+    词典和正则规则的匹配结果按(起始位置, 结束位置, 实体类型)去重。
+    配置sentence_memo时（默认）文本按句子匹配，每个句子的结果缓存在进程内存中（规则匹配本身很快，
+    不写入磁盘缓存），重复出现的模板句子不再重新匹配；关闭时整段文本直接匹配。
+    
     Args:
         text: 待识别的文本
+        resolve_overlaps: 是否消解重叠实体（词典结果优先，正则规则只补充词典未覆盖的部分，
+            避免“患者发热咳嗽”这类较长的规则匹配吞掉其中的词典实体），为False时保留所有匹配
         
     Returns:
         dict: 识别到的实体字典，按实体类型分组
     """
+    if not text.strip() or not get_llm_config().get("sentence_memo", True):
+        return _match_rules(text, resolve_overlaps)
+    backend = CACHE_BACKEND_RULES if resolve_overlaps else CACHE_BACKEND_RULES + '-all'
+    return get_sentence_memo(backend).recognize(
+        [text], get_rules_cache_version(),
+        lambda sentences: _match_rules_sentences(sentences, resolve_overlaps)
+    )[0]
+
+def _match_rules(text, resolve_overlaps):
+    """词典和正则规则匹配（不使用缓存）"""
+    spans = _rule_spans(text)
+    
+    # 消解重叠：词典结果优先，规则结果只补充词典未覆盖的部分
+    selected = spans.resolve_layers() if resolve_overlaps else spans.spans()
+    return spans_to_entities(text, selected, list(MEDICAL_ENTITY_DICT) + list(MEDICAL_ENTITY_RULES))
+
+def _match_rules_sentences(sentences, resolve_overlaps):
+    """
+    匹配多个句子：句子以换行符连接后一次扫描，再按句子拆分结果
+    （词典词条和正则规则都不会跨越换行符匹配，结果与逐句匹配相同）
+    
+    Returns:
+        list: 与sentences一一对应的识别结果，位置相对于句子
+    """
+    joined = '\n'.join(sentences)
+    starts = []
+    offset = 0
+    for sentence in sentences:
+        starts.append(offset)
+        offset += len(sentence) + 1
+    
+    spans = _rule_spans(joined)
+    selected = spans.resolve_layers() if resolve_overlaps else spans.spans()
+    spans_by_sentence = [[] for _ in sentences]
+    for start, end, entity_type in selected:
+        index = bisect.bisect_right(starts, start) - 1
+        base = starts[index]
+        if end - base <= len(sentences[index]):
+            spans_by_sentence[index].append((start - base, end - base, entity_type))
+    entity_types = list(MEDICAL_ENTITY_DICT) + list(MEDICAL_ENTITY_RULES)
+    return [spans_to_entities(sentence, sentence_spans, entity_types)
+            for sentence, sentence_spans in zip(sentences, spans_by_sentence)]
+
+def _rule_spans(text):
+    """词典和正则规则匹配得到的区间集合"""
+    spans = SpanSet()
+    
     # 先使用词典匹配
-    entities_by_type = recognize_entities_with_dict(text)
+    for position, word, _, entity_type in get_entity_matcher().find(text, sources=(SOURCE_BUILTIN,)):
+        spans.add(position, position + len(word), entity_type, DICT_PRIORITY)
     
-    # 再使用规则匹配补充
-    for entity_type, patterns in MEDICAL_ENTITY_RULES.items():
-        if entity_type not in entities_by_type:
-            entities_by_type[entity_type] = []
-            
-        for pattern in patterns:
-            for match in re.finditer(pattern, text):
-                entity_text = match.group(0)
-                position = match.start()
-                
-                # 获取上下文
-                context_start = max(0, position - 10)
-                context_end = min(len(text), position + len(entity_text) + 10)
-                context = text[context_start:context_end]
-                
-                # 检查是否已存在相同实体
-                if not any(e['entity'] == entity_text and e['position'] == position for e in entities_by_type[entity_type]):
-                    entities_by_type[entity_type].append({
-                        'entity': entity_text,
-                        'position': position,
-                        'context': context
-                    })
+    # 再使用规则匹配补充（所有规则编译为查找表，一次扫描得到所有实体类型的结果）
+    for start, end, entity_type in get_rule_matcher().finditer(text):
+        spans.add(start, end, entity_type, RULE_PRIORITY)
+    return spans
+
+def _get_cached_api_result(text, config, cache_version):
+    """
+    查找API识别结果的缓存：先按整篇文本查找，配置sentence_memo时（默认）再查找句子级缓存
+    （文本的所有句子都识别过时直接组装结果）
     
-    return entities_by_type
+    Returns:
+        dict: 识别结果，未命中时返回None
+    """
+    cached = get_ner_cache().get(text, CACHE_BACKEND_API, cache_version)
+    if cached is None and config.get("sentence_memo", True) and text.strip():
+        cached = get_sentence_memo(CACHE_BACKEND_API, persist=True).lookup(text, cache_version)
+    return cached
+
+def _cache_api_result(text, config, cache_version, entities_by_type, store_sentences=False):
+    """
+    缓存API识别成功的结果（出错和降级的结果不应缓存）
+    
+    Args:
+        store_sentences: 结果不是经句子级缓存识别得到的（如流式识别的结果）时为True，
+            配置sentence_memo时同时按句子拆分缓存，之后包含相同句子的文本不再重复请求
+    """
+    get_ner_cache().put(text, CACHE_BACKEND_API, cache_version, entities_by_type)
+    if store_sentences and config.get("sentence_memo", True):
+        get_sentence_memo(CACHE_BACKEND_API, persist=True).store(text, cache_version, entities_by_type)
 
 # 使用API进行命名实体识别
 def recognize_entities_with_api(text):
     """
     使用API进行命名实体识别
     
+    配置sentence_memo时（默认）只把尚未识别过的句子发给API（合并为一次请求），
+    已识别过的句子直接使用缓存结果。超过api_chunk_chars的文本按句子切分为多个文本块并发请求，
+    长文本的耗时接近单个文本块的耗时。
+    
     Args:
         text: 待识别的文本
     
@@ -365,7 +616,6 @@ def recognize_entities_with_api(text):
         return {"API错误": [{"entity": "请安装requests库", "position": 0, "context": "系统检测到未安装必要的依赖库"}]}
     
     config = get_llm_config()
-    api_type = config.get("api_type", "deepseek")
     api_key = config.get("api_key", "")
     api_url = config.get("api_url", "")
     
@@ -373,15 +623,383 @@ def recognize_entities_with_api(text):
         print("API配置不完整，请设置api_key和api_url")
         return {"API配置错误": [{"entity": "请设置API密钥和地址", "position": 0, "context": "API配置不完整"}]}
     
+    # 相同文本和API配置的识别结果直接从缓存返回，不再重复调用API
+    cache_version = get_api_cache_version(config)
+    cached = _get_cached_api_result(text, config, cache_version)
+    if cached is not None:
+        return cached
+    
+    if config.get("sentence_memo", True) and text.strip():
+        errors = []
+        
+        def recognize_sentences(sentences):
+            joined = '\n'.join(sentences)
+            entities, error = _request_api_entities_chunked(joined, config)
+            if entities is None:
+                errors.append(error)
+                return None
+            return _split_entities_by_sentence(joined, sentences, entities)
+        
+        formatted_entities = get_sentence_memo(CACHE_BACKEND_API, persist=True).recognize(
+            [text], cache_version, recognize_sentences
+        )[0]
+        error = errors[0] if errors else None
+    else:
+        formatted_entities, error = _request_api_entities_chunked(text, config)
+    
+    if formatted_entities is None:
+        if error is not None:
+            return error
+        print("尝试使用规则匹配替代")
+        return recognize_entities_with_rules(text)
+    
+    # 只缓存识别成功的结果，出错和降级的结果不缓存
+    _cache_api_result(text, config, cache_version, formatted_entities)
+    return formatted_entities
+
+def recognize_entities_with_api_batch(texts):
+    """
+    使用API批量识别多条文本（用于批量任务）
+    
+    与逐条调用recognize_entities_with_api相比，多条短文本（如主诉）合并为一次请求，
+    重复的提示词只发送一次，请求次数和token消耗成倍减少。配置sentence_memo时（默认）
+    合并的单位是尚未识别过的句子。合并请求失败或返回格式不正确时对应文本改为逐条请求，
+    仍然失败的文本使用规则匹配替代（不缓存）。
+    
+    Args:
+        texts (list): 待识别的文本
+    
+    Returns:
+        list: 与texts一一对应的识别结果，按实体类型分组
+    """
+    if not API_AVAILABLE:
+        print("API功能不可用，请安装requests库")
+        return [{"API错误": [{"entity": "请安装requests库", "position": 0, "context": "系统检测到未安装必要的依赖库"}]}
+                for _ in texts]
+    
+    config = get_llm_config()
+    if not config.get("api_key", "") or not config.get("api_url", ""):
+        print("API配置不完整，请设置api_key和api_url")
+        return [{"API配置错误": [{"entity": "请设置API密钥和地址", "position": 0, "context": "API配置不完整"}]}
+                for _ in texts]
+    
+    cache = get_ner_cache()
+    cache_version = get_api_cache_version(config)
+    results = {}
+    pending = []
+    for text in texts:
+        if text in results:
+            continue
+        cached = cache.get(text, CACHE_BACKEND_API, cache_version) if text.strip() else {}
+        results[text] = cached
+        if cached is None:
+            pending.append(text)
+    
+    if pending:
+        if config.get("sentence_memo", True):
+            recognized = get_sentence_memo(CACHE_BACKEND_API, persist=True).recognize(
+                pending, cache_version, lambda sentences: _recognize_api_records(sentences, config)
+            )
+        else:
+            recognized = _recognize_api_records(pending, config)
+        failed = 0
+        for text, formatted_entities in zip(pending, recognized):
+            if formatted_entities is None:
+                failed += 1
+                results[text] = recognize_entities_with_rules(text)
+                continue
+            _cache_api_result(text, config, cache_version, formatted_entities)
+            results[text] = formatted_entities
+        if failed:
+            print(f"{failed}条文本API识别失败，使用规则匹配替代")
+    
+    return [results[text] for text in texts]
+
+def stream_entities_with_api(text):
+    """
+    流式识别：每当模型生成完一个实体就立即返回，不等待整个结果生成完毕
+    
+    与recognize_entities_with_api相同，长文本切分为文本块并发请求（各文本块的实体交错返回），
+    实体位置按实体在原文中的实际出现位置校正。缓存命中时直接返回缓存的结果；
+    API不支持流式响应（豆包）时改为一次请求；请求失败时返回错误后使用规则匹配的结果。
+    
+    Yields:
+        tuple: (事件, 数据)，事件为：
+            'entity'：{'type': 实体类型, 'entity': 实体, 'position': 位置, 'context': 上下文}
+            'error'：{'message': 错误信息}
+            'done'：{'entities': 完整的识别结果（按实体类型分组）, 'source': 'api'、'cache'或'rules'}
+    """
+    config = get_llm_config()
+    configured = API_AVAILABLE and config.get("api_key", "") and config.get("api_url", "")
+    # 依赖或配置缺失（返回错误信息）以及不支持流式响应的API改为一次请求
+    if not configured or config.get("api_type", "deepseek").lower() == "douban":
+        entities = recognize_entities_with_api(text)
+        yield from iter_entity_events(entities)
+        yield 'done', {'entities': entities, 'source': 'api'}
+        return
+    
+    cache_version = get_api_cache_version(config)
+    cached = _get_cached_api_result(text, config, cache_version)
+    if cached is not None:
+        yield from iter_entity_events(cached)
+        yield 'done', {'entities': cached, 'source': 'cache'}
+        return
+    
+    chunks = _chunk_text(text, max(1, config.get("api_chunk_chars", API_CHUNK_CHARS)))
+    events = queue.Queue()
+    workers = max(1, min(len(chunks), config.get("api_max_concurrency", API_MAX_CONCURRENCY)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for offset, chunk in chunks:
+        executor.submit(_stream_api_chunk, chunk, offset, config, events)
+    
+    entities_by_type = {}
+    seen = set()
+    error = None
     try:
-        # 构建API请求
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
+        for _ in chunks:
+            while True:
+                event = events.get()
+                if event[0] == 'finished':
+                    break
+                if event[0] == 'error':
+                    error = error or event[1]
+                    continue
+                _, entity_type, position, entity = event
+                if error is not None or (entity_type, position, entity) in seen:
+                    continue
+                seen.add((entity_type, position, entity))
+                end = position + len(entity)
+                entity_info = {'entity': entity, 'position': position,
+                               'context': text[max(0, position - CONTEXT_SIZE):min(len(text), end + CONTEXT_SIZE)]}
+                entities_by_type.setdefault(entity_type, []).append(entity_info)
+                yield 'entity', dict(entity_info, type=entity_type)
+    finally:
+        # 浏览器断开连接时不等待其余文本块
+        executor.shutdown(wait=False)
+    
+    if error is not None:
+        yield 'error', {'message': error}
+        print("尝试使用规则匹配替代")
+        yield 'done', {'entities': recognize_entities_with_rules(text), 'source': 'rules'}
+        return
+    
+    for entity_list in entities_by_type.values():
+        entity_list.sort(key=lambda entity_info: entity_info['position'])
+    _cache_api_result(text, config, cache_version, entities_by_type, store_sentences=True)
+    yield 'done', {'entities': entities_by_type, 'source': 'api'}
+
+def _stream_api_chunk(chunk, offset, config, events):
+    """
+    流式请求一个文本块，识别出的实体逐个放入events：('entity', 实体类型, 在原文中的位置, 实体)，
+    出错时放入('error', 错误信息)，最后放入('finished',)
+    """
+    try:
+        api_url, payload, headers = _build_api_request(_entity_prompt(chunk), config)
+        payload["stream"] = True
+        print(f"发送流式API请求到: {api_url}，模型: {config.get('api_type', 'deepseek')}，文本长度: {len(chunk)}")
+        with get_llm_client(config).post(api_url, payload, headers, stream=True) as response:
+            if response.status_code != 200:
+                print(f"API请求失败: {response.status_code}")
+                events.put(('error', f"API请求失败，状态码: {response.status_code}"))
+                return
+            parser = IncrementalEntityParser()
+            for delta in iter_stream_content(response):
+                for entity_type, entity in parser.feed(delta):
+                    reported = entity.get('position') if isinstance(entity.get('position'), int) else 0
+                    position = _locate_entity(chunk, entity['entity'], reported)
+                    if position is not None:
+                        events.put(('entity', entity_type, position + offset, entity['entity']))
+            # 没有完整的JSON对象（无法解析或输出被截断）时作为失败处理，不缓存不完整的结果
+            if not parser.finished:
+                events.put(('error', "无法解析API返回的JSON"))
+    except Exception as e:
+        print(f"流式API实体识别出错: {str(e)}")
+        events.put(('error', f"API实体识别出错: {str(e)}"))
+    finally:
+        events.put(('finished',))
+
+def iter_entity_events(entities_by_type):
+    """将按类型分组的识别结果逐个转换为流式识别的'entity'事件"""
+    for entity_type, entities in entities_by_type.items():
+        for entity_info in entities:
+            yield 'entity', dict(entity_info, type=entity_type)
+
+def _chunk_text(text, max_chars):
+    """
+    按句子把文本打包为不超过max_chars个字符的文本块，超长的句子按长度切分
+    
+    Returns:
+        list: [(文本块在原文中的偏移量, 文本块), ...]
+    """
+    chunks = []
+    start = end = None
+    for offset, sentence in split_sentences(text):
+        sentence_end = offset + len(sentence)
+        if start is not None and sentence_end - start <= max_chars:
+            end = sentence_end
+            continue
+        if start is not None:
+            chunks.append((start, text[start:end]))
+        while sentence_end - offset > max_chars:
+            chunks.append((offset, text[offset:offset + max_chars]))
+            offset += max_chars
+        start, end = offset, sentence_end
+    if start is not None:
+        chunks.append((start, text[start:end]))
+    return chunks
+
+def _request_api_entities_chunked(text, config, usage=None):
+    """
+    长文本切分为文本块后并发请求API（并发数不超过api_max_concurrency），合并各文本块的结果
+    
+    各文本块的实体位置按实体在文本块中的实际出现位置校正后加上文本块的偏移量，
+    文本中找不到的实体被丢弃。任一文本块失败时整体失败（返回值含义同_request_api_entities）。
+    usage（llm_client.TokenUsage）不为None时记录各请求的token用量。
+    """
+    chunks = _chunk_text(text, max(1, config.get("api_chunk_chars", API_CHUNK_CHARS)))
+    if len(chunks) <= 1:
+        outcomes = [_request_api_entities(chunk, config, usage) for _, chunk in chunks]
+    else:
+        workers = max(1, min(len(chunks), config.get("api_max_concurrency", API_MAX_CONCURRENCY)))
+        print(f"文本长度{len(text)}，切分为{len(chunks)}个文本块，并发数{workers}")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(lambda chunk: _request_api_entities(chunk[1], config, usage), chunks))
+    for entities, error in outcomes:
+        if entities is None:
+            return None, error
+    
+    merged = {}
+    for (offset, chunk), (entities, _) in zip(chunks, outcomes):
+        _merge_located_entities(merged, entities, text, chunk, offset)
+    return merged, None
+
+def _merge_located_entities(merged, entities_by_type, text, chunk, offset):
+    """
+    按实体在文本块中的实际出现位置校正位置，加上文本块在text中的偏移量后并入merged，
+    并按text重新截取上下文；文本块中找不到的实体被丢弃
+    """
+    for entity_type, entity_list in entities_by_type.items():
+        bucket = merged.setdefault(entity_type, [])
+        for entity in entity_list:
+            reported = entity['position'] if isinstance(entity['position'], int) else 0
+            position = _locate_entity(chunk, entity['entity'], reported)
+            if position is None:
+                continue
+            position += offset
+            end = position + len(entity['entity'])
+            bucket.append(dict(entity, position=position,
+                               context=text[max(0, position - CONTEXT_SIZE):min(len(text), end + CONTEXT_SIZE)]))
+
+def _build_api_request(prompt, config, max_tokens=API_MAX_TOKENS):
+    """
+    按API类型构建请求
+    
+    Returns:
+        tuple: (请求地址, 请求体, 请求头)
+    """
+    api_type = config.get("api_type", "deepseek")
+    api_key = config.get("api_key", "")
+    api_url = config.get("api_url", "")
+    
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    
+    if api_type.lower() == "deepseek":
+        payload = {
+            "model": "deepseek-chat",
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": max_tokens,
+            "stream": False
         }
         
-        # 构建提示词
-        prompt = f"""请识别以下文本中的医学实体，并返回实体列表，格式为JSON：
+        # 如果API URL不包含完整路径，则使用默认路径
+        if not api_url.endswith("/chat/completions"):
+            if api_url.endswith("/v1"):
+                api_url = f"{api_url}/chat/completions"
+            elif not api_url.endswith("/"):
+                api_url = f"{api_url}/v1/chat/completions"
+            else:
+                api_url = f"{api_url}v1/chat/completions"
+                
+        print(f"使用DeepSeek API: {api_url}")
+            
+    elif api_type.lower() == "douban":
+        payload = {
+            "model": "douban-lite",
+            "prompt": prompt,
+            "temperature": 0.1,
+            "max_tokens": max_tokens
+        }
+    else:
+        payload = {
+            "model": api_type,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": max_tokens
+        }
+    return api_url, payload, headers
+
+def _post_api_prompt(prompt, config, text_length, max_tokens=API_MAX_TOKENS, usage=None):
+    """
+    发送提示词，usage（llm_client.TokenUsage）不为None时记录token用量
+    （API未返回用量时按提示词和回复的长度估算）
+    
+    Returns:
+        tuple: (模型回复的文本, None)；API返回错误时为(None, 错误信息)
+    
+    Raises:
+        Exception: 请求出错（连接失败、超时、熔断等）
+    """
+    api_type = config.get("api_type", "deepseek")
+    api_url, payload, headers = _build_api_request(prompt, config, max_tokens)
+    
+    # 不输出请求头（含API密钥）和提示词（含病历文本）
+    print(f"发送API请求到: {api_url}，模型: {api_type}，文本长度: {text_length}")
+    response = get_llm_client(config).post(api_url, payload, headers)
+    
+    if response.status_code != 200:
+        print(f"API请求失败: {response.status_code} {response.text}")
+        return None, {"API错误": [{"entity": f"状态码: {response.status_code}", "position": 0, "context": response.text[:100]}]}
+    
+    result = response.json()
+    if api_type.lower() == "douban":
+        reply = result.get("response", "")
+    else:
+        reply = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+    if usage is not None:
+        reported = result.get("usage") or {}
+        usage.add(reported.get("prompt_tokens", _estimate_tokens(prompt)),
+                  reported.get("completion_tokens", _estimate_tokens(reply)))
+    return reply, None
+
+def _parse_json_reply(response_text):
+    """
+    提取并解析模型回复中的JSON部分
+    
+    Raises:
+        json.JSONDecodeError: 无法解析
+    """
+    json_match = re.search(r"```json\s*([\s\S]*?)\s*```", response_text)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        json_str = re.search(r"{[\s\S]*}", response_text)
+        if json_str:
+            json_str = json_str.group(0)
+        else:
+            json_str = response_text
+    return json.loads(json_str)
+
+def _entity_prompt(text):
+    """构建识别单个文本的提示词"""
+    return f"""请识别以下文本中的医学实体，并返回实体列表，格式为JSON：
 {text}
 
 请将结果按照以下实体类型分类：疾病、症状、身体部位、治疗、检查、药物
@@ -396,111 +1014,361 @@ def recognize_entities_with_api(text):
   ]
 }}
 """
+
+def _request_api_entities(text, config, usage=None):
+    """
+    调用API识别文本中的实体（不使用缓存）
+    
+    Returns:
+        tuple: (识别结果, None)；API返回错误或无法解析时为(None, 错误信息)；
+               请求出错时为(None, None)，由调用方使用规则匹配替代
+    """
+    try:
+        response_text, error = _post_api_prompt(_entity_prompt(text), config, len(text), usage=usage)
+        if error is not None:
+            return None, error
         
-        payload = {}
-        if api_type.lower() == "deepseek":
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1,
-                "max_tokens": 2000,
-                "stream": False
-            }
+        # 解析JSON
+        try:
+            entities = _parse_json_reply(response_text)
             
-            # 如果API URL不包含完整路径，则使用默认路径
-            if not api_url.endswith("/chat/completions"):
-                if api_url.endswith("/v1"):
-                    api_url = f"{api_url}/chat/completions"
-                elif not api_url.endswith("/"):
-                    api_url = f"{api_url}/v1/chat/completions"
-                else:
-                    api_url = f"{api_url}v1/chat/completions"
+            # 格式化为标准格式
+            formatted_entities = {}
+            for entity_type, entity_list in entities.items():
+                formatted_entities[entity_type] = []
+                for entity_info in entity_list:
+                    # 获取上下文
+                    position = entity_info.get("position", 0)
+                    entity_text = entity_info.get("entity", "")
+                    context_start = max(0, position - 10)
+                    context_end = min(len(text), position + len(entity_text) + 10)
+                    context = text[context_start:context_end]
                     
-            print(f"使用DeepSeek API: {api_url}")
-                
-        elif api_type.lower() == "douban":
-            payload = {
-                "model": "douban-lite",
-                "prompt": prompt,
-                "temperature": 0.1,
-                "max_tokens": 2000
-            }
+                    formatted_entities[entity_type].append({
+                        "entity": entity_text,
+                        "position": position,
+                        "context": context
+                    })
+            
+            return formatted_entities, None
+        except json.JSONDecodeError:
+            print(f"解析API返回的JSON失败: {response_text}")
+            return None, {"解析错误": [{"entity": "无法解析API返回的JSON", "position": 0, "context": response_text[:100]}]}
+    except Exception as e:
+        print(f"API实体识别出错: {str(e)}")
+        return None, None
+
+def _estimate_tokens(text):
+    """估算文本的token数：中文等非ASCII字符按每字1个token，ASCII字符按每4个1个token"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return len(text) - ascii_chars + (ascii_chars + 3) // 4
+
+def _pack_records(records, max_tokens, max_records):
+    """
+    按顺序把文本打包为合并请求，每个请求的文本不超过max_tokens个token、max_records条
+    
+    Returns:
+        tuple: (合并请求列表[[文本序号, ...], ...], 需要单独请求的文本序号列表)；
+               超过预算或包含编号标记的文本，以及打包后只剩一条的请求都单独请求
+    """
+    batches = []
+    singles = []
+    batch = []
+    batch_tokens = 0
+    for index, record in enumerate(records):
+        tokens = _estimate_tokens(record)
+        if tokens > max_tokens or RECORD_MARKER.search(record):
+            singles.append(index)
+            continue
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_records):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    
+    packed = []
+    for batch in batches:
+        if len(batch) > 1:
+            packed.append(batch)
         else:
-            payload = {
-                "model": api_type,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1,
-                "max_tokens": 2000
+            singles.extend(batch)
+    return packed, sorted(singles)
+
+def _request_api_entities_batch(records, config, usage=None):
+    """
+    把多条文本合并为一次请求，按编号拆分模型返回的JSON
+    
+    Returns:
+        list: 与records一一对应的识别结果（位置已按实体在该条文本中的实际出现位置校正）；
+              请求出错、JSON无法解析或缺少某条文本的结果时，对应位置为None
+    """
+    numbered = '\n'.join(f"【{number}】{record}" for number, record in enumerate(records, 1))
+    prompt = f"""请识别以下{len(records)}条文本中的医学实体，每条文本以【编号】开头，各条文本相互独立。
+{numbered}
+
+请返回一个JSON对象，键为文本编号，值为该条文本的实体按以下类型分类的结果：疾病、症状、身体部位、治疗、检查、药物
+position为实体在该条文本中的位置（从0开始，不包括【编号】），没有实体的文本返回空对象。
+返回结果示例：
+{{
+  "1": {{
+    "疾病": [
+      {{"entity": "高血压", "position": 5}}
+    ]
+  }},
+  "2": {{
+    "症状": [
+      {{"entity": "头痛", "position": 0}},
+      {{"entity": "发热", "position": 3}}
+    ]
+  }},
+  "3": {{}}
+}}
+"""
+    results = [None] * len(records)
+    try:
+        response_text, error = _post_api_prompt(prompt, config, sum(len(record) for record in records),
+                                                API_BATCH_MAX_TOKENS, usage)
+        if error is not None:
+            return results
+        replies = _parse_json_reply(response_text)
+    except json.JSONDecodeError:
+        print(f"解析合并请求返回的JSON失败，{len(records)}条文本改为逐条请求")
+        return results
+    except Exception as e:
+        print(f"合并请求API出错: {str(e)}")
+        return results
+    if not isinstance(replies, dict):
+        return results
+    
+    for number, record in enumerate(records, 1):
+        reply = replies.get(str(number))
+        if not isinstance(reply, dict):
+            continue
+        try:
+            entities_by_type = {
+                entity_type: [{"entity": entity["entity"], "position": entity.get("position", 0)}
+                              for entity in entity_list if isinstance(entity.get("entity"), str)]
+                for entity_type, entity_list in reply.items()
             }
+        except (AttributeError, KeyError, TypeError):
+            continue
+        results[number - 1] = {}
+        _merge_located_entities(results[number - 1], entities_by_type, record, record, 0)
+    return results
+
+def _recognize_api_records(records, config, usage=None):
+    """
+    批量识别多条文本：短文本按token预算合并请求（多个合并请求并发，并发数不超过api_max_concurrency），
+    合并请求失败或结果缺失的文本以及较长的文本逐条请求；usage不为None时记录token用量
+    
+    Returns:
+        list: 与records一一对应的识别结果，位置相对于该条文本；识别失败的文本为None
+    """
+    batches, singles = _pack_records(
+        records,
+        max(1, config.get("api_batch_tokens", API_BATCH_TOKENS)),
+        max(1, config.get("api_batch_records", API_BATCH_RECORDS))
+    )
+    results = [None] * len(records)
+    workers = max(1, config.get("api_max_concurrency", API_MAX_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = executor.map(
+            lambda batch: _request_api_entities_batch([records[i] for i in batch], config, usage), batches)
+        for batch, batch_results in zip(batches, outcomes):
+            for index, result in zip(batch, batch_results):
+                results[index] = result
         
-        # 发送请求
-        print(f"发送API请求到: {api_url}，模型: {api_type}")
-        print(f"请求头: {headers}")
-        print(f"请求参数: {payload}")
-        
-        session = _create_unverified_session()
-        response = session.post(api_url, headers=headers, json=payload)
-        print(f"API响应状态码: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            # 提取返回结果中的JSON部分
-            if api_type.lower() == "deepseek":
-                response_text = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            elif api_type.lower() == "douban":
-                response_text = result.get("response", "")
-            else:
-                response_text = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            # 提取JSON部分
-            json_match = re.search(r"```json\s*([\s\S]*?)\s*```", response_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                json_str = re.search(r"{[\s\S]*}", response_text)
-                if json_str:
-                    json_str = json_str.group(0)
-                else:
-                    json_str = response_text
-            
-            # 解析JSON
-            try:
-                entities = json.loads(json_str)
-                
-                # 格式化为标准格式
-                formatted_entities = {}
-                for entity_type, entity_list in entities.items():
-                    formatted_entities[entity_type] = []
-                    for entity_info in entity_list:
-                        # 获取上下文
-                        position = entity_info.get("position", 0)
-                        entity_text = entity_info.get("entity", "")
-                        context_start = max(0, position - 10)
-                        context_end = min(len(text), position + len(entity_text) + 10)
-                        context = text[context_start:context_end]
-                        
-                        formatted_entities[entity_type].append({
-                            "entity": entity_text,
-                            "position": position,
-                            "context": context
-                        })
-                
-                return formatted_entities
-            except json.JSONDecodeError:
-                print(f"解析API返回的JSON失败: {response_text}")
-                return {"解析错误": [{"entity": "无法解析API返回的JSON", "position": 0, "context": response_text[:100]}]}
+        retry = [index for index, result in enumerate(results) if result is None]
+        if len(retry) > len(singles):
+            print(f"{len(retry) - len(singles)}条文本的合并请求失败，改为逐条请求")
+        for index, (entities, _) in zip(retry, executor.map(
+                lambda index: _request_api_entities_chunked(records[index], config, usage), retry)):
+            results[index] = entities
+    print(f"批量识别{len(records)}条文本：合并请求{len(batches)}次，逐条请求{len(retry)}次")
+    return results
+
+def _locate_entity(text, entity, position):
+    """实体在文本中最接近position的出现位置（API返回的位置不一定准确），不存在时返回None"""
+    best = None
+    start = text.find(entity) if entity else -1
+    while start != -1:
+        if best is None or abs(start - position) < abs(best - position):
+            best = start
+        start = text.find(entity, start + 1)
+    return best
+
+def _split_entities_by_sentence(joined, sentences, entities_by_type):
+    """
+    将合并识别的结果拆分到各个句子
+    
+    Args:
+        joined: 以换行符连接的句子
+        sentences: 句子列表
+        entities_by_type: joined的识别结果
+    
+    Returns:
+        list: 与sentences一一对应的识别结果，位置相对于句子；文本中找不到的实体被丢弃
+    """
+    starts = []
+    offset = 0
+    for sentence in sentences:
+        starts.append(offset)
+        offset += len(sentence) + 1
+    
+    results = [{entity_type: [] for entity_type in entities_by_type} for _ in sentences]
+    for entity_type, entities in entities_by_type.items():
+        for entity in entities:
+            reported = entity['position'] if isinstance(entity['position'], int) else 0
+            position = _locate_entity(joined, entity['entity'], reported)
+            if position is None or '\n' in entity['entity']:
+                continue
+            index = bisect.bisect_right(starts, position) - 1
+            results[index][entity_type].append(dict(entity, position=position - starts[index]))
+    return results
+
+
+# 混合模式：本地匹配为主，只把覆盖不足的句子发给API
+def recognize_entities_hybrid(text, return_stats=False):
+    """
+    混合模式识别：先用词典和正则规则匹配，只把本地覆盖率低于hybrid_coverage_threshold的句子发给API
+    
+    句子的本地覆盖率 = 可信的实体字数 /（所有匹配的实体字数 + 未被匹配覆盖的医学术语特征字数），
+    词典匹配的实体可信；正则规则的匹配结果边界不可靠，只有包含词典词条时才算可信。
+    发给API的句子中，API结果与词典结果较长者优先（等长时词典优先），正则规则的结果只保留
+    与两者都不重叠的部分。覆盖率达到阈值的句子直接使用本地结果（与规则匹配相同）。
+    API不可用或请求失败时直接使用本地结果。
+    
+    Args:
+        text: 待识别的文本
+        return_stats: 是否同时返回统计信息
+    
+    Returns:
+        dict: 识别到的实体字典，按实体类型分组；return_stats为True时返回(实体字典, 统计信息)，
+              统计信息包含句子数、发给API的句子数、API请求数、token用量和各阶段耗时
+    """
+    results, stats = recognize_entities_hybrid_batch([text], return_stats=True)
+    return (results[0], stats) if return_stats else results[0]
+
+def recognize_entities_hybrid_batch(texts, return_stats=False):
+    """
+    混合模式批量识别（用于批量任务），所有文本中需要发给API的句子去重后合并请求
+    
+    Returns:
+        list: 与texts一一对应的识别结果；return_stats为True时返回(识别结果列表, 统计信息)
+    """
+    config = get_llm_config()
+    threshold = config.get("hybrid_coverage_threshold", HYBRID_COVERAGE_THRESHOLD)
+    stats = {'sentences': 0, 'local_sentences': 0, 'api_sentences': 0, 'api_requests': 0,
+             'prompt_tokens': 0, 'completion_tokens': 0, 'api_error': None,
+             'local_ms': 0.0, 'api_ms': 0.0, 'merge_ms': 0.0}
+    
+    # 第一阶段：本地匹配，计算每个句子的覆盖率
+    start = time.perf_counter()
+    split = [split_sentences(text) for text in texts]
+    unique = list(dict.fromkeys(sentence for sentences in split for _, sentence in sentences))
+    local = dict(zip(unique, _local_sentence_layers(unique)))
+    uncertain = [sentence for sentence in unique if local[sentence]['coverage'] < threshold]
+    stats['sentences'] = sum(len(sentences) for sentences in split)
+    stats['api_sentences'] = sum(1 for sentences in split for _, sentence in sentences
+                                 if local[sentence]['coverage'] < threshold)
+    stats['local_sentences'] = stats['sentences'] - stats['api_sentences']
+    stats['local_ms'] = (time.perf_counter() - start) * 1000
+    
+    # 第二阶段：覆盖不足的句子发给API（与API模式共用句子级缓存）
+    start = time.perf_counter()
+    api_spans = {}
+    if uncertain:
+        if not API_AVAILABLE or not config.get("api_key", "") or not config.get("api_url", ""):
+            stats['api_error'] = "API不可用或配置不完整"
         else:
-            print(f"API请求失败: {response.status_code} {response.text}")
-            return {"API错误": [{"entity": f"状态码: {response.status_code}", "position": 0, "context": response.text[:100]}]}
-    except Exception as e:
-        print(f"API实体识别出错: {str(e)}")
-        print("尝试使用规则匹配替代")
-        return recognize_entities_with_rules(text)
+            usage = TokenUsage()
+            recognized = get_sentence_memo(CACHE_BACKEND_API, persist=True).recognize(
+                uncertain, get_api_cache_version(config),
+                lambda sentences: _recognize_api_records(sentences, config, usage)
+            )
+            failed = 0
+            for sentence, entities_by_type in zip(uncertain, recognized):
+                if entities_by_type is None:
+                    failed += 1
+                    continue
+                api_spans[sentence] = [
+                    (entity['position'], entity['position'] + len(entity['entity']), entity_type)
+                    for entity_type, entities in entities_by_type.items() for entity in entities
+                    if isinstance(entity.get('position'), int) and entity['entity']
+                    and sentence[entity['position']:entity['position'] + len(entity['entity'])] == entity['entity']
+                ]
+            if failed:
+                stats['api_error'] = f"{failed}个句子API识别失败，使用本地匹配结果"
+            stats['api_requests'] = usage.requests
+            stats['prompt_tokens'] = usage.prompt_tokens
+            stats['completion_tokens'] = usage.completion_tokens
+    stats['api_ms'] = (time.perf_counter() - start) * 1000
+    
+    # 第三阶段：按优先级合并并映射回原文
+    start = time.perf_counter()
+    entity_types = list(MEDICAL_ENTITY_DICT) + list(MEDICAL_ENTITY_RULES)
+    merged = {}
+    for sentence in unique:
+        layer = local[sentence]
+        if sentence not in api_spans:
+            merged[sentence] = merge_layers(layer['dict'] + layer['rules'])
+            continue
+        spans = SpanSet()
+        for span_start, span_end, entity_type in layer['dict']:
+            spans.add(span_start, span_end, entity_type, DICT_PRIORITY)
+        for span_start, span_end, entity_type in api_spans[sentence]:
+            spans.add(span_start, span_end, entity_type, API_PRIORITY)
+        merged[sentence] = merge_layers(spans.resolve(), layer['rules'])
+    results = []
+    for text, sentences in zip(texts, split):
+        spans = [(offset + span_start, offset + span_end, entity_type)
+                 for offset, sentence in sentences for span_start, span_end, entity_type in merged[sentence]]
+        results.append(spans_to_entities(text, spans, entity_types))
+    stats['merge_ms'] = (time.perf_counter() - start) * 1000
+    
+    for name in ('local_ms', 'api_ms', 'merge_ms'):
+        stats[name] = round(stats[name], 1)
+    print(f"混合模式: {stats['sentences']}个句子中{stats['api_sentences']}个发给API，"
+          f"API请求{stats['api_requests']}次，token {stats['prompt_tokens']}+{stats['completion_tokens']}，"
+          f"耗时 本地{stats['local_ms']}ms / API {stats['api_ms']}ms / 合并{stats['merge_ms']}ms")
+    return (results, stats) if return_stats else results
+
+def _local_sentence_layers(sentences):
+    """
+    本地匹配多个句子（以换行符连接后一次扫描），计算每个句子的本地覆盖率
+    
+    Returns:
+        list: 与sentences一一对应的{'dict': 词典实体区间, 'rules': 正则规则实体区间, 'coverage': 覆盖率}，
+              两类区间合起来即规则匹配的结果（已消解重叠），位置相对于句子
+    """
+    joined = '\n'.join(sentences)
+    starts = []
+    offset = 0
+    for sentence in sentences:
+        starts.append(offset)
+        offset += len(sentence) + 1
+    
+    spans = _rule_spans(joined)
+    layers = [{'dict': [], 'rules': []} for _ in sentences]
+    for span in spans.resolve_layers():
+        index = bisect.bisect_right(starts, span[0]) - 1
+        base = starts[index]
+        name = 'dict' if spans.priority(span) == DICT_PRIORITY else 'rules'
+        layers[index][name].append((span[0] - base, span[1] - base, span[2]))
+    
+    # 词典实体视为可靠，规则实体（已去掉与词典实体重叠的部分）和未覆盖的疑似术语视为不确定
+    for sentence, layer in zip(sentences, layers):
+        covered = [False] * len(sentence)
+        for span_start, span_end, _ in layer['dict'] + layer['rules']:
+            covered[span_start:span_end] = [True] * (span_end - span_start)
+        confident = sum(span_end - span_start for span_start, span_end, _ in layer['dict'])
+        uncertain = sum(span_end - span_start for span_start, span_end, _ in layer['rules'])
+        uncertain += sum(1 for match in UNCOVERED_TERM_HINT.finditer(sentence) if not covered[match.start()])
+        layer['coverage'] = confident / (confident + uncertain) if confident + uncertain else 1.0
+    return layers
+
 
 # 使用Transformer模型进行命名实体识别
 def recognize_entities_with_transformer(text, model_name=None):
@@ -514,158 +1382,357 @@ def recognize_entities_with_transformer(text, model_name=None):
     Returns:
         dict: 识别到的实体字典，按实体类型分组
     """
-    if not TRANSFORMER_AVAILABLE:
-        print("Transformer模型不可用，请安装transformers和torch库")
-        return {"未安装依赖": [{"entity": "请安装transformers和torch库", "position": 0, "context": "系统检测到未安装必要的依赖库"}]}
+    return recognize_entities_with_transformer_batch([text], model_name)[0]
+
+def recognize_entities_with_transformer_batch(texts, model_name=None, batch_size=None, use_server=True):
+    """
+    使用Transformer模型批量进行命名实体识别
+    
+    配置了ner_server_socket时，文本发给实体识别服务进程识别，本进程不加载模型；
+    服务进程繁忙或无法连接时使用规则匹配。
+    
+    所有文本先按模型的token长度限制切分为相互重叠的文本段（见_segment_text），再按长度排序后
+    分批送入模型，同一批中的文本段长度相近，填充（padding）最少；识别结果按文本段的偏移量
+    映射回原文，重叠区域中的重复结果只保留一份。
+    配置sentence_memo时（默认）以句子为单位识别，已识别过的句子直接使用缓存结果，不再推理。
+    
+    Args:
+        texts: 待识别的文本列表
+        model_name: 模型名称，如果为None则使用配置文件中的模型
+        batch_size: 每批处理的文本段数，如果为None则使用配置文件中的transformer_batch_size
+        use_server: 是否使用配置的实体识别服务进程（服务进程自身调用时为False）
     
+    Returns:
+        list: 与texts一一对应的识别结果，每项为按实体类型分组的实体字典
+    """
     config = get_llm_config()
+    if use_server and uses_ner_server(config):
+        return _recognize_with_server(texts, model_name, config["ner_server_socket"])
+    
+    if not transformer_backend_available(config):
+        print("Transformer模型不可用，请安装transformers和torch库（ONNX后端需要onnxruntime）")
+        return [{"未安装依赖": [{"entity": "请安装transformers和torch库", "position": 0, "context": "系统检测到未安装必要的依赖库"}]}
+                for _ in texts]
+    
     # 检查是否使用API模式
     if config.get("api_mode", False) and API_AVAILABLE:
-        return recognize_entities_with_api(text)
+        return [recognize_entities_with_api(text) for text in texts]
+    
+    model_name = model_name or config["model_name"]
+    if batch_size is None:
+        batch_size = config.get("transformer_batch_size", TRANSFORMER_BATCH_SIZE)
+    
+    # 缓存命中时无需加载模型
+    cache = get_ner_cache()
+    cache_version = get_transformer_cache_version(config, model_name)
+    results = [cache.get(text, CACHE_BACKEND_TRANSFORMER, cache_version) for text in texts]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
     
     ner_pipeline = load_transformer_model(model_name)
     
-    # 如果返回RULE_BASED，使用规则匹配
-    if ner_pipeline == "RULE_BASED":
-        return recognize_entities_with_rules(text)
+    for i in pending:
+        text = texts[i]
+        # 如果返回RULE_BASED，使用规则匹配
+        if ner_pipeline == "RULE_BASED":
+            results[i] = recognize_entities_with_rules(text)
+        # 如果返回API_MODE，使用API识别
+        elif ner_pipeline == "API_MODE":
+            results[i] = recognize_entities_with_api(text)
+        elif ner_pipeline is None:
+            results[i] = {"模型加载失败": [{"entity": "请检查模型配置", "position": 0, "context": "系统无法加载指定的Transformer模型"}]}
+    if isinstance(ner_pipeline, str) or ner_pipeline is None:
+        return results
     
-    # 如果返回API_MODE，使用API识别
-    if ner_pipeline == "API_MODE":
-        return recognize_entities_with_api(text)
+    recognize = lambda items: _recognize_with_pipeline(ner_pipeline, items, model_name, config, batch_size)
+    try:
+        if config.get("sentence_memo", True):
+            # 按句子识别，重复出现的句子使用缓存结果
+            grouped = get_sentence_memo(CACHE_BACKEND_TRANSFORMER, persist=True).recognize(
+                [texts[i] for i in pending], cache_version, recognize
+            )
+        else:
+            grouped = recognize([texts[i] for i in pending])
+    except Exception as e:
+        print(f"Transformer实体识别出错: {str(e)}")
+        print("尝试使用规则匹配替代")
+        for i in pending:
+            results[i] = recognize_entities_with_rules(texts[i])
+        return results
     
-    if ner_pipeline is None:
-        return {"模型加载失败": [{"entity": "请检查模型配置", "position": 0, "context": "系统无法加载指定的Transformer模型"}]}
+    for i, entities_by_type in zip(pending, grouped):
+        text = texts[i]
+        # 如果在线模型没有识别到实体，尝试使用规则匹配
+        if not entities_by_type:
+            print("在线模型未识别到实体，尝试使用规则匹配替代")
+            results[i] = recognize_entities_with_rules(text)
+            continue
+        
+        cache.put(text, CACHE_BACKEND_TRANSFORMER, cache_version, entities_by_type)
+        results[i] = entities_by_type
+    return results
+
+def _recognize_with_pipeline(ner_pipeline, texts, model_name, config, batch_size):
+    """
+    分段、批量推理并按实体类型分组
     
+    Returns:
+        list: 与texts一一对应的识别结果
+    """
+    tokenizer = getattr(ner_pipeline, 'tokenizer', None)
+    stride = config.get("transformer_stride", TRANSFORMER_STRIDE)
+    segment_entities = _run_pipeline_batched(
+        ner_pipeline,
+        [(i, offset, segment) for i, text in enumerate(texts)
+         for offset, segment in _segment_text(text, tokenizer, stride=stride)],
+        batch_size
+    )
+    return [_group_transformer_entities(text, segment_entities.get(i, []), model_name, config)
+            for i, text in enumerate(texts)]
+
+def _recognize_with_server(texts, model_name, socket_path):
+    """调用实体识别服务进程批量识别，服务繁忙或不可用时使用规则匹配替代"""
+    from ner_server import NERClient, NERServerBusy
+    
+    try:
+        return NERClient(socket_path).recognize(texts, model_name)
+    except NERServerBusy:
+        print("实体识别服务繁忙，使用规则匹配替代")
+    except Exception as e:
+        print(f"调用实体识别服务出错: {str(e)}，使用规则匹配替代")
+    return [recognize_entities_with_rules(text) for text in texts]
+
+def _segment_text(text, tokenizer=None, max_tokens=None, stride=TRANSFORMER_STRIDE):
+    """
+    按模型的token长度限制将文本切分为相互重叠的文本段
+    
+    文本只分词一次，按token数贪心装满每个文本段，分段处优先选在句末（。！？；等和换行），
+    句子超长时选在词的边界，不会把一个词的子词切开；相邻文本段重叠stride个token，
+    使分段处的实体在后一个文本段中有完整的上下文。
+    
+    Args:
+        text: 待切分的文本
+        tokenizer: 模型的分词器（需要fast tokenizer），为None时按每个非空白字符一个token估算
+        max_tokens: 每个文本段的token数上限，为None时使用模型长度限制减去特殊token
+        stride: 相邻文本段重叠的token数
+    
+    Returns:
+        list: [(文本段在原文中的偏移量, 文本段), ...]，按偏移量排序，不包含空白文本段
+    """
+    offsets, word_ids = _tokenize_offsets(text, tokenizer)
+    count = len(offsets)
+    if not count:
+        return []
+    if max_tokens is None:
+        max_tokens = _token_budget(tokenizer)
+    max_tokens = max(1, max_tokens)
+    stride = max(0, min(stride or 0, max_tokens // 2))
+    
+    # 可以分段的token位置：词的开头；句末之后的位置另外记录
+    word_cuts = [t for t in range(1, count) if word_ids[t] != word_ids[t - 1]]
+    sentence_cuts = [t for t in word_cuts
+                     if text[offsets[t - 1][1] - 1] in SENTENCE_DELIMITERS
+                     or '\n' in text[offsets[t - 1][1]:offsets[t][0]]]
+    
+    windows = []
+    start = 0
+    while True:
+        limit = start + max_tokens
+        if limit >= count:
+            windows.append((start, count))
+            break
+        end = (_last_cut(sentence_cuts, start + 1, limit) or _last_cut(word_cuts, start + 1, limit) or limit)
+        windows.append((start, end))
+        # 下一个文本段从end之前stride个token处开始，优先从句首开始
+        next_start = max(start + 1, end - stride)
+        start = (_first_cut(sentence_cuts, next_start, end - 1) or _first_cut(word_cuts, next_start, end - 1)
+                 or next_start)
+    
+    return [(offsets[first][0], text[offsets[first][0]:offsets[last - 1][1]]) for first, last in windows]
+
+def _tokenize_offsets(text, tokenizer):
+    """
+    分词并返回每个token在原文中的位置
+    
+    Returns:
+        tuple: ([(起始位置, 结束位置), ...], [所属词的序号, ...])
+    """
+    if tokenizer is not None and getattr(tokenizer, 'is_fast', False):
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        offsets = [tuple(offset) for offset in encoding['offset_mapping']]
+        return offsets, encoding.word_ids()
+    # 没有分词器时每个非空白字符计为一个token（不少于BERT类模型的token数），连续的字母数字视为一个词
+    offsets = []
+    word_ids = []
+    for word_id, match in enumerate(re.finditer(r'[A-Za-z0-9]+|\S', text)):
+        for position in range(match.start(), match.end()):
+            offsets.append((position, position + 1))
+            word_ids.append(word_id)
+    return offsets, word_ids
+
+def _token_budget(tokenizer):
+    """每个文本段可以容纳的token数：模型长度限制减去[CLS]、[SEP]等特殊token"""
+    if tokenizer is None:
+        return TRANSFORMER_MAX_LENGTH - 2
+    max_length = getattr(tokenizer, 'model_max_length', None) or TRANSFORMER_MAX_LENGTH
+    # 未设置长度限制时transformers返回一个极大的整数
+    max_length = min(max_length, TRANSFORMER_MAX_LENGTH)
+    try:
+        special = tokenizer.num_special_tokens_to_add(pair=False)
+    except Exception:
+        special = 2
+    return max_length - special
+
+def _last_cut(cuts, low, high):
+    """cuts中位于[low, high]内的最后一个位置，没有时返回None"""
+    index = bisect.bisect_right(cuts, high) - 1
+    return cuts[index] if index >= 0 and cuts[index] >= low else None
+
+def _first_cut(cuts, low, high):
+    """cuts中位于[low, high]内的第一个位置，没有时返回None"""
+    index = bisect.bisect_left(cuts, low)
+    return cuts[index] if index < len(cuts) and cuts[index] <= high else None
+
+def _owned_ranges(segments):
+    """
+    计算每个文本段负责的原文区间：相邻文本段重叠时以重叠区域的中点为界，
+    实体只保留在起始位置所属的文本段中，使重叠区域中重复识别的实体只保留一份
+    
+    Args:
+        segments: [(文本序号, 偏移量, 文本段), ...]
+    
+    Returns:
+        dict: {(文本序号, 偏移量): (起始位置, 结束位置)}
+    """
+    spans_by_text = {}
+    for index, offset, segment in segments:
+        spans_by_text.setdefault(index, []).append((offset, offset + len(segment)))
+    
+    ranges = {}
+    for index, spans in spans_by_text.items():
+        spans.sort()
+        bounds = [0]
+        for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+            bounds.append((start + previous_end) // 2 if start < previous_end else start)
+        bounds.append(float('inf'))
+        for k, (start, _) in enumerate(spans):
+            ranges[(index, start)] = (bounds[k], bounds[k + 1])
+    return ranges
+
+def _run_pipeline_batched(ner_pipeline, segments, batch_size):
+    """
+    按长度分组批量推理
+    
+    Args:
+        ner_pipeline: NER pipeline
+        segments: [(文本序号, 偏移量, 文本段), ...]
+        batch_size: 每批处理的文本段数
+    
+    Returns:
+        dict: {文本序号: [实体, ...]}，实体位置已加上文本段偏移量，按位置排序
+    """
+    batch_size = max(1, int(batch_size))
+    owned = _owned_ranges(segments)
+    # 按长度排序，使同一批中的文本段长度相近
+    ordered = sorted(segments, key=lambda item: len(item[2]))
+    entities_by_text = {}
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        try:
+            outputs = ner_pipeline([segment for _, _, segment in batch], batch_size=len(batch))
+        except Exception as batch_error:
+            # 整批失败时逐段处理，只跳过出错的文本段
+            print(f"批量处理文本段出错，改为逐段处理: {str(batch_error)}")
+            outputs = []
+            for _, _, segment in batch:
+                try:
+                    outputs.append(ner_pipeline(segment))
+                except Exception as segment_error:
+                    print(f"处理文本段落出错: {str(segment_error)}")
+                    outputs.append([])
+        for (index, offset, _), entities in zip(batch, outputs):
+            low, high = owned[(index, offset)]
+            kept = entities_by_text.setdefault(index, [])
+            # 调整位置偏移，只保留本文本段负责区间内的实体
+            for entity in entities:
+                entity['start'] += offset
+                entity['end'] += offset
+                if low <= entity['start'] < high:
+                    kept.append(entity)
+    for entities in entities_by_text.values():
+        entities.sort(key=lambda entity: (entity['start'], entity['end']))
+    return entities_by_text
+
+def _group_transformer_entities(text, all_entities, model_name, config):
+    """合并相邻的同类实体，并按实体类型分组"""
     custom_entity_types = config["custom_entity_types"]
     chinese_medical_entity_types = config.get("chinese_medical_entity_types", {})
     
-    try:
-        # 判断文本是否包含中文
-        has_chinese = any('\u4e00' <= char <= '\u9fff' for char in text)
-        
-        # 分段处理长文本，避免超出模型最大长度限制
-        max_length = 510  # 留出[CLS]和[SEP]的空间
-        segments = []
-        
-        # 如果是中文，按字符级别分割
-        if has_chinese:
-            # 中文文本按照句子分割，避免实体被截断
-            sentences = re.split(r'([。！？；.!?;])', text)
-            current_segment = ""
-            
-            for i in range(0, len(sentences), 2):
-                sentence = sentences[i]
-                delimiter = sentences[i+1] if i+1 < len(sentences) else ""
-                
-                if len(current_segment) + len(sentence) + len(delimiter) <= max_length:
-                    current_segment += sentence + delimiter
-                else:
-                    if current_segment:
-                        segments.append(current_segment)
-                    current_segment = sentence + delimiter
-            
-            if current_segment:
-                segments.append(current_segment)
+    # 合并相邻相同类型的实体
+    merged_entities = []
+    current_entity = None
+    
+    # 使用aggregation_strategy时结果中的标签为entity_group，否则为entity
+    label = lambda entity: entity.get('entity_group', entity.get('entity'))
+    for entity in all_entities:
+        if current_entity is None:
+            current_entity = entity.copy()
+        elif (label(entity) == label(current_entity) and 
+              entity['start'] <= current_entity['end'] + 1):
+            # 合并相邻实体
+            current_entity['end'] = entity['end']
+            current_entity['word'] = text[current_entity['start']:current_entity['end']]
+            current_entity['score'] = max(current_entity['score'], entity['score'])
         else:
-            # 英文文本按固定长度分割
-            segments = [text[i:i+max_length] for i in range(0, len(text), max_length)]
-        
-        # 如果没有分段，则处理整个文本
-        if not segments:
-            segments = [text]
-        
-        all_entities = []
-        offset = 0
-        
-        for segment in segments:
-            if not segment.strip():
-                offset += len(segment)
-                continue
-                
-            try:
-                # 使用pipeline处理文本
-                entities = ner_pipeline(segment)
-                # 调整位置偏移
-                for entity in entities:
-                    entity['start'] += offset
-                    entity['end'] += offset
-                all_entities.extend(entities)
-            except Exception as segment_error:
-                print(f"处理文本段落出错: {str(segment_error)}")
-                
-            offset += len(segment)
+            merged_entities.append(current_entity)
+            current_entity = entity.copy()
+    
+    if current_entity is not None:
+        merged_entities.append(current_entity)
+    
+    # 按实体类型分组
+    entities_by_type = {}
+    for entity in merged_entities:
+        # 提取实体类型（处理不同模型的标签差异）
+        entity_type = None
+        if 'entity_group' in entity:
+            entity_type = entity['entity_group']
+        elif 'entity' in entity:
+            # 从B-XXX或I-XXX中提取XXX
+            if '-' in entity['entity']:
+                entity_type = entity['entity'].split('-')[-1]
+            else:
+                entity_type = entity['entity']
         
-        # 合并相邻相同类型的实体
-        merged_entities = []
-        current_entity = None
+        if not entity_type:
+            continue
+            
+        entity_text = text[entity['start']:entity['end']]
         
-        for entity in all_entities:
-            if current_entity is None:
-                current_entity = entity.copy()
-            elif (entity['entity'] == current_entity['entity'] and 
-                  entity['start'] <= current_entity['end'] + 1):
-                # 合并相邻实体
-                current_entity['end'] = entity['end']
-                current_entity['word'] = text[current_entity['start']:current_entity['end']]
-                current_entity['score'] = max(current_entity['score'], entity['score'])
-            else:
-                merged_entities.append(current_entity)
-                current_entity = entity.copy()
+        # 根据模型类型选择合适的映射
+        if "chinese" in model_name.lower() or "med" in model_name.lower():
+            mapped_type = chinese_medical_entity_types.get(entity_type, entity_type)
+        else:
+            mapped_type = custom_entity_types.get(entity_type, entity_type)
         
-        if current_entity is not None:
-            merged_entities.append(current_entity)
+        if mapped_type not in entities_by_type:
+            entities_by_type[mapped_type] = []
         
-        # 按实体类型分组
-        entities_by_type = {}
-        for entity in merged_entities:
-            # 提取实体类型（处理不同模型的标签差异）
-            entity_type = None
-            if 'entity_group' in entity:
-                entity_type = entity['entity_group']
-            elif 'entity' in entity:
-                # 从B-XXX或I-XXX中提取XXX
-                if '-' in entity['entity']:
-                    entity_type = entity['entity'].split('-')[-1]
-                else:
-                    entity_type = entity['entity']
-            
-            if not entity_type:
-                continue
-                
-            entity_text = text[entity['start']:entity['end']]
-            
-            # 根据模型类型选择合适的映射
-            if "chinese" in model_name.lower() or "med" in model_name.lower():
-                mapped_type = chinese_medical_entity_types.get(entity_type, entity_type)
-            else:
-                mapped_type = custom_entity_types.get(entity_type, entity_type)
-            
-            if mapped_type not in entities_by_type:
-                entities_by_type[mapped_type] = []
-            
-            # 获取上下文
-            context_start = max(0, entity['start'] - 10)
-            context_end = min(len(text), entity['end'] + 10)
-            context = text[context_start:context_end]
-            
-            entities_by_type[mapped_type].append({
-                'entity': entity_text,
-                'position': entity['start'],
-                'context': context,
-                'score': round(entity['score'], 3) if 'score' in entity else 1.0
-            })
+        # 获取上下文
+        context_start = max(0, entity['start'] - 10)
+        context_end = min(len(text), entity['end'] + 10)
+        context = text[context_start:context_end]
         
-        # 如果在线模型没有识别到实体，尝试使用规则匹配
-        if not entities_by_type:
-            print("在线模型未识别到实体，尝试使用规则匹配替代")
-            return recognize_entities_with_rules(text)
-            
-        return entities_by_type
+        entities_by_type[mapped_type].append({
+            'entity': entity_text,
+            'position': entity['start'],
+            'context': context,
+            # 管道返回的分数为numpy.float32，转换为float后才能写入缓存和JSON响应
+            'score': round(float(entity['score']), 3) if 'score' in entity else 1.0
+        })
     
-    except Exception as e:
-        print(f"Transformer实体识别出错: {str(e)}")
-        print("尝试使用规则匹配替代")
-        return recognize_entities_with_rules(text)
+    return entities_by_type
 
 # 统计实体频率
 def calculate_entity_statistics(recognized_entities):
@@ -686,6 +1753,3 @@ def calculate_entity_statistics(recognized_entities):
         entity_statistics[entity_type] = dict(entity_counts)
     
     return entity_statistics
-
-# 初始化配置
-init_config() 
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+大模型流式响应解析模块
+
+API模式下模型生成完整的实体JSON需要数十秒，用户要等到全部生成后才能看到结果。
+流式请求（"stream": true）时模型边生成边返回，本模块负责：
+- 读取OpenAI兼容格式的流式响应（Server-Sent Events，每行"data: {...}"，以"data: [DONE]"结束），
+  逐段取出模型生成的文本
+- 增量解析实体JSON：{"类型": [{"entity": ..., "position": ...}, ...], ...}，
+  每当一个实体对象完整时立即返回，不需要等待整个JSON结束
+- 生成发给浏览器的Server-Sent Events消息
+"""
+import json
+
+# 流式响应中表示结束的数据
+STREAM_DONE = '[DONE]'
+
+
+class IncrementalEntityParser:
+    """
+    增量解析模型返回的实体JSON
+
+    JSON之前的说明文字和```json标记被忽略，JSON结束后的内容也被忽略。
+    只解析“类型 -> 实体对象列表”这一种结构，字符串中的括号和转义字符不影响解析。
+    说明文字中的花括号（如“按{类型: [实体]}格式返回”）不是合法的JSON，解析到不合法的字符时
+    从头重新查找JSON的开始；代码块之外的JSON结束后又出现```代码块时，改为解析代码块中的JSON。
+    """
+
+    # 第一层中期望的下一个记号
+    _EXPECT_KEY_OR_END = 'key_or_end'
+    _EXPECT_KEY = 'key'
+    _EXPECT_COLON = 'colon'
+    _EXPECT_VALUE = 'value'
+    _EXPECT_COMMA_OR_END = 'comma_or_end'
+
+    def __init__(self):
+        self.started = False    # 是否遇到了JSON的开始
+        self.finished = False   # JSON是否已结束（完整解析了一个合法的JSON对象）
+        self._fence_open = False    # 当前是否在```代码块中
+        self._fenced = False        # 正在解析的JSON是否在代码块中
+        self._ticks = 0             # JSON之外连续的反引号数
+        self._restart()
+
+    def _restart(self):
+        """丢弃已读取的内容，重新查找JSON的开始"""
+        self.started = False
+        self.finished = False
+        self._depth = 0
+        self._expect = None
+        self._in_string = False
+        self._escape = False
+        self._string = []       # 第一层中正在读取的字符串（实体类型）
+        self._last_string = None
+        self._key = None        # 当前的实体类型
+        self._object = None     # 正在读取的实体对象的字符
+
+    def _scan(self, char):
+        """JSON之外的字符：记录```代码块标记，遇到{时开始解析"""
+        if char == '`':
+            self._ticks += 1
+            if self._ticks == 3:
+                self._ticks = 0
+                self._fence_open = not self._fence_open
+                if self.finished and self._fence_open:
+                    # 代码块之外的JSON（如说明文字中的示例）之后出现了代码块，以代码块中的JSON为准
+                    self._restart()
+            return
+        self._ticks = 0
+        if char == '{' and not self.finished:
+            self.started = True
+            self._fenced = self._fence_open
+            self._depth = 1
+            self._expect = self._EXPECT_KEY_OR_END
+
+    def feed(self, delta):
+        """
+        输入模型新生成的一段文本
+
+        Returns:
+            list: 本段文本中完整结束的实体，[(实体类型, 实体对象dict), ...]
+        """
+        entities = []
+        for char in delta:
+            if self.finished and self._fenced:
+                break
+            if not self.started or self.finished:
+                self._scan(char)
+                continue
+
+            if self._object is not None:
+                self._object.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = _decode_string(''.join(self._string))
+                        self._expect = self._EXPECT_COLON
+                if self._depth == 1 and self._in_string:
+                    self._string.append(char)
+                continue
+
+            if self._depth == 1:
+                if not self._feed_top_level(char):
+                    # 不是合法的JSON（如说明文字中的花括号），重新查找
+                    self._restart()
+                    self._scan(char)
+                continue
+
+            if char == '`':
+                self._restart()
+                self._scan(char)
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if char == '{' and self._depth == 3:
+                    self._object = [char]
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 2 and self._object is not None:
+                    entity = self._parse_object(''.join(self._object))
+                    self._object = None
+                    if entity is not None and self._key is not None:
+                        entities.append((self._key, entity))
+                elif self._depth == 1:
+                    self._expect = self._EXPECT_COMMA_OR_END
+        return entities
+
+    def _feed_top_level(self, char):
+        """第一层（类型 -> 实体列表）中的一个字符，不合法时返回False"""
+        if char.isspace():
+            return True
+        expect = self._expect
+        if char == '"' and expect in (self._EXPECT_KEY_OR_END, self._EXPECT_KEY):
+            self._in_string = True
+            self._string = []
+        elif char == ':' and expect == self._EXPECT_COLON:
+            self._key = self._last_string
+            self._expect = self._EXPECT_VALUE
+        elif char == '[' and expect == self._EXPECT_VALUE:
+            self._depth = 2
+        elif char == ',' and expect == self._EXPECT_COMMA_OR_END:
+            self._expect = self._EXPECT_KEY
+        elif char == '}' and expect in (self._EXPECT_KEY_OR_END, self._EXPECT_COMMA_OR_END):
+            self._depth = 0
+            self.finished = True
+        else:
+            return False
+        return True
+
+    @staticmethod
+    def _parse_object(raw):
+        try:
+            entity = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(entity, dict) and isinstance(entity.get('entity'), str) and entity['entity']:
+            return entity
+        return None
+
+
+def _decode_string(raw):
+    """解码JSON字符串的内容（去掉引号后的原始字符，含\\uXXXX等转义）"""
+    try:
+        return json.loads('"' + raw + '"')
+    except json.JSONDecodeError:
+        return raw
+
+
+def iter_stream_content(response):
+    """
+    逐段读取OpenAI兼容格式的流式响应中模型生成的文本
+
+    Args:
+        response: 以stream=True发送的requests响应
+
+    Yields:
+        str: 模型新生成的文本
+    """
+    # 流式响应通常不声明字符集，requests会按ISO-8859-1解码
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == STREAM_DONE:
+            break
+        try:
+            choices = json.loads(data).get('choices') or [{}]
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        content = (choices[0].get('delta') or {}).get('content')
+        if content:
+            yield content
+
+
+def format_sse(event, data):
+    """生成一条发给浏览器的Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,6 +1,8 @@
 import os
 import json
 import re
+from data_store import get_data_store
+from entity_matcher import get_entity_matcher, EntityMatcher, SOURCE_CUSTOM
 
 # 医学实体配置文件路径
 ENTITIES_CONFIG_FILE = 'data/medical_entities.json'
@@ -44,26 +46,18 @@ def init_medical_entities():
 
 # 获取医学实体
 def get_medical_entities():
-    """获取医学实体字典"""
+    """获取医学实体字典（从规则库读取并按变更计数器缓存；返回的字典不应被直接修改）"""
     try:
-        # 确保配置文件存在
-        init_medical_entities()
-        
-        with open(ENTITIES_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_data_store().get_entities()
     except Exception as e:
         print(f"读取医学实体配置出错: {str(e)}")
         return DEFAULT_ENTITIES
 
 # 保存医学实体
 def save_medical_entities(entities):
-    """保存医学实体字典"""
+    """用给定的字典整体替换规则库中的医学实体字典"""
     try:
-        if not os.path.exists('data'):
-            os.makedirs('data', exist_ok=True)
-            
-        with open(ENTITIES_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(entities, f, ensure_ascii=False, indent=2)
+        get_data_store().replace_entities(entities)
         return True
     except Exception as e:
         print(f"保存医学实体配置出错: {str(e)}")
@@ -82,36 +76,9 @@ def recognize_entities(text, entity_dict=None):
         dict: 识别到的实体字典，按实体类型分组
     """
     if entity_dict is None:
-        entity_dict = get_medical_entities()
-    
-    recognized = {}
-    
-    # 对每种实体类型进行识别
-    for entity_type, entities in entity_dict.items():
-        found = []
-        for entity in entities:
-            # 查找所有匹配
-            start = 0
-            while True:
-                pos = text.find(entity, start)
-                if pos == -1:
-                    break
-                
-                # 获取上下文
-                context_start = max(0, pos - 10)
-                context_end = min(len(text), pos + len(entity) + 10)
-                context = text[context_start:context_end]
-                
-                # 添加到结果中
-                found.append({
-                    'entity': entity,
-                    'position': pos,
-                    'context': context
-                })
-                
-                start = pos + len(entity)
-        
-        if found:
-            recognized[entity_type] = found
+        # 使用与规则库同步的共享匹配器
+        matcher = get_entity_matcher()
+    else:
+        matcher = EntityMatcher.from_dicts({SOURCE_CUSTOM: entity_dict})
     
-    return recognized 
\ No newline at end of file
+    return matcher.recognize(text)
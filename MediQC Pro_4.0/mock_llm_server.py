@@ -0,0 +1,310 @@
+"""
+本地模拟大模型API服务
+
+没有可用的DeepSeek/豆包API时，用本服务测试和压测llm_ner的API识别路径。服务理解llm_ner
+构建的两种请求格式和两种提示词：
+- 请求格式：chat-completions格式（DeepSeek及自定义API，请求体含messages，支持"stream": true
+  流式响应）和豆包格式（请求体含prompt，响应为{"response": ...}）
+- 提示词：单个文本的识别提示词和多条文本合并的提示词（【编号】开头），按编号返回结果
+
+识别结果来自预设的实体词表（默认为内置的常见医学实体，可用--entities指定JSON文件，
+格式为{"实体类型": ["实体", ...]}），返回文本中出现的所有词表实体及其位置。
+响应耗时、出错比例、返回无法解析内容的比例和最大并发数均可配置，GET /stats返回请求统计。
+
+用法（在MediQC Pro_4.0目录下运行）：
+    python mock_llm_server.py
+    python mock_llm_server.py --port 8765 --latency-ms 800 --per-char-ms 2 --error-rate 0.05 --max-concurrency 8
+然后在data/llm_config.json中设置"api_url": "http://127.0.0.1:8765/v1"，"api_key"设为任意非空值。
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认监听地址
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 默认的实体词表
+DEFAULT_ENTITIES = {
+    "疾病": ["高血压", "糖尿病", "冠心病", "肺炎", "胃炎", "阑尾炎", "脑梗死", "偏头痛", "贫血", "哮喘"],
+    "症状": ["头痛", "头晕", "发热", "咳嗽", "咳痰", "胸闷", "胸痛", "腹痛", "恶心", "呕吐", "乏力", "心悸"],
+    "身体部位": ["头部", "胸部", "腹部", "右下腹", "双肺", "心脏", "肝脏", "肾脏"],
+    "治疗": ["手术", "输液", "抗感染治疗", "降压治疗"],
+    "检查": ["血常规", "心电图", "胸部CT", "腹部CT", "B超", "核磁共振"],
+    "药物": ["阿司匹林", "头孢", "胰岛素", "硝苯地平", "布洛芬"]
+}
+
+# 默认耗时：首个token之前的延迟和每个输出字符的生成时间（毫秒）
+DEFAULT_LATENCY_MS = 300
+DEFAULT_PER_CHAR_MS = 0.5
+
+# 注入错误时返回的状态码
+DEFAULT_ERROR_CODES = (429, 500, 503)
+
+# 流式响应每个片段的字符数
+STREAM_CHUNK_CHARS = 8
+
+# 从llm_ner的提示词中取出待识别文本
+SINGLE_PROMPT = re.compile(r'格式为JSON：\n([\s\S]*?)\n\n请将结果按照')
+BATCH_PROMPT = re.compile(r'各条文本相互独立。\n([\s\S]*?)\n\n请返回一个JSON对象')
+RECORD_SPLIT = re.compile(r'(?:^|\n)【(\d+)】')
+
+
+def find_entities(text, entities_by_type):
+    """
+    在文本中查找词表实体（较长的实体优先，互不重叠）
+
+    Returns:
+        dict: {实体类型: [{"entity": 实体, "position": 位置}, ...]}
+    """
+    terms = sorted(((term, entity_type) for entity_type, terms in entities_by_type.items() for term in terms),
+                   key=lambda item: -len(item[0]))
+    taken = [False] * len(text)
+    found = {}
+    for term, entity_type in terms:
+        start = text.find(term)
+        while start != -1:
+            end = start + len(term)
+            if not any(taken[start:end]):
+                taken[start:end] = [True] * len(term)
+                found.setdefault(entity_type, []).append({"entity": term, "position": start})
+            start = text.find(term, end)
+    for entities in found.values():
+        entities.sort(key=lambda entity: entity["position"])
+    return found
+
+
+def build_reply(prompt, entities_by_type):
+    """按提示词的格式生成模型回复（JSON文本）"""
+    match = BATCH_PROMPT.search(prompt)
+    if match:
+        parts = RECORD_SPLIT.split(match.group(1))
+        reply = {number: find_entities(record, entities_by_type)
+                 for number, record in zip(parts[1::2], parts[2::2])}
+    else:
+        match = SINGLE_PROMPT.search(prompt)
+        reply = find_entities(match.group(1) if match else prompt, entities_by_type)
+    return "```json\n" + json.dumps(reply, ensure_ascii=False, indent=2) + "\n```"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server.snapshot())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        server = self.server
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        if not server.enter():
+            server.count('rejected')
+            self.send_response(429)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        try:
+            server.count('requests')
+            time.sleep(server.latency())
+            if random.random() < server.error_rate:
+                server.count('errors')
+                self._send_json(random.choice(server.error_codes), {"error": "injected error"})
+                return
+
+            if 'messages' in request:
+                prompt = request['messages'][-1].get('content', '')
+            else:
+                prompt = request.get('prompt', '')
+            if random.random() < server.malformed_rate:
+                server.count('malformed')
+                reply = "抱歉，我无法处理这个请求。"
+            else:
+                reply = build_reply(prompt, server.entities)
+            usage = {"prompt_tokens": len(prompt), "completion_tokens": len(reply),
+                     "total_tokens": len(prompt) + len(reply)}
+
+            if 'messages' not in request:
+                time.sleep(server.generation_time(reply))
+                self._send_json(200, {"response": reply, "usage": usage})
+            elif request.get('stream'):
+                self._stream(reply)
+            else:
+                time.sleep(server.generation_time(reply))
+                self._send_json(200, {
+                    "id": f"mock-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "model": request.get('model', 'mock'),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+        finally:
+            server.leave()
+
+    def _stream(self, reply):
+        """以chat-completions的流式格式逐段返回回复"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [reply[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(reply), STREAM_CHUNK_CHARS)]
+        for piece in pieces:
+            time.sleep(self.server.generation_time(piece))
+            self._write_chunk('data: ' + json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]},
+                                                    ensure_ascii=False) + '\n\n')
+        self._write_chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """模拟大模型API服务，每个连接一个线程（支持keep-alive）"""
+
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, latency_ms=DEFAULT_LATENCY_MS, jitter_ms=0,
+                 per_char_ms=DEFAULT_PER_CHAR_MS, error_rate=0.0, error_codes=DEFAULT_ERROR_CODES,
+                 malformed_rate=0.0, max_concurrency=0, entities=None, verbose=False):
+        """
+        Args:
+            latency_ms (float): 开始返回结果前的延迟
+            jitter_ms (float): 延迟的随机波动范围（0到该值之间均匀分布）
+            per_char_ms (float): 每个输出字符的生成时间
+            error_rate (float): 返回错误状态码的比例
+            error_codes (tuple): 注入错误时随机选择的状态码
+            malformed_rate (float): 返回无法解析的回复的比例
+            max_concurrency (int): 同时处理的请求数上限，超过时返回429，0表示不限制
+            entities (dict): 实体词表，默认为DEFAULT_ENTITIES
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_char_ms = per_char_ms
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.malformed_rate = malformed_rate
+        self.max_concurrency = max_concurrency
+        self.entities = entities or DEFAULT_ENTITIES
+        self.verbose = verbose
+        self.stats = {'requests': 0, 'errors': 0, 'malformed': 0, 'rejected': 0,
+                      'in_flight': 0, 'peak_in_flight': 0}
+        self._lock = threading.Lock()
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self):
+        """llm_ner配置中使用的api_url"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def latency(self):
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+    def generation_time(self, text):
+        return len(text) * self.per_char_ms / 1000
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def enter(self):
+        """开始处理一个请求，并发数已达上限时返回False"""
+        with self._lock:
+            if self.max_concurrency and self.stats['in_flight'] >= self.max_concurrency:
+                return False
+            self.stats['in_flight'] += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.stats['in_flight'] -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭keep-alive连接（如流式请求中途断开）是正常情况，不输出异常堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError) and not self.verbose:
+            return
+        super().handle_error(request, client_address)
+
+
+def start_mock_server(**options):
+    """
+    在后台线程中启动模拟服务（端口默认由系统分配），用于测试和基准测试
+
+    Returns:
+        MockLLMServer: 已启动的服务，url属性为api_url，用完后调用shutdown()
+    """
+    options.setdefault('port', 0)
+    server = MockLLMServer(**options)
+    threading.Thread(target=server.serve_forever, name='mock-llm-server', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟大模型API服务')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_LATENCY_MS, help='开始返回结果前的延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='延迟的随机波动范围（毫秒）')
+    parser.add_argument('--per-char-ms', type=float, default=DEFAULT_PER_CHAR_MS, help='每个输出字符的生成时间（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误状态码的比例（0~1）')
+    parser.add_argument('--error-codes', type=int, nargs='+', default=list(DEFAULT_ERROR_CODES),
+                        help='注入错误时随机选择的状态码')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='返回无法解析的回复的比例（0~1）')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='同时处理的请求数上限，超过时返回429')
+    parser.add_argument('--entities', help='实体词表JSON文件：{"实体类型": ["实体", ...]}')
+    parser.add_argument('--verbose', action='store_true', help='输出每个请求的访问日志')
+    args = parser.parse_args(argv)
+
+    entities = None
+    if args.entities:
+        with open(args.entities, 'r', encoding='utf-8') as f:
+            entities = json.load(f)
+
+    server = MockLLMServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.per_char_ms,
+                           args.error_rate, args.error_codes, args.malformed_rate, args.max_concurrency,
+                           entities, args.verbose)
+    print(f"模拟大模型API服务已启动，api_url: {server.url}（统计: http://{args.host}:{server.server_address[1]}/stats）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
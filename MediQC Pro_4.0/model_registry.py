@@ -0,0 +1,112 @@
+"""
+模型注册表模块
+
+加载一次Transformer模型需要数秒到数十秒并占用数GB内存，不能在每次识别时重新加载。
+注册表按模型键（模型名称/路径及影响加载的配置项）缓存已加载的模型：
+- 每个进程中同一个键只加载一次，多个线程同时请求同一模型时只有一个线程执行加载
+- 加载失败（加载函数返回None）不会被缓存，下次请求时重试
+- reload()加载新模型后再替换旧模型，替换前的请求继续使用旧模型；unload()释放模型
+
+使用gunicorn的preload_app时，可在主进程预热阶段加载模型，工作进程通过写时复制共享。
+"""
+import gc
+import time
+import threading
+
+
+class ModelRegistry:
+    """按键缓存已加载模型的注册表（线程安全）"""
+
+    def __init__(self):
+        self._models = {}        # {键: {'model': 模型, 'loaded_at': 加载时间, 'load_seconds': 加载耗时}}
+        self._key_locks = {}     # {键: 加载锁}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key, loader):
+        start = time.time()
+        model = loader()
+        if model is not None:
+            self._models[key] = {
+                'model': model,
+                'loaded_at': time.time(),
+                'load_seconds': round(time.time() - start, 3)
+            }
+        return model
+
+    def get(self, key, loader):
+        """
+        获取模型，尚未加载时调用loader()加载
+
+        Args:
+            key: 模型键（可哈希），应包含所有影响加载结果的配置项
+            loader (callable): 无参数的加载函数，失败时返回None
+
+        Returns:
+            加载的模型，加载失败时返回None
+        """
+        entry = self._models.get(key)
+        if entry is not None:
+            return entry['model']
+        with self._key_lock(key):
+            entry = self._models.get(key)
+            if entry is not None:
+                return entry['model']
+            return self._load(key, loader)
+
+    def reload(self, key, loader):
+        """
+        重新加载模型（如模型文件已更新），加载成功后替换旧模型，失败时保留旧模型
+
+        Returns:
+            新加载的模型，加载失败时返回None
+        """
+        with self._key_lock(key):
+            return self._load(key, loader)
+
+    def unload(self, key=None):
+        """
+        释放模型
+
+        Args:
+            key: 要释放的模型键，None表示释放全部模型
+
+        Returns:
+            int: 释放的模型数量
+        """
+        with self._lock:
+            keys = list(self._models) if key is None else [key] if key in self._models else []
+            for k in keys:
+                del self._models[k]
+        if keys:
+            gc.collect()
+        return len(keys)
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def info(self):
+        """
+        已加载模型的信息
+
+        Returns:
+            list: [{'key': 模型键, 'loaded_at': 加载时间, 'load_seconds': 加载耗时}, ...]
+        """
+        return [{'key': list(key) if isinstance(key, tuple) else key,
+                 'loaded_at': entry['loaded_at'],
+                 'load_seconds': entry['load_seconds']}
+                for key, entry in list(self._models.items())]
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry():
+    """获取进程内共享的模型注册表"""
+    return _registry
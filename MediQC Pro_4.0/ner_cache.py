@@ -0,0 +1,220 @@
+"""
+实体识别结果缓存模块
+
+同一份病历文本经常被重复识别（重新提交、批量任务重跑、在词典页面和大模型页面分别识别），
+API后端每次识别都要付费并等待数秒。本模块按“文本摘要+识别后端+词典/模型版本”缓存识别结果：
+- 内存层：每个进程一个LRU缓存，命中时不需要访问磁盘
+- 磁盘层：SQLite数据库（artifacts/ner_cache.db），多个工作进程和进程重启后共享，
+  只用于识别代价较高的后端（API、Transformer），超过容量上限时按最近访问时间淘汰
+
+识别结果中的位置和上下文都相对于原文，因此缓存键直接使用原文的摘要，不做会改变字符
+位置的规范化（如去除空白、转换换行符）。词典或模型配置变化后版本号随之变化，旧的缓存
+不再被命中，最终被淘汰。
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlite_utils import SQLiteDatabase
+
+# 磁盘缓存数据库
+NER_CACHE_FILE = 'artifacts/ner_cache.db'
+
+# 默认容量
+DEFAULT_MEMORY_ENTRIES = 2048        # 每个进程内存中缓存的结果数
+DEFAULT_MAX_DISK_ENTRIES = 200000    # 磁盘中缓存的结果数上限
+EVICT_INTERVAL_PUTS = 500            # 每写入多少条检查一次磁盘容量
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ner_cache (
+    key TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ner_cache_last_access ON ner_cache(last_access);
+"""
+
+
+def cache_key(text, backend, version):
+    """
+    计算缓存键
+
+    Args:
+        text (str): 原文
+        backend (str): 识别后端，如rules、api、transformer
+        version (str): 词典或模型配置的版本
+
+    Returns:
+        str: SHA-256十六进制摘要
+    """
+    digest = hashlib.sha256()
+    for part in (backend, str(version), text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class NERCache:
+    """两级（内存LRU+SQLite）实体识别结果缓存"""
+
+    def __init__(self, path=NER_CACHE_FILE, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        """
+        Args:
+            path (str): 磁盘缓存数据库路径，None表示只使用内存缓存
+            memory_entries (int): 内存中缓存的结果数
+            max_disk_entries (int): 磁盘中缓存的结果数上限
+        """
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()    # {缓存键: 结果JSON}，结果以JSON保存，命中时返回新的副本
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._db = None
+        if path:
+            self._db = SQLiteDatabase(path)
+            self._db.connect().executescript(SCHEMA)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, text, backend, version, persist=True):
+        """
+        查找缓存的识别结果
+
+        Args:
+            persist (bool): 内存未命中时是否查找磁盘缓存
+
+        Returns:
+            dict: 识别结果（新的副本，可以修改），未命中时返回None
+        """
+        key = cache_key(text, backend, version)
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return json.loads(value)
+
+        if persist and self._db is not None:
+            try:
+                conn = self._db.connect()
+                row = conn.execute('SELECT result FROM ner_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE ner_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+                    self._remember(key, row['result'])
+                    self.stats['disk_hits'] += 1
+                    return json.loads(row['result'])
+            except Exception as e:
+                print(f"读取实体识别缓存出错: {str(e)}")
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, text, backend, version, result, persist=True):
+        """
+        保存识别结果
+
+        Args:
+            persist (bool): 是否同时写入磁盘缓存
+        """
+        key = cache_key(text, backend, version)
+        try:
+            value = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            # 结果中含有不能序列化的值（如numpy数值）时不缓存，不影响本次识别
+            print(f"实体识别结果无法缓存: {str(e)}")
+            return
+        self._remember(key, value)
+        if not persist or self._db is None:
+            return
+        try:
+            now = time.time()
+            self._db.connect().execute(
+                'INSERT OR REPLACE INTO ner_cache (key, backend, result, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)', (key, backend, value, now, now)
+            )
+            self._puts += 1
+            if self._puts % EVICT_INTERVAL_PUTS == 0:
+                self.evict()
+        except Exception as e:
+            print(f"写入实体识别缓存出错: {str(e)}")
+
+    def get_or_compute(self, text, backend, version, compute, persist=True, cacheable=None):
+        """
+        查找缓存，未命中时调用compute(text)识别并缓存结果
+
+        Args:
+            compute (callable): 识别函数
+            persist (bool): 是否使用磁盘缓存
+            cacheable (callable): 判断结果是否可以缓存的函数（如排除出错时的降级结果），默认全部缓存
+
+        Returns:
+            dict: 识别结果
+        """
+        result = self.get(text, backend, version, persist)
+        if result is not None:
+            return result
+        result = compute(text)
+        if result is not None and (cacheable is None or cacheable(result)):
+            self.put(text, backend, version, result, persist)
+        return result
+
+    def evict(self):
+        """磁盘缓存超过容量上限时，按最近访问时间删除最旧的结果，返回删除的条数"""
+        if self._db is None:
+            return 0
+        with self._db.write_transaction() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM ner_cache').fetchone()[0]
+            excess = count - self.max_disk_entries
+            if excess <= 0:
+                return 0
+            conn.execute(
+                'DELETE FROM ner_cache WHERE key IN '
+                '(SELECT key FROM ner_cache ORDER BY last_access LIMIT ?)', (excess,)
+            )
+        return excess
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db.write_transaction() as conn:
+                conn.execute('DELETE FROM ner_cache')
+
+    def disk_entries(self):
+        """磁盘缓存中的结果数"""
+        if self._db is None:
+            return 0
+        return self._db.connect().execute('SELECT COUNT(*) FROM ner_cache').fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ner_cache():
+    """获取进程内共享的实体识别结果缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = NERCache()
+    return _cache
+
+
+if __name__ == '__main__':
+    # 清空缓存：python ner_cache.py
+    cache = get_ner_cache()
+    count = cache.disk_entries()
+    cache.clear()
+    print(f"已清空实体识别缓存，共删除 {count} 条结果")
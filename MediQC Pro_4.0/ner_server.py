@@ -0,0 +1,358 @@
+"""
+Transformer实体识别服务进程
+
+每个加载Transformer模型的Web工作进程都持有一份数GB的模型，推理还会阻塞请求线程。
+本模块提供一个独立的识别服务进程，由它加载并持有模型，Web工作进程通过Unix套接字
+把文本发给它识别：
+- 多个工作进程的请求在服务进程中合并为微批次（最多MAX_BATCH_TEXTS个文本或等待
+  MAX_WAIT_MS毫秒），一起送入模型
+- 等待队列有长度上限，队列已满时立即返回busy，调用方降级为规则匹配，不会无限排队
+- 16个Web工作进程只需要服务进程中的一份模型
+
+在data/llm_config.json中设置"ner_server_socket"为套接字路径后，llm_ner的Transformer识别
+会改为调用服务进程。启动服务（在MediQC Pro_4.0目录下运行）：
+    python ner_server.py
+    python ner_server.py --socket /run/mediqc/ner.sock --max-batch 64 --max-wait-ms 20
+
+消息格式：4字节大端长度 + UTF-8编码的JSON。请求为{"op": "recognize", "texts": [...],
+"model_name": ...}、{"op": "stats"}或{"op": "reload"}，响应为{"results": [...]}或{"error": ...}。
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from collections import deque
+
+# 默认套接字路径
+DEFAULT_SOCKET_PATH = 'artifacts/ner_server.sock'
+
+# 微批次：一批最多合并的文本数和等待时间
+MAX_BATCH_TEXTS = 32
+MAX_WAIT_MS = 10
+
+# 等待识别的请求数上限，超过时返回busy
+MAX_QUEUE = 64
+
+# 客户端等待响应的超时时间（秒）
+CLIENT_TIMEOUT_SECONDS = 300
+
+# 监听套接字的连接等待数（需大于Web工作进程的总线程数，繁忙时由等待队列返回busy）
+LISTEN_BACKLOG = 256
+
+# 单条消息的大小上限
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct('>I')
+
+# 服务进程返回的错误
+ERROR_BUSY = 'busy'
+
+
+class NERServerBusy(RuntimeError):
+    """服务进程的等待队列已满"""
+
+
+def _send_message(sock, message):
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('连接已关闭')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"消息过大: {size}字节")
+    return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+class _Request:
+    """等待识别的请求"""
+
+    def __init__(self, texts, model_name):
+        self.texts = texts
+        self.model_name = model_name
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """将多个请求合并为微批次，在一个线程中依次送入模型"""
+
+    def __init__(self, recognize, max_batch_texts=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE):
+        """
+        Args:
+            recognize (callable): recognize(texts, model_name)，返回与texts一一对应的识别结果
+            max_batch_texts (int): 一批最多合并的文本数（单个请求的文本数超过时单独成批）
+            max_wait_ms (float): 收到第一个请求后等待更多请求的时间
+            max_queue (int): 等待识别的请求数上限（包括因模型不同而留到以后批次的请求）
+        """
+        self.recognize = recognize
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._deferred = deque()    # 模型与当前批次不同、留到以后批次的请求（只在识别线程中访问）
+        self._pending = 0           # 已提交、尚未进入批次的请求数
+        self._pending_lock = threading.Lock()
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0, 'rejected': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='ner-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, model_name=None, timeout=None):
+        """
+        提交请求并等待识别结果
+
+        Raises:
+            NERServerBusy: 等待队列已满
+        """
+        request = _Request(texts, model_name)
+        with self._pending_lock:
+            full = self._pending >= self.max_queue
+            if not full:
+                self._pending += 1
+        if full:
+            self._count(rejected=1)
+            raise NERServerBusy('识别服务繁忙')
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError('等待识别结果超时')
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.results
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def queued(self):
+        """等待识别的请求数"""
+        return self._pending
+
+    def _next(self, timeout=None):
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """
+        取出一个微批次：第一个请求到达后，先合并此前留下的同一模型的请求，
+        再继续收集同一模型的请求直到文本数或等待时间达到上限
+        """
+        first = self._next()
+        batch = [first]
+        texts = len(first.texts)
+        deferred = []
+        for request in self._deferred:
+            if request.model_name == first.model_name and texts < self.max_batch_texts:
+                batch.append(request)
+                texts += len(request.texts)
+            else:
+                deferred.append(request)
+        self._deferred.clear()
+        deadline = time.monotonic() + self.max_wait
+        while texts < self.max_batch_texts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and self._queue.empty():
+                break
+            try:
+                request = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.model_name != first.model_name:
+                deferred.append(request)
+                continue
+            batch.append(request)
+            texts += len(request.texts)
+        self._deferred.extend(deferred)
+        with self._pending_lock:
+            self._pending -= len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                results = self.recognize(texts, batch[0].model_name)
+            except Exception as e:
+                print(f"识别服务处理批次出错: {str(e)}")
+                self._count(errors=1)
+                for request in batch:
+                    request.error = str(e)
+                    request.done.set()
+                continue
+            self._count(requests=len(batch), texts=len(texts), batches=1)
+            start = 0
+            for request in batch:
+                request.results = results[start:start + len(request.texts)]
+                start += len(request.texts)
+                request.done.set()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        try:
+            message = _recv_message(self.request)
+            op = message.get('op', 'recognize')
+            if op == 'recognize':
+                results = server.batcher.submit(message.get('texts', []), message.get('model_name'))
+                response = {'results': results}
+            elif op == 'stats':
+                response = server.stats()
+            elif op == 'reload':
+                response = server.reload()
+            else:
+                response = {'error': f'不支持的操作: {op}'}
+        except NERServerBusy:
+            response = {'error': ERROR_BUSY}
+        except Exception as e:
+            response = {'error': str(e)}
+        try:
+            _send_message(self.request, response)
+        except OSError:
+            pass
+
+
+class NERServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听Unix套接字的实体识别服务，每个连接一个线程，识别由MicroBatcher统一执行"""
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, max_batch_texts=MAX_BATCH_TEXTS, max_wait_ms=MAX_WAIT_MS,
+                 max_queue=MAX_QUEUE):
+        from llm_ner import recognize_entities_with_transformer_batch
+
+        self.socket_path = socket_path
+        self.started_at = time.time()
+        self.batcher = MicroBatcher(
+            lambda texts, model_name: recognize_entities_with_transformer_batch(texts, model_name, use_server=False),
+            max_batch_texts, max_wait_ms, max_queue
+        )
+        directory = os.path.dirname(socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 上次异常退出时留下的套接字文件
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+
+    def stats(self):
+        """服务状态：运行时间、队列长度、处理统计和已加载的模型"""
+        from model_registry import get_model_registry
+
+        return {
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'queued': self.batcher.queued(),
+            'stats': dict(self.batcher.stats),
+            'models': get_model_registry().info()
+        }
+
+    def reload(self):
+        """重新加载当前配置的模型"""
+        from llm_ner import load_transformer_model
+
+        ner_pipeline = load_transformer_model(reload=True)
+        loaded = ner_pipeline is not None and not isinstance(ner_pipeline, str)
+        return {'success': loaded, 'mode': 'model' if loaded else (ner_pipeline or 'unavailable')}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class NERClient:
+    """识别服务的客户端（每次调用建立一个连接，可在多个线程中共用）"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=CLIENT_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _call(self, message):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            _send_message(sock, message)
+            response = _recv_message(sock)
+        if response.get('error') == ERROR_BUSY:
+            raise NERServerBusy('识别服务繁忙')
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def recognize(self, texts, model_name=None):
+        """
+        识别文本
+
+        Returns:
+            list: 与texts一一对应的识别结果
+
+        Raises:
+            NERServerBusy: 服务进程的等待队列已满
+            OSError: 无法连接服务进程
+        """
+        return self._call({'op': 'recognize', 'texts': list(texts), 'model_name': model_name})['results']
+
+    def stats(self):
+        """服务状态"""
+        return self._call({'op': 'stats'})
+
+    def reload(self):
+        """让服务进程重新加载模型"""
+        return self._call({'op': 'reload'})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Transformer实体识别服务进程')
+    parser.add_argument('--socket', help='Unix套接字路径，默认使用data/llm_config.json中的ner_server_socket')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH_TEXTS, help='一批最多合并的文本数')
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS, help='收集一批请求的最长等待时间（毫秒）')
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE, help='等待识别的请求数上限')
+    args = parser.parse_args(argv)
+
+    from llm_ner import get_llm_config, load_transformer_model
+
+    socket_path = args.socket or get_llm_config().get('ner_server_socket') or DEFAULT_SOCKET_PATH
+    print("加载Transformer模型...")
+    start = time.time()
+    ner_pipeline = load_transformer_model()
+    if ner_pipeline is None or isinstance(ner_pipeline, str):
+        print(f"模型不可用（{ner_pipeline or 'unavailable'}），识别请求将按llm_ner的规则降级处理")
+    else:
+        print(f"模型加载完成，耗时 {time.time() - start:.1f} 秒")
+
+    server = NERServer(socket_path, args.max_batch, args.max_wait_ms, args.max_queue)
+    print(f"实体识别服务已启动: {socket_path}（pid {os.getpid()}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+ONNX Runtime实体识别后端
+
+服务器没有GPU时，PyTorch以fp32在CPU上运行BERT类模型较慢。本模块将配置的
+token分类模型导出为ONNX，并进行动态int8量化，再用ONNX Runtime推理：
+- export_onnx()：导出模型（需要torch和transformers，只在首次使用时执行一次）
+- OnnxNERPipeline：与transformers的NER pipeline（aggregation_strategy="simple"）
+  调用方式和输出格式相同，运行时只需要onnxruntime和分词器，不需要torch
+
+在data/llm_config.json中设置"inference_backend": "onnx"即可让llm_ner使用本后端。
+
+命令行用法（在MediQC Pro_4.0目录下运行）：
+    python onnx_ner.py trueto/medbert-kd-chinese --output model_cache/onnx/medbert-kd-chinese
+    python onnx_ner.py bert-base-NER --output model_cache/onnx/bert-base-NER --no-quantize
+"""
+import os
+import re
+import sys
+import json
+import argparse
+
+# 导出的模型文件名
+FP32_MODEL_FILE = 'model.onnx'
+INT8_MODEL_FILE = 'model.int8.onnx'
+
+# 导出的ONNX模型默认保存目录（每个模型一个子目录）
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache', 'onnx')
+
+# 导出时使用的ONNX算子集版本
+ONNX_OPSET = 14
+
+# 模型输入（按BERT类模型forward的参数顺序）
+MODEL_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+def model_dir_for(model_name):
+    """模型对应的默认导出目录"""
+    return os.path.join(ONNX_MODEL_DIR, re.sub(r'[^0-9A-Za-z._-]+', '_', model_name).strip('_'))
+
+
+def export_onnx(model_name_or_path, output_dir, quantize=True, cache_dir=None, opset=ONNX_OPSET):
+    """
+    将token分类模型导出为ONNX，并可选地进行动态int8量化
+
+    Args:
+        model_name_or_path (str): 模型名称或本地路径
+        output_dir (str): 输出目录，同时保存分词器和模型配置
+        quantize (bool): 是否生成int8量化模型
+        cache_dir (str): 下载模型时的缓存目录
+        opset (int): ONNX算子集版本
+
+    Returns:
+        str: 推理时使用的模型文件路径（量化时为int8模型）
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, cache_dir=cache_dir, use_fast=True)
+    model = AutoModelForTokenClassification.from_pretrained(model_name_or_path, cache_dir=cache_dir)
+    model.eval()
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    sample = tokenizer(['患者头痛发热三天'], return_tensors='pt')
+    input_names = [name for name in MODEL_INPUTS if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch', 1: 'sequence'}
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset
+        )
+    print(f"已导出ONNX模型: {fp32_path}")
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    int8_path = os.path.join(output_dir, INT8_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"已生成int8量化模型: {int8_path}")
+    return int8_path
+
+
+def _split_label(label):
+    """将B-XXX/I-XXX标签拆分为(B或I, XXX)，与transformers的分组规则一致"""
+    if label.startswith('B-') or label.startswith('S-'):
+        return 'B', label[2:]
+    if label.startswith('I-') or label.startswith('E-') or label.startswith('M-'):
+        return 'I', label[2:]
+    return 'I', label
+
+
+class OnnxNERPipeline:
+    """
+    基于ONNX Runtime的NER推理，输出格式与transformers pipeline("ner", aggregation_strategy="simple")相同：
+    [{'entity_group': 类型, 'score': 分数, 'word': 实体文本, 'start': 起始位置, 'end': 结束位置}, ...]
+    """
+
+    def __init__(self, model_dir, quantized=True, num_threads=None):
+        """
+        Args:
+            model_dir (str): export_onnx()的输出目录
+            quantized (bool): 是否使用int8量化模型
+            num_threads (int): ONNX Runtime的算子内线程数，None表示使用默认值（CPU核数）
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, INT8_MODEL_FILE if quantized else FP32_MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX模型文件不存在: {model_path}")
+
+        self.model_dir = model_dir
+        self.model_path = model_path
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        with open(os.path.join(model_dir, 'config.json'), 'r', encoding='utf-8') as f:
+            model_config = json.load(f)
+        self.id2label = {int(i): label for i, label in model_config.get('id2label', {}).items()}
+        self.max_length = min(getattr(self.tokenizer, 'model_max_length', 512) or 512, 512)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, inputs, batch_size=None):
+        """
+        识别一个或多个文本
+
+        Args:
+            inputs (str|list): 文本或文本列表
+            batch_size (int): 每次推理的文本数，None表示全部文本一次推理
+
+        Returns:
+            list: 文本为str时返回实体列表，为list时返回每个文本的实体列表
+        """
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+        batch_size = batch_size or len(texts) or 1
+        results = []
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._predict(texts[start:start + batch_size]))
+        return results[0] if single else results
+
+    def _predict(self, texts):
+        import numpy as np
+
+        if not texts:
+            return []
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_offsets_mapping=True,
+            return_special_tokens_mask=True,
+            return_tensors='np'
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        logits = self.session.run(None, feeds)[0]
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+
+        return [
+            self._aggregate(text, probabilities[b], encoded['offset_mapping'][b],
+                            encoded['special_tokens_mask'][b] | (encoded['attention_mask'][b] == 0))
+            for b, text in enumerate(texts)
+        ]
+
+    def _aggregate(self, text, probabilities, offsets, skip):
+        """按simple策略将token的预测合并为实体"""
+        tokens = []
+        for index, (start, end) in enumerate(offsets):
+            if skip[index] or start == end:
+                continue
+            label_id = int(probabilities[index].argmax())
+            tokens.append((self.id2label.get(label_id, str(label_id)), float(probabilities[index][label_id]),
+                           int(start), int(end)))
+
+        groups = []
+        for label, score, start, end in tokens:
+            bi, tag = _split_label(label)
+            if groups and groups[-1]['tag'] == tag and bi != 'B':
+                group = groups[-1]
+                group['end'] = end
+                group['scores'].append(score)
+            else:
+                groups.append({'tag': tag, 'start': start, 'end': end, 'scores': [score]})
+
+        return [{
+            'entity_group': group['tag'],
+            'score': sum(group['scores']) / len(group['scores']),
+            'word': text[group['start']:group['end']],
+            'start': group['start'],
+            'end': group['end']
+        } for group in groups if group['tag'] != 'O']
+
+
+def load_onnx_pipeline(model_name_or_path, model_dir=None, quantized=True, cache_dir=None):
+    """
+    加载ONNX推理后端，模型尚未导出时先导出（导出需要torch）
+
+    Args:
+        model_name_or_path (str): 模型名称或本地路径
+        model_dir (str): ONNX模型目录，None表示使用ONNX_MODEL_DIR下的默认目录
+        quantized (bool): 是否使用int8量化模型
+        cache_dir (str): 下载模型时的缓存目录
+
+    Returns:
+        OnnxNERPipeline: 推理后端
+    """
+    model_dir = model_dir or model_dir_for(model_name_or_path)
+    model_file = os.path.join(model_dir, INT8_MODEL_FILE if quantized else FP32_MODEL_FILE)
+    if not os.path.exists(model_file):
+        print(f"ONNX模型不存在，开始导出: {model_name_or_path} -> {model_dir}")
+        export_onnx(model_name_or_path, model_dir, quantize=quantized, cache_dir=cache_dir)
+    return OnnxNERPipeline(model_dir, quantized=quantized)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='将token分类模型导出为ONNX并进行int8量化')
+    parser.add_argument('model', help='模型名称或本地路径')
+    parser.add_argument('--output', help='输出目录，默认为model_cache/onnx/<模型名称>')
+    parser.add_argument('--no-quantize', action='store_true', help='只导出fp32模型，不进行int8量化')
+    args = parser.parse_args(argv)
+    export_onnx(args.model, args.output or model_dir_for(args.model), quantize=not args.no_quantize)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
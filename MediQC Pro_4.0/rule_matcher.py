@@ -0,0 +1,123 @@
+"""
+医学实体正则规则的单次扫描匹配模块
+
+MEDICAL_ENTITY_RULES中的规则都以(?<![一-龥])开头、以(?![一-龥])结尾，即匹配结果
+总是一整段连续的汉字。本模块把规则编译为两类查找表：
+1. 词表规则 (?<![一-龥])(词1|词2|...)(?![一-龥])：汉字段整体在词表中即匹配；
+2. 后缀规则 (?<![一-龥])(前缀1|前缀2)?([一-龥]{m,n})(后缀1|后缀2|...)(?![一-龥])：
+   按后缀表查找汉字段的各个后缀，再检查中间部分的长度。
+匹配时只需用一个正则切分出所有汉字段，逐段查表即可一次得到所有实体类型的结果，
+结果与对每条规则分别调用re.finditer完全一致（同一实体类型的多条规则匹配同一段文本时只返回一次）。不符合以上两种形式的规则（如包含
+英文字母的CT|MRI|B超）预编译后单独匹配。
+"""
+import re
+
+# 汉字字符集（与规则中使用的[一-龥]一致）
+HAN = '一-龥'
+
+# 连续汉字段
+HAN_RUN_PATTERN = re.compile(f'[{HAN}]+')
+
+# 规则两端的边界断言
+_BOUNDARY_BEFORE = re.escape(f'(?<![{HAN}])')
+_BOUNDARY_AFTER = re.escape(f'(?![{HAN}])')
+_ALTERNATION = f'[{HAN}]+(?:\\|[{HAN}]+)*'
+
+# 词表规则：(?<![一-龥])(词1|词2|...)(?![一-龥])
+WORDS_RULE_PATTERN = re.compile(
+    f'^{_BOUNDARY_BEFORE}\\((?P<words>{_ALTERNATION})\\){_BOUNDARY_AFTER}$'
+)
+
+# 后缀规则：(?<![一-龥])(前缀...)?([一-龥]{m,n})(后缀...)(?![一-龥])
+SUFFIX_RULE_PATTERN = re.compile(
+    f'^{_BOUNDARY_BEFORE}'
+    f'(?:\\((?P<prefixes>{_ALTERNATION})\\)\\?)?'
+    f'\\({re.escape(f"[{HAN}]")}\\{{(?P<min>\\d+),(?P<max>\\d+)\\}}\\)'
+    f'\\((?P<suffixes>{_ALTERNATION})\\)'
+    f'{_BOUNDARY_AFTER}$'
+)
+
+
+class RuleMatcher:
+    """
+    将{实体类型: [正则规则, ...]}编译为一次扫描的匹配器
+
+    Attributes:
+        table_rule_count (int): 编译为查找表的规则数
+        regex_rule_count (int): 需要单独用正则匹配的规则数
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules (dict): {实体类型: [正则规则字符串, ...]}
+        """
+        self._words = {}       # {词: [实体类型, ...]}
+        self._suffixes = {}    # {后缀: [(实体类型, 前缀集合, 最小长度, 最大长度), ...]}
+        self._suffix_lengths = []
+        self._regexes = []     # [(实体类型, 已编译正则), ...]
+
+        for entity_type, patterns in rules.items():
+            for pattern in patterns:
+                self._compile(entity_type, pattern)
+
+        self._suffix_lengths = sorted({len(suffix) for suffix in self._suffixes})
+        self.regex_rule_count = len(self._regexes)
+        self.table_rule_count = sum(len(patterns) for patterns in rules.values()) - self.regex_rule_count
+
+    def _compile(self, entity_type, pattern):
+        match = WORDS_RULE_PATTERN.match(pattern)
+        if match:
+            for word in dict.fromkeys(match.group('words').split('|')):
+                self._words.setdefault(word, []).append(entity_type)
+            return
+
+        match = SUFFIX_RULE_PATTERN.match(pattern)
+        if match:
+            prefixes = frozenset(match.group('prefixes').split('|')) if match.group('prefixes') else frozenset()
+            rule = (entity_type, prefixes, int(match.group('min')), int(match.group('max')))
+            for suffix in dict.fromkeys(match.group('suffixes').split('|')):
+                self._suffixes.setdefault(suffix, []).append(rule)
+            return
+
+        self._regexes.append((entity_type, re.compile(pattern)))
+
+    def _run_types(self, run):
+        """返回能完整匹配该汉字段的实体类型"""
+        types = list(self._words.get(run, ()))
+        length = len(run)
+        for suffix_length in self._suffix_lengths:
+            if suffix_length >= length:
+                break
+            for entity_type, prefixes, min_len, max_len in self._suffixes.get(run[-suffix_length:], ()):
+                middle = length - suffix_length
+                if min_len <= middle <= max_len:
+                    types.append(entity_type)
+                    continue
+                # 可选前缀（如“急性”“慢性”）
+                for prefix in prefixes:
+                    if run.startswith(prefix) and min_len <= middle - len(prefix) <= max_len:
+                        types.append(entity_type)
+                        break
+        return types
+
+    def finditer(self, text):
+        """
+        扫描文本，产生所有规则匹配
+
+        Yields:
+            tuple: (起始位置, 结束位置, 实体类型)
+        """
+        for match in HAN_RUN_PATTERN.finditer(text):
+            types = self._run_types(match.group())
+            if types:
+                start, end = match.span()
+                for entity_type in dict.fromkeys(types):
+                    yield start, end, entity_type
+        for entity_type, regex in self._regexes:
+            for match in regex.finditer(text):
+                yield match.start(), match.end(), entity_type
+
+    def find(self, text):
+        """返回所有规则匹配的列表 [(起始位置, 结束位置, 实体类型), ...]"""
+        return list(self.finditer(text))
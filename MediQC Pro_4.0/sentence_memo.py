@@ -0,0 +1,202 @@
+"""
+句子级实体识别结果缓存模块
+
+病历文本中大量句子是模板化的重复内容（如现病史中的“无发热，无恶心呕吐，无胸闷气短，
+无腹痛腹泻。”、出院小结中的固定表述），整篇文本的缓存（ner_cache）对这类文本几乎不会命中。
+本模块把文本切分为句子，按句子缓存识别结果：
+- 每个句子只识别一次，之后在任何文本中再次出现时直接使用缓存结果，位置加上句子在原文中的偏移量
+- 一批文本中所有未缓存的句子去重后一次交给识别函数，便于批量推理
+- 上下文按原文重新截取，与整篇识别的结果格式相同
+
+句子只去除首尾空白，不做其他会改变字符位置的规范化，使缓存的位置能准确映射回原文。
+"""
+import re
+import bisect
+import threading
+from collections import OrderedDict
+from entity_spans import CONTEXT_SIZE
+from ner_cache import get_ner_cache
+
+# 句末：中文句末标点、英文句末标点（句号需后接空白，避免切开小数）和换行
+SENTENCE_END = re.compile(r'[。！？；!?;]+|\.(?=\s)|\n')
+
+# 每个识别后端在内存中缓存的句子数
+SENTENCE_MEMORY_ENTRIES = 50000
+
+
+def split_sentences(text):
+    """
+    将文本切分为句子
+
+    Returns:
+        list: [(句子在原文中的偏移量, 句子), ...]，句子已去除首尾空白，不包含空白句子
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        _append_sentence(text, start, match.end(), sentences)
+        start = match.end()
+    _append_sentence(text, start, len(text), sentences)
+    return sentences
+
+
+def _append_sentence(text, start, end, sentences):
+    segment = text[start:end]
+    sentence = segment.strip()
+    if sentence:
+        sentences.append((start + len(segment) - len(segment.lstrip()), sentence))
+
+
+class SentenceMemo:
+    """按(版本, 句子)缓存一个识别后端的句子级识别结果"""
+
+    def __init__(self, backend, persist=False, memory_entries=SENTENCE_MEMORY_ENTRIES):
+        """
+        Args:
+            backend (str): 识别后端名称，如rules、api、transformer
+            persist (bool): 是否同时写入磁盘缓存（ner_cache），用于识别代价较高的后端
+            memory_entries (int): 内存中缓存的句子数
+        """
+        self.backend = backend
+        self.persist = persist
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()    # {(版本, 句子): 句子的识别结果}，不修改，组装时复制
+        self._lock = threading.Lock()
+        self.stats = {'sentences': 0, 'hits': 0, 'misses': 0}
+
+    def _get(self, sentence, version):
+        key = (version, sentence)
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                return result
+        if self.persist:
+            result = get_ner_cache().get(sentence, self.backend + '-sentence', version)
+            if result is not None:
+                self._remember(key, result)
+        return result
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _put(self, sentence, version, result):
+        # 上下文在组装时按原文重新截取，不需要缓存
+        result = {entity_type: [{k: v for k, v in entity.items() if k != 'context'} for entity in entities]
+                  for entity_type, entities in result.items()}
+        self._remember((version, sentence), result)
+        if self.persist:
+            get_ner_cache().put(sentence, self.backend + '-sentence', version, result)
+
+    def recognize(self, texts, version, recognize_sentences, context_size=CONTEXT_SIZE):
+        """
+        按句子识别一批文本
+
+        Args:
+            texts (list): 待识别的文本
+            version (str): 词典或模型配置的版本
+            recognize_sentences (callable): recognize_sentences(句子列表)，返回与句子一一对应的识别结果
+                （按实体类型分组，位置相对于句子），全部识别失败时返回None，单个句子识别失败时对应位置为None
+            context_size (int): 上下文窗口大小
+
+        Returns:
+            list: 与texts一一对应的识别结果，包含识别失败句子的文本对应None
+        """
+        split = [split_sentences(text) for text in texts]
+        known = {}
+        missing = []
+        for sentences in split:
+            for _, sentence in sentences:
+                if sentence in known:
+                    continue
+                result = self._get(sentence, version)
+                known[sentence] = result
+                if result is None:
+                    missing.append(sentence)
+
+        total = sum(len(sentences) for sentences in split)
+        with self._lock:
+            self.stats['sentences'] += total
+            self.stats['misses'] += len(missing)
+            self.stats['hits'] += total - len(missing)
+
+        if missing:
+            results = recognize_sentences(missing)
+            if results is not None:
+                for sentence, result in zip(missing, results):
+                    if result is None:
+                        continue
+                    self._put(sentence, version, result)
+                    known[sentence] = result
+
+        return [self._assemble(text, sentences, known, context_size) for text, sentences in zip(texts, split)]
+
+    def lookup(self, text, version, context_size=CONTEXT_SIZE):
+        """
+        只查找缓存：文本的所有句子都已缓存时返回组装的识别结果，否则返回None
+        """
+        sentences = split_sentences(text)
+        known = {}
+        for _, sentence in sentences:
+            if sentence not in known:
+                known[sentence] = self._get(sentence, version)
+                if known[sentence] is None:
+                    return None
+        return self._assemble(text, sentences, known, context_size)
+
+    def store(self, text, version, entities_by_type):
+        """
+        将整篇文本的识别结果（如流式识别的结果）按句子拆分后缓存
+
+        实体按位置归入所在的句子，跨越句子边界的实体不缓存到句子中。
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return
+        starts = [offset for offset, _ in sentences]
+        results = [{entity_type: [] for entity_type in entities_by_type} for _ in sentences]
+        for entity_type, entities in entities_by_type.items():
+            for entity in entities:
+                index = bisect.bisect_right(starts, entity['position']) - 1
+                if index < 0:
+                    continue
+                offset, sentence = sentences[index]
+                position = entity['position'] - offset
+                if position + len(entity['entity']) <= len(sentence):
+                    results[index][entity_type].append(dict(entity, position=position))
+        for (_, sentence), result in zip(sentences, results):
+            self._put(sentence, version, result)
+
+    @staticmethod
+    def _assemble(text, sentences, known, context_size):
+        """将句子的识别结果映射回原文"""
+        entities_by_type = {}
+        for offset, sentence in sentences:
+            result = known.get(sentence)
+            if result is None:
+                return None
+            for entity_type, entities in result.items():
+                bucket = entities_by_type.setdefault(entity_type, [])
+                for entity in entities:
+                    position = entity['position'] + offset
+                    end = position + len(entity['entity'])
+                    bucket.append(dict(entity, position=position,
+                                       context=text[max(0, position - context_size):min(len(text), end + context_size)]))
+        return entities_by_type
+
+
+_memos = {}
+_memos_lock = threading.Lock()
+
+
+def get_sentence_memo(backend, persist=False):
+    """获取进程内共享的句子级缓存（每个识别后端一个）"""
+    memo = _memos.get(backend)
+    if memo is None:
+        with _memos_lock:
+            memo = _memos.setdefault(backend, SentenceMemo(backend, persist))
+    return memo
@@ -0,0 +1,59 @@
+"""
+SQLite连接辅助模块
+
+为产物存储和规则/字典存储提供线程安全的连接管理：每个线程（以及fork出的每个
+Web工作进程）使用独立的连接，数据库启用WAL模式以便读写并发，写操作通过
+BEGIN IMMEDIATE事务串行化。
+"""
+import os
+import sqlite3
+import threading
+
+
+class SQLiteDatabase:
+    """按线程和进程隔离连接的SQLite数据库"""
+
+    def __init__(self, path, timeout=30):
+        """
+        Args:
+            path (str): 数据库文件路径
+            timeout (float): 等待写锁的超时时间（秒）
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self):
+        """获取当前线程（及当前进程）专用的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def write_transaction(self):
+        """开始一个立即加写锁的事务，用法：with db.write_transaction() as conn: ..."""
+        return _ImmediateTransaction(self.connect())
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE事务的上下文管理器，异常时回滚"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
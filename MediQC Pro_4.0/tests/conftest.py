@@ -0,0 +1,80 @@
+"""
+测试公共设置
+
+被测模块位于上一级目录（MediQC Pro_4.0），并以相对路径读写data、artifacts等目录，
+workdir夹具把当前目录切换到临时目录，测试之间互不影响，也不会改动仓库中的数据文件。
+
+运行（在MediQC Pro_4.0目录下）：
+    python -m pytest -q tests
+"""
+import os
+import json
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+# 进程内共享的实例（以相对路径打开的数据库、缓存等），切换目录后需要重新创建
+_SINGLETONS = [
+    ('artifact_store', '_store', None),
+    ('data_store', '_store', None),
+    ('entity_matcher', '_matcher', None),
+    ('entity_matcher', '_retry_at', 0.0),
+    ('llm_ner', '_rule_matcher', None),
+    ('llm_ner', '_rules_cache_version', None),
+    ('ner_cache', '_cache', None),
+    ('sentence_memo', '_memos', dict),
+    ('llm_client', '_clients', dict),
+    ('config_cache', '_files', dict),
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中运行测试，已导入模块中的共享实例在测试期间重新创建"""
+    monkeypatch.chdir(tmp_path)
+    for module_name, attr, value in _SINGLETONS:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            monkeypatch.setattr(module, attr, value() if callable(value) else value)
+    return tmp_path
+
+
+# 测试用的规则库医学实体字典
+TEST_ENTITIES = {
+    "疾病": ["肺炎", "高血压", "糖尿病"],
+    "症状": ["发热", "咳嗽", "头痛", "腹痛"],
+    "药物": ["阿司匹林", "胰岛素"]
+}
+
+
+@pytest.fixture
+def entity_dict(workdir):
+    """在临时目录中写入初始医学实体字典（规则库首次打开时导入）"""
+    (workdir / 'data').mkdir(exist_ok=True)
+    (workdir / 'data' / 'medical_entities.json').write_text(
+        json.dumps(TEST_ENTITIES, ensure_ascii=False), encoding='utf-8')
+    return TEST_ENTITIES
+
+
+@pytest.fixture
+def mock_server():
+    """本地模拟大模型API服务（无延迟），测试结束后关闭"""
+    from mock_llm_server import start_mock_server
+    server = start_mock_server(latency_ms=0, per_char_ms=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def api_config(workdir, mock_server, monkeypatch):
+    """指向模拟服务的大模型配置，测试中修改该字典即修改llm_ner读取的配置"""
+    import llm_ner
+    config = dict(llm_ner.DEFAULT_CONFIG, api_url=mock_server.url, api_key='test-key')
+    monkeypatch.setattr(llm_ner, 'get_llm_config', lambda: config)
+    return config
@@ -0,0 +1,144 @@
+import random
+
+import llm_ner
+
+
+def entity_names(result):
+    return {entity_type: sorted(e['entity'] for e in entities) for entity_type, entities in result.items() if entities}
+
+
+def assert_positions(text, result):
+    for entities in result.values():
+        for entity in entities:
+            assert text[entity['position']:entity['position'] + len(entity['entity'])] == entity['entity']
+
+
+def test_api_recognition_is_cached(api_config, mock_server):
+    text = '患者发热咳嗽。诊断为肺炎。'
+    result = llm_ner.recognize_entities_with_api(text)
+    assert entity_names(result) == {'疾病': ['肺炎'], '症状': ['发热', '咳嗽']}
+    assert_positions(text, result)
+    requests = mock_server.snapshot()['requests']
+    assert llm_ner.recognize_entities_with_api(text) == result
+    assert mock_server.snapshot()['requests'] == requests
+
+
+def test_streamed_results_populate_sentence_memo(api_config, mock_server):
+    text = '患者发热咳嗽。诊断为肺炎。'
+    events = list(llm_ner.stream_entities_with_api(text))
+    event, done = events[-1]
+    assert event == 'done' and done['source'] == 'api'
+    assert entity_names(done['entities']) == {'疾病': ['肺炎'], '症状': ['发热', '咳嗽']}
+    assert_positions(text, done['entities'])
+    requests = mock_server.snapshot()['requests']
+
+    # 由相同句子组成的其他文本直接使用流式识别缓存的句子结果，不再请求API
+    reordered = '诊断为肺炎。\n患者发热咳嗽。'
+    result = llm_ner.recognize_entities_with_api(reordered)
+    assert mock_server.snapshot()['requests'] == requests
+    assert entity_names(result) == entity_names(done['entities'])
+    assert_positions(reordered, result)
+
+    events = list(llm_ner.stream_entities_with_api(reordered))
+    assert events[-1][1]['source'] == 'cache'
+    assert mock_server.snapshot()['requests'] == requests
+
+
+def test_stream_uses_sentences_recognized_without_streaming(api_config, mock_server):
+    llm_ner.recognize_entities_with_api('患者头痛。')
+    llm_ner.recognize_entities_with_api('诊断为高血压。')
+    requests = mock_server.snapshot()['requests']
+    text = '诊断为高血压。患者头痛。'
+    event, done = list(llm_ner.stream_entities_with_api(text))[-1]
+    assert done['source'] == 'cache'
+    assert entity_names(done['entities']) == {'疾病': ['高血压'], '症状': ['头痛']}
+    assert_positions(text, done['entities'])
+    assert mock_server.snapshot()['requests'] == requests
+
+
+def test_stream_without_sentence_memo(api_config, mock_server):
+    api_config['sentence_memo'] = False
+    text = '患者发热咳嗽。诊断为肺炎。'
+    assert list(llm_ner.stream_entities_with_api(text))[-1][1]['source'] == 'api'
+    requests = mock_server.snapshot()['requests']
+    assert list(llm_ner.stream_entities_with_api(text))[-1][1]['source'] == 'cache'
+    # 未按句子缓存
+    llm_ner.recognize_entities_with_api('诊断为肺炎。')
+    assert mock_server.snapshot()['requests'] == requests + 1
+
+
+def test_pack_records_respects_budgets():
+    records = ['头痛', '发热三天', '咳嗽', '【1】已编号', '腹' * 50, '乏力', '胸闷']
+    batches, singles = llm_ner._pack_records(records, max_tokens=10, max_records=2)
+    assert batches == [[0, 1], [2, 5]]
+    # 超过预算、含编号标记以及打包后只剩一条的文本单独请求
+    assert singles == [3, 4, 6]
+
+
+def test_records_are_batched_and_split_back(api_config, mock_server):
+    api_config['api_batch_records'] = 3
+    records = ['患者头痛。', '无不适。', '诊断为高血压。', '咳嗽咳痰两天。', '【2】发热。']
+    results = llm_ner._recognize_api_records(records, api_config)
+    assert [entity_names(result) for result in results] == [
+        {'症状': ['头痛']}, {}, {'疾病': ['高血压']}, {'症状': ['咳嗽', '咳痰']}, {'症状': ['发热']}]
+    for record, result in zip(records, results):
+        assert_positions(record, result)
+    # 3条和1条（单独请求）的合并请求，以及含编号标记的文本单独请求
+    assert mock_server.snapshot()['requests'] == 3
+
+
+def test_failed_batch_falls_back_to_single_requests(api_config, mock_server):
+    mock_server.malformed_rate = 1.0
+    records = ['患者头痛。', '诊断为高血压。', '咳嗽两天。']
+    assert llm_ner._recognize_api_records(records, api_config) == [None, None, None]
+    # 一次合并请求，失败后逐条请求
+    assert mock_server.snapshot()['requests'] == 1 + len(records)
+
+
+def test_api_batch_uses_cache_for_repeated_texts(api_config, mock_server):
+    texts = ['患者头痛。', '诊断为高血压。', '患者头痛。', '']
+    results = llm_ner.recognize_entities_with_api_batch(texts)
+    assert [entity_names(result) for result in results] == [{'症状': ['头痛']}, {'疾病': ['高血压']}, {'症状': ['头痛']}, {}]
+    requests = mock_server.snapshot()['requests']
+    assert llm_ner.recognize_entities_with_api_batch(texts[:2]) == results[:2]
+    assert llm_ner.recognize_entities_with_api('患者头痛。') == results[0]
+    assert mock_server.snapshot()['requests'] == requests
+
+
+def assert_chunks_cover(text, chunks, max_chars):
+    covered = [False] * len(text)
+    last_end = 0
+    for offset, chunk in chunks:
+        assert 0 < len(chunk) <= max_chars
+        assert text[offset:offset + len(chunk)] == chunk
+        assert offset >= last_end
+        # 文本块之间只能是句子首尾被去掉的空白
+        assert not text[last_end:offset].strip()
+        covered[offset:offset + len(chunk)] = [True] * len(chunk)
+        last_end = offset + len(chunk)
+    assert not text[last_end:].strip()
+    assert all(covered[i] for i, char in enumerate(text) if not char.isspace())
+
+
+def test_chunk_text_covers_text_within_max_chars():
+    text = '患者发热咳嗽。 诊断为肺炎！\n既往高血压病史十余年，规律服用阿司匹林。' + '头痛' * 20 + '。腹痛'
+    for max_chars in [1, 3, 7, 10, 20, 100]:
+        assert_chunks_cover(text, llm_ner._chunk_text(text, max_chars), max_chars)
+    assert llm_ner._chunk_text(text, len(text)) == [(0, text)]
+    assert llm_ner._chunk_text('', 10) == []
+    assert llm_ner._chunk_text(' \n ', 10) == []
+
+
+def test_chunk_text_splits_long_sentences():
+    text = '发热。' + '咳' * 25 + '。头痛'
+    chunks = llm_ner._chunk_text(text, 10)
+    assert chunks == [(0, '发热。'), (3, '咳' * 10), (13, '咳' * 10), (23, '咳' * 5 + '。头痛')]
+    assert_chunks_cover(text, chunks, 10)
+
+
+def test_chunk_text_random():
+    rng = random.Random(0)
+    for _ in range(200):
+        text = ''.join(rng.choice('发热咳嗽。！；\n ') for _ in range(rng.randint(0, 60)))
+        max_chars = rng.randint(1, 15)
+        assert_chunks_cover(text, llm_ner._chunk_text(text, max_chars), max_chars)
@@ -0,0 +1,42 @@
+import os
+import sys
+import subprocess
+
+from conftest import APP_DIR
+
+
+def test_importing_app_does_not_create_app_or_write_files(workdir):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    code = 'import app, flask; assert not any(isinstance(v, flask.Flask) for v in vars(app).values())'
+    subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env, check=True, capture_output=True)
+    assert os.listdir(workdir) == []
+
+
+def test_create_app_registers_blueprint_routes(workdir):
+    import app as app_module
+    first = app_module.create_app(run_warmup=False)
+    second = app_module.create_app(run_warmup=False)
+    assert first is not second
+
+    client = first.test_client()
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+    page = client.get('/').get_data(as_text=True)
+    # 模板中的url_for('.视图函数名')解析为蓝图上的地址
+    assert '/entity_recognition' in page
+
+
+def test_readyz_turns_ready_after_warmup(workdir, monkeypatch):
+    import app as app_module
+    monkeypatch.setitem(app_module._warmup_state, 'ready', False)
+    monkeypatch.setitem(app_module._warmup_state, 'finished_at', None)
+    monkeypatch.setitem(app_module._warmup_state, 'steps', {})
+    # 预热结束时调用的gc.freeze()会把测试进程中的对象永久移出垃圾回收
+    frozen = []
+    monkeypatch.setattr(app_module.gc, 'freeze', lambda: frozen.append(True))
+
+    client = app_module.create_app(run_warmup=False).test_client()
+    assert client.get('/readyz').status_code == 503
+
+    client = app_module.create_app().test_client()
+    assert client.get('/readyz').status_code == 200
+    assert frozen == [True]
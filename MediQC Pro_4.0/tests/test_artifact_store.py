@@ -0,0 +1,56 @@
+import os
+
+from artifact_store import ArtifactStore, is_artifact_id
+
+
+def make_store(tmp_path, **options):
+    store = ArtifactStore(root=str(tmp_path / 'artifacts'), **options)
+    # 测试中手动调用evict，写入时不自动淘汰
+    store._last_evict = float('inf')
+    return store
+
+
+def test_same_content_stored_once(tmp_path):
+    store = make_store(tmp_path)
+    first = store.put_bytes(b'same', 'a.xlsx', kind='upload')
+    second = store.put_bytes(b'same', 'b.xlsx', kind='excel')
+
+    assert is_artifact_id(first['id'])
+    assert first['id'] == second['id']
+    assert store.get(first['id'])['filename'] == 'b.xlsx'
+    assert store.total_size() == 4
+
+
+def test_ttl_evicts_only_stale_artifacts(tmp_path):
+    store = make_store(tmp_path, ttl_seconds=100, max_total_bytes=None)
+    old = store.put_bytes(b'old', 'old.csv')
+    fresh = store.put_bytes(b'fresh', 'fresh.csv')
+    now = fresh['last_access']
+    store._db.connect().execute('UPDATE artifacts SET last_access = ? WHERE id = ?', (now - 200, old['id']))
+
+    assert store.evict(now=now) == 1
+    assert store.get(old['id']) is None
+    assert not os.path.exists(old['path'])
+    assert store.get(fresh['id']) is not None
+
+
+def test_quota_evicts_least_recently_used_first(tmp_path):
+    store = make_store(tmp_path, ttl_seconds=None, max_total_bytes=25)
+    ids = [store.put_bytes(bytes([i]) * 10, f'{i}.bin')['id'] for i in range(3)]
+    conn = store._db.connect()
+    for rank, artifact_id in enumerate(ids):
+        conn.execute('UPDATE artifacts SET last_access = ? WHERE id = ?', (1000 + rank, artifact_id))
+    # 最早写入的产物刚被访问过，应保留
+    conn.execute('UPDATE artifacts SET last_access = ? WHERE id = ?', (2000, ids[0]))
+
+    assert store.evict(now=2000) == 1
+    assert store.get(ids[1], touch=False) is None
+    assert store.get(ids[0], touch=False) is not None
+    assert store.get(ids[2], touch=False) is not None
+    assert store.total_size() == 20
+
+
+def test_get_rejects_invalid_ids(tmp_path):
+    store = make_store(tmp_path)
+    assert store.get('../index.db') is None
+    assert store.get('0' * 64) is None
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+import batch_ner
+
+
+def test_json_array_input(tmp_path):
+    path = tmp_path / 'notes.json'
+    path.write_text(json.dumps([{'id': 'a', 'text': '头痛'}, {'id': 'b', 'text': ''}, {'id': 'c', 'text': '发热'}],
+                               ensure_ascii=False, indent=2), encoding='utf-8')
+    assert list(batch_ner.read_documents(str(path), ['text'], 'id')) == [('a', 'text', '头痛'), ('c', 'text', '发热')]
+
+
+def test_jsonl_input_with_json_extension(tmp_path):
+    path = tmp_path / 'notes.json'
+    path.write_text('{"text": "头痛"}\n\n{"text": "发热"}\n', encoding='utf-8')
+    assert list(batch_ner.read_documents(str(path), ['text'])) == [(1, 'text', '头痛'), (3, 'text', '发热')]
+
+
+def test_non_object_records_are_rejected(tmp_path):
+    path = tmp_path / 'notes.json'
+    path.write_text('["头痛", "发热"]', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(batch_ner.read_documents(str(path), ['text']))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_batch_dict_method(entity_dict, workers):
+    documents = [(i, 'text', text) for i, text in enumerate(['头痛发热', '无不适', '咳嗽'] * 3)]
+    rows = list(batch_ner.run_batch(documents, batch_ner.METHOD_DICT, workers=workers, chunk_size=2))
+    assert [row['doc_id'] for row in rows] == sorted(row['doc_id'] for row in rows)
+    for row in rows:
+        text = documents[row['doc_id']][2]
+        assert text[row['start']:row['end']] == row['entity']
+    assert {row['entity'] for row in rows} >= {'头痛', '发热', '咳嗽'}
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import column_ner
+from medical_entities import recognize_entities, save_medical_entities
+from conftest import TEST_ENTITIES
+
+
+@pytest.fixture
+def table(entity_dict):
+    # 数值单元格也可能包含词典实体
+    save_medical_entities(dict(TEST_ENTITIES, 体温=['39.5', '12']))
+    return pd.DataFrame({
+        '主诉': ['头痛发热三天', None, '', '咳嗽咳嗽，头痛', np.nan, '无不适', '发热\x00咳嗽', '高血压肺炎肺炎'],
+        '体温': [39.5, np.nan, 36.8, 39.5, 12.0, np.nan, 38.0, 39.5],
+        '次数': [12, 3, 112, 0, 12, 5, 7, 1],
+    }, index=[10, 11, 12, 13, 20, 21, 22, 30])
+
+
+def per_row_spans(df, columns):
+    """逐条调用recognize_entities得到的实体区间"""
+    rows = []
+    for field in columns:
+        for row, value in df[field].items():
+            text = '' if pd.isna(value) else str(value).replace(column_ner.ROW_SEPARATOR, ' ')
+            for entity_type, entities in recognize_entities(text).items():
+                for entity in entities:
+                    rows.append((field, row, entity['position'], entity_type, entity['entity']))
+    return sorted(rows)
+
+
+def column_spans(spans):
+    return sorted(zip(spans['field'], spans['row'], spans['start'], spans['entity_type'], spans['entity']))
+
+
+def test_matches_per_row_recognition(table):
+    columns = ['主诉', '体温', '次数']
+    spans = column_ner.recognize_columns(table, columns)
+    assert list(spans.columns) == column_ner.SPAN_COLUMNS
+    assert column_spans(spans) == per_row_spans(table, columns)
+    assert (spans['end'] - spans['start'] == spans['entity'].str.len()).all()
+    assert set(spans['entity']) >= {'头痛', '39.5', '12', '肺炎'}
+
+
+def test_parallel_matches_in_process(table, monkeypatch):
+    columns = ['主诉', '体温', '次数']
+    expected = column_ner.recognize_columns(table, columns)
+    monkeypatch.setattr(column_ner, 'PARALLEL_MIN_CHARS', 1)
+    parallel = column_ner.recognize_columns(table, columns, workers=2, rows_per_task=3)
+    pd.testing.assert_frame_equal(parallel, expected)
+
+
+def test_entity_columns_and_frequencies(table):
+    data, spans, frequencies = column_ner.run_column_ner(table, ['主诉'])
+    assert list(data['主诉_症状']) == ['头痛、发热', '', '', '咳嗽、头痛', '', '', '发热、咳嗽', '']
+    assert list(data['主诉_疾病']) == ['', '', '', '', '', '', '', '高血压、肺炎']
+    assert list(data['主诉_药物']) == [''] * len(table)
+    assert list(data.index) == list(table.index)
+    cough = frequencies[(frequencies['entity'] == '咳嗽')].iloc[0]
+    assert (cough['mentions'], cough['rows']) == (3, 2)
+
+    # 再次识别时替换已有的派生列
+    again = column_ner.add_entity_columns(data, ['主诉'], spans)
+    assert list(again.columns) == list(data.columns)
+
+
+def test_non_unique_index_is_rejected(table):
+    df = table.set_axis([1, 1, 2, 2, 3, 3, 4, 4])
+    with pytest.raises(ValueError):
+        column_ner.recognize_columns(df, ['主诉'])
+    spans = column_ner.recognize_columns(table, ['主诉'])
+    with pytest.raises(ValueError):
+        column_ner.add_entity_columns(df, ['主诉'], spans)
+
+
+def test_missing_column(table):
+    with pytest.raises(ValueError):
+        column_ner.recognize_columns(table, ['现病史'])
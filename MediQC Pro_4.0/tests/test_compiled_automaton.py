@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+import entity_matcher
+from compiled_automaton import CompiledAutomaton, read_fingerprint, write_compiled_automaton
+from data_store import DataStore
+from entity_matcher import AhoCorasick, EntityMatcher
+
+
+def brute_force(text, patterns):
+    """逐个模式用str.find找出所有（可重叠的）出现位置"""
+    matches = set()
+    for pattern, payloads in patterns.items():
+        start = text.find(pattern)
+        while start != -1:
+            matches.add((start, pattern, frozenset(payloads)))
+            start = text.find(pattern, start + 1)
+    return matches
+
+
+def random_patterns(rng, count):
+    patterns = {}
+    for _ in range(count):
+        pattern = ''.join(rng.choice('头痛发热咳a') for _ in range(rng.randint(1, 4)))
+        patterns.setdefault(pattern, set()).add(('custom', rng.choice(['疾病', '症状'])))
+    return patterns
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_compiled_automaton_matches_brute_force(tmp_path, seed):
+    rng = random.Random(seed)
+    patterns = random_patterns(rng, 60)
+    automaton = AhoCorasick()
+    for pattern, payloads in patterns.items():
+        for payload in payloads:
+            automaton.add(pattern, payload)
+    automaton.build()
+    path = str(tmp_path / 'dict.bin')
+    write_compiled_automaton(automaton, path, 'fp-test')
+    compiled = CompiledAutomaton(path)
+
+    assert read_fingerprint(path) == 'fp-test'
+    assert len(compiled) == len(patterns)
+    for _ in range(20):
+        text = ''.join(rng.choice('头痛发热咳ab，') for _ in range(rng.randint(0, 40)))
+        expected = brute_force(text, patterns)
+        in_memory = {(start, term, frozenset(payloads)) for start, term, payloads in automaton.iter_matches(text)}
+        from_file = {(start, term, frozenset(p[:2] for p in payloads))
+                     for start, term, payloads in compiled.iter_matches(text)}
+        assert in_memory == expected
+        assert from_file == expected
+        # 按结束位置排列
+        ends = [start + len(term) for start, term, _ in compiled.iter_matches(text)]
+        assert ends == sorted(ends)
+
+
+def test_entity_matcher_on_compiled_file_matches_in_memory(tmp_path):
+    dictionaries = {'custom': {'症状': ['头痛', '发热', '头'], '疾病': ['肺炎']}}
+    in_memory = EntityMatcher.from_dicts(dictionaries)
+    path = str(tmp_path / 'dict.bin')
+    write_compiled_automaton(in_memory._automaton, path, 'fp', in_memory._term_order, metadata={
+        'type_order': {source: list(types) for source, types in in_memory._type_order.items()},
+        'next_term': [[source, entity_type, count] for (source, entity_type), count in in_memory._next_term.items()]
+    })
+    compiled = EntityMatcher(compiled=CompiledAutomaton(path))
+    text = '患者头痛发热，诊断为肺炎，头部无外伤'
+    assert compiled.recognize(text) == in_memory.recognize(text)
+    assert compiled.find(text) == in_memory.find(text)
+
+
+def entities_digest(path, entities):
+    store = DataStore(str(path))
+    store.replace_entities(entities)
+    return store.get_entities_digest()
+
+
+def test_entities_digest_tracks_content(tmp_path):
+    base = entities_digest(tmp_path / 'a.db', {'症状': ['头痛', '发热']})
+    assert entities_digest(tmp_path / 'b.db', {'症状': ['头痛', '发热']}) == base
+    # 改为等长的实体、调换顺序、改变实体类型都会改变摘要
+    assert entities_digest(tmp_path / 'c.db', {'症状': ['头痛', '咳嗽']}) != base
+    assert entities_digest(tmp_path / 'd.db', {'症状': ['发热', '头痛']}) != base
+    assert entities_digest(tmp_path / 'e.db', {'体征': ['头痛', '发热']}) != base
+
+
+def test_rebuilt_database_with_same_counter_does_not_reuse_stale_compiled_file(workdir, monkeypatch):
+    monkeypatch.setattr(entity_matcher, 'COMPILED_DICTIONARY_MIN_TERMS', 1)
+    monkeypatch.setattr(entity_matcher, '_builtin_dict', lambda: {})
+
+    store = DataStore('data/mediqc.db')
+    store.replace_entities({'症状': ['头痛']})
+    monkeypatch.setattr(entity_matcher, 'get_data_store', lambda: store)
+    matcher = entity_matcher.get_entity_matcher()
+    assert matcher.compiled
+    assert [m[1] for m in matcher.find('头痛咳嗽')] == ['头痛']
+
+    # 重建数据库：变更计数器与之前相同，内容为等长的另一个实体
+    rebuilt = DataStore('data/rebuilt.db')
+    rebuilt.replace_entities({'症状': ['咳嗽']})
+    assert rebuilt.get_version('entities') == store.get_version('entities')
+    monkeypatch.setattr(entity_matcher, 'get_data_store', lambda: rebuilt)
+    monkeypatch.setattr(entity_matcher, '_matcher', None)
+    assert [m[1] for m in entity_matcher.get_entity_matcher().find('头痛咳嗽')] == ['咳嗽']
@@ -0,0 +1,62 @@
+import pytest
+
+import entity_matcher
+from data_store import DataStore, ENTITIES, get_data_store
+from entity_matcher import SOURCE_BUILTIN, get_entity_matcher
+from medical_entities import get_medical_entities, save_medical_entities
+from conftest import TEST_ENTITIES
+
+
+def found_terms(text):
+    return [match[1] for match in get_entity_matcher().find(text)]
+
+
+@pytest.fixture(params=['in_memory', 'compiled'])
+def matcher_mode(request, entity_dict, monkeypatch):
+    """小词典在进程内构建匹配器；把编译阈值调低后改用编译文件"""
+    if request.param == 'compiled':
+        monkeypatch.setattr(entity_matcher, 'COMPILED_DICTIONARY_MIN_TERMS', 1)
+    return request.param
+
+
+def test_in_place_rename_is_picked_up_by_matcher(matcher_mode):
+    text = '诊断为肺炎，排除肺癌'
+    assert found_terms(text) == ['肺炎']
+    assert get_entity_matcher().compiled == (matcher_mode == 'compiled')
+
+    # 原位改名（长度不变、位置不变）
+    entities = {entity_type: list(terms) for entity_type, terms in TEST_ENTITIES.items()}
+    entities['疾病'][0] = '肺癌'
+    digest = get_data_store().get_entities_digest()
+    assert save_medical_entities(entities)
+    assert get_data_store().get_entities_digest() != digest
+    assert get_medical_entities()['疾病'] == ['肺癌', '高血压', '糖尿病']
+    assert found_terms(text) == ['肺癌']
+
+
+def test_edit_from_another_connection_is_picked_up_by_matcher(matcher_mode):
+    assert found_terms('头痛') == ['头痛']
+    # 另一个进程打开同一个数据库文件并修改
+    other = DataStore(get_data_store().path)
+    entities = other.get_entities()
+    entities['症状'] = ['头晕' if term == '头痛' else term for term in entities['症状']]
+    other.replace_entities(entities)
+
+    assert get_data_store().get_version(ENTITIES) == other.get_version(ENTITIES)
+    assert found_terms('头痛头晕') == ['头晕']
+
+
+def test_incremental_add_and_remove(entity_dict):
+    matcher = get_entity_matcher()
+    store = get_data_store()
+    assert store.add_entity('症状', '胸痛')
+    entity_matcher.entity_added('症状', '胸痛')
+    assert get_entity_matcher() is matcher
+    assert found_terms('胸痛发热') == ['胸痛', '发热']
+
+    assert store.delete_entity('症状', '发热')
+    entity_matcher.entity_removed('症状', '发热')
+    assert get_entity_matcher() is matcher
+    assert found_terms('胸痛发热') == ['胸痛']
+    # 内置词典不受影响
+    assert get_entity_matcher().find('发热', sources=(SOURCE_BUILTIN,))
@@ -0,0 +1,70 @@
+import html
+import random
+import re
+
+import pytest
+
+from entity_highlight import (highlight_entities, iter_highlighted_html, non_overlapping, render_highlighted_html,
+                              spans_from_entities)
+
+
+def plain_text(markup):
+    """去掉高亮标签并反转义，应还原为原文"""
+    return html.unescape(re.sub(r'<[^>]*>', '', markup))
+
+
+def test_text_and_entity_type_are_escaped():
+    text = '<b>发热</b> & "咳嗽"'
+    markup = highlight_entities(text, {'<i>症状"': [{'entity': '发热', 'position': 3}],
+                                       'A&B': [{'entity': '"咳嗽"', 'position': 12}]})
+    assert markup == ('&lt;b&gt;<span class="entity-highlight &lt;i&gt;症状&quot;" title="&lt;i&gt;症状&quot;">发热</span>'
+                      '&lt;/b&gt; &amp; <span class="entity-highlight a&amp;b" title="A&amp;B">"咳嗽"</span>')
+    assert plain_text(markup) == text
+
+
+def test_non_overlapping_tie_break():
+    spans = [(2, 4, '症状'), (0, 2, '部位'), (0, 4, '症状'), (0, 4, '疾病'), (3, 6, '疾病'), (6, 6, '空'), (6, 8, '药物')]
+    # 起始位置相同时保留最长的区间（等长时保留先出现的），与已选区间重叠的区间被丢弃，空区间被丢弃
+    assert non_overlapping(spans) == [(0, 4, '症状'), (6, 8, '药物')]
+    assert non_overlapping([(1, 3, 'a'), (0, 2, 'b')]) == [(0, 2, 'b')]
+    assert non_overlapping([]) == []
+
+
+def test_invalid_positions_are_dropped():
+    text = '患者发热咳嗽'
+    entities = {'症状': [
+        {'entity': '发热', 'position': 2},
+        {'entity': '咳嗽', 'position': 3},       # 位置与原文不符
+        {'entity': '咳嗽', 'position': -2},
+        {'entity': '咳嗽', 'position': 5},       # 越界
+        {'entity': '咳嗽', 'position': '4'},
+        {'entity': '咳嗽', 'position': None},
+        {'entity': '', 'position': 0},
+        {'position': 4},
+        {'entity': '咳嗽', 'position': 4},
+    ]}
+    assert spans_from_entities(text, entities) == [(2, 4, '症状'), (4, 6, '症状')]
+    assert plain_text(highlight_entities(text, entities)) == text
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64])
+def test_chunks_join_to_full_html(chunk_size):
+    rng = random.Random(chunk_size)
+    for _ in range(50):
+        text = ''.join(rng.choice('发热咳嗽<>&" \n') for _ in range(rng.randint(0, 40)))
+        spans = []
+        for _ in range(rng.randint(0, 8)):
+            start = rng.randint(0, len(text))
+            spans.append((start, min(len(text), start + rng.randint(0, 4)), rng.choice(['症状', '疾病'])))
+        spans = non_overlapping(spans)
+        expected = render_highlighted_html(text, spans)
+        chunks = list(iter_highlighted_html(text, spans, chunk_size=chunk_size))
+        assert ''.join(chunks) == expected
+        assert all(chunks)
+        assert plain_text(expected) == text
+        assert expected.count('<span') == len(spans)
+
+
+def test_empty_text():
+    assert render_highlighted_html('', []) == ''
+    assert list(iter_highlighted_html('', [], chunk_size=4)) == []
@@ -0,0 +1,42 @@
+from entity_spans import SpanSet, merge_layers, spans_to_entities
+
+
+def test_add_deduplicates_and_keeps_highest_priority():
+    spans = SpanSet()
+    assert spans.add(0, 2, '症状', 0)
+    assert not spans.add(0, 2, '症状', 1)
+    assert not spans.add(3, 3, '症状')
+    assert len(spans) == 1
+    assert spans.priority((0, 2, '症状')) == 1
+
+
+def test_resolve_prefers_longest_then_priority():
+    spans = SpanSet()
+    spans.add(0, 1, '身体部位', 1)
+    spans.add(0, 2, '症状', 0)
+    spans.add(5, 7, '疾病', 0)
+    spans.add(5, 7, '症状', 1)
+    assert spans.resolve() == [(0, 2, '症状'), (5, 7, '症状')]
+
+
+def test_resolve_layers_lets_higher_priority_win_over_longer_spans():
+    spans = SpanSet()
+    spans.add(2, 4, '症状', 1)
+    spans.add(4, 6, '症状', 1)
+    spans.add(0, 6, '症状', 0)      # 较长的规则匹配覆盖了两个词典实体
+    spans.add(7, 9, '检查', 0)      # 不重叠的规则匹配保留
+    assert spans.resolve_layers() == [(2, 4, '症状'), (4, 6, '症状'), (7, 9, '检查')]
+
+
+def test_merge_layers_drops_overlaps_with_earlier_layers():
+    first = [(0, 2, 'a'), (5, 8, 'a')]
+    second = [(1, 3, 'b'), (2, 5, 'b'), (8, 9, 'b'), (7, 10, 'b')]
+    assert merge_layers(first, second) == [(0, 2, 'a'), (2, 5, 'b'), (5, 8, 'a'), (8, 9, 'b')]
+    # 同一层中先出现者优先
+    assert merge_layers([(0, 3, 'a'), (2, 4, 'b')]) == [(0, 3, 'a')]
+
+
+def test_spans_to_entities_keeps_requested_types():
+    text = '患者头痛三天'
+    entities = spans_to_entities(text, [(2, 4, '症状')], ['疾病', '症状'], context_size=2)
+    assert entities == {'疾病': [], '症状': [{'entity': '头痛', 'position': 2, 'context': '患者头痛三天'}]}
@@ -0,0 +1,62 @@
+import llm_ner
+
+COVERED = '患者发热咳嗽。'
+UNCOVERED = '患者右下腹压痛伴反跳痛。'
+
+
+def entity_names(result):
+    return {entity_type: [e['entity'] for e in entities] for entity_type, entities in result.items() if entities}
+
+
+def test_local_coverage(workdir):
+    covered, uncovered = llm_ner._local_sentence_layers([COVERED, UNCOVERED])
+    assert covered['coverage'] == 1.0
+    assert uncovered['coverage'] < llm_ner.HYBRID_COVERAGE_THRESHOLD
+
+
+def test_only_uncovered_sentences_are_sent_to_api(api_config, mock_server):
+    text = COVERED + UNCOVERED + COVERED
+    result, stats = llm_ner.recognize_entities_hybrid(text, return_stats=True)
+    assert stats['sentences'] == 3
+    assert stats['api_sentences'] == 1 and stats['local_sentences'] == 2
+    assert stats['api_requests'] == mock_server.snapshot()['requests'] == 1
+    assert stats['api_error'] is None
+    # API结果（右下腹）比词典结果（腹）长，优先使用
+    assert entity_names(result) == {'症状': ['发热', '咳嗽', '发热', '咳嗽'], '身体部位': ['右下腹']}
+    for entities in result.values():
+        for entity in entities:
+            assert text[entity['position']:entity['position'] + len(entity['entity'])] == entity['entity']
+
+    # 已发给API的句子使用句子级缓存
+    llm_ner.recognize_entities_hybrid(UNCOVERED)
+    assert mock_server.snapshot()['requests'] == 1
+
+
+def test_threshold_controls_selection(api_config, mock_server):
+    api_config['hybrid_coverage_threshold'] = 0
+    stats = llm_ner.recognize_entities_hybrid(COVERED + UNCOVERED, return_stats=True)[1]
+    assert stats['api_sentences'] == 0 and mock_server.snapshot()['requests'] == 0
+
+    api_config['hybrid_coverage_threshold'] = 1.01
+    stats = llm_ner.recognize_entities_hybrid(COVERED + UNCOVERED, return_stats=True)[1]
+    assert stats['api_sentences'] == 2
+    # 两个句子合并为一次请求
+    assert mock_server.snapshot()['requests'] == 1
+
+
+def test_api_failure_falls_back_to_local_results(api_config, mock_server):
+    mock_server.error_rate = 1.0
+    api_config['api_max_retries'] = 0
+    text = COVERED + UNCOVERED
+    result, stats = llm_ner.recognize_entities_hybrid(text, return_stats=True)
+    assert stats['api_error']
+    local = llm_ner._local_sentence_layers([UNCOVERED])[0]['dict']
+    assert entity_names(result)['身体部位'] == [UNCOVERED[start:end] for start, end, _ in local]
+    assert entity_names(result)['症状'] == ['发热', '咳嗽']
+
+
+def test_unconfigured_api_uses_local_results(api_config, mock_server):
+    api_config['api_key'] = ''
+    result, stats = llm_ner.recognize_entities_hybrid(UNCOVERED, return_stats=True)
+    assert stats['api_error'] and mock_server.snapshot()['requests'] == 0
+    assert result == llm_ner.recognize_entities_hybrid_batch([UNCOVERED])[0]
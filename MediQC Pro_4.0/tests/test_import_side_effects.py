@@ -0,0 +1,12 @@
+import os
+import sys
+import subprocess
+
+from conftest import APP_DIR
+
+
+def test_importing_modules_does_not_write_files(workdir):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    subprocess.run([sys.executable, '-c', 'import medical_entities, data_store, entity_matcher, config_cache'],
+                   cwd=workdir, env=env, check=True, capture_output=True)
+    assert os.listdir(workdir) == []
@@ -0,0 +1,145 @@
+import socket
+import time
+
+import pytest
+import requests
+
+import llm_client
+from llm_client import CircuitBreaker, CircuitOpenError, LLMClient, get_llm_client
+
+PAYLOAD = {'messages': [{'role': 'user', 'content': '你好'}]}
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, 'BACKOFF_BASE_SECONDS', 0.001)
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/v1'
+
+
+def test_timeouts_from_config(mock_server):
+    client = get_llm_client({'api_url': mock_server.url, 'api_connect_timeout': 1.5, 'api_read_timeout': 7})
+    assert client.timeout == (1.5, 7)
+    assert get_llm_client({'api_url': mock_server.url, 'api_connect_timeout': 1.5, 'api_read_timeout': 7}) is client
+    assert get_llm_client({'api_url': mock_server.url}) is not client
+
+
+def test_read_timeout_is_retried_then_raised(mock_server):
+    mock_server.latency_ms = 300
+    client = LLMClient(read_timeout=0.05, max_retries=1)
+    with pytest.raises(requests.Timeout):
+        client.post(mock_server.url, PAYLOAD)
+    assert client.stats['requests'] == 2
+    assert client.stats['retries'] == 1
+    assert client.stats['failures'] == 1
+
+
+def test_connection_failure_is_retried_then_raised():
+    client = LLMClient(connect_timeout=0.5, max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.post(closed_port_url(), PAYLOAD)
+    assert client.stats['requests'] == 3
+    assert client.stats['failures'] == 1
+
+
+def test_retry_status_gives_up_after_limit(mock_server):
+    mock_server.error_rate = 1.0
+    mock_server.error_codes = (503,)
+    client = LLMClient(max_retries=2)
+    response = client.post(mock_server.url, PAYLOAD)
+    assert response.status_code == 503
+    assert mock_server.snapshot()['requests'] == 3
+    assert client.stats == {'requests': 3, 'retries': 2, 'failures': 1, 'rejected': 0}
+
+
+def test_retry_succeeds_after_transient_errors(mock_server, monkeypatch):
+    mock_server.error_rate = 1.0
+    mock_server.error_codes = (500,)
+    backoff = LLMClient._backoff
+
+    def recover(client, attempt, response=None):
+        mock_server.error_rate = 0.0
+        return backoff(client, attempt, response)
+
+    monkeypatch.setattr(LLMClient, '_backoff', recover)
+    client = LLMClient(max_retries=2)
+    assert client.post(mock_server.url, PAYLOAD).status_code == 200
+    assert client.stats['retries'] == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_is_jittered_and_bounded(monkeypatch):
+    monkeypatch.setattr(llm_client, 'BACKOFF_BASE_SECONDS', 0.5)
+    client = LLMClient()
+    for attempt in range(6):
+        delays = {client._backoff(attempt) for _ in range(50)}
+        limit = min(llm_client.BACKOFF_MAX_SECONDS, 0.5 * 2 ** attempt)
+        assert all(0 <= delay <= limit for delay in delays)
+        assert len(delays) > 1
+
+    response = requests.Response()
+    response.headers['Retry-After'] = '3'
+    assert client._backoff(0, response) == 3
+    response.headers['Retry-After'] = '3600'
+    assert client._backoff(0, response) == llm_client.RETRY_AFTER_MAX_SECONDS
+
+
+def test_circuit_breaker_opens_and_half_opens(mock_server):
+    mock_server.error_rate = 1.0
+    mock_server.error_codes = (500,)
+    client = LLMClient(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_seconds=0.2))
+    for _ in range(2):
+        assert client.post(mock_server.url, PAYLOAD).status_code == 500
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 熔断期间不发送请求
+    requests_sent = mock_server.snapshot()['requests']
+    with pytest.raises(CircuitOpenError):
+        client.post(mock_server.url, PAYLOAD)
+    assert mock_server.snapshot()['requests'] == requests_sent
+    assert client.stats['rejected'] == 1
+
+    # 熔断结束后试探请求失败，重新熔断
+    time.sleep(0.25)
+    assert client.post(mock_server.url, PAYLOAD).status_code == 500
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.post(mock_server.url, PAYLOAD)
+
+    # 试探请求成功后恢复
+    time.sleep(0.25)
+    mock_server.error_rate = 0.0
+    assert client.post(mock_server.url, PAYLOAD).status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.post(mock_server.url, PAYLOAD).status_code == 200
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_pooled_connection_is_reused(mock_server, monkeypatch):
+    from urllib3.connection import HTTPConnection
+    connects = []
+    connect = HTTPConnection.connect
+    monkeypatch.setattr(HTTPConnection, 'connect', lambda conn: connects.append(conn) or connect(conn))
+
+    client = LLMClient()
+    for _ in range(5):
+        response = client.post(mock_server.url, PAYLOAD)
+        assert response.status_code == 200
+        response.json()
+    assert mock_server.snapshot()['requests'] == 5
+    assert len(connects) == 1
@@ -0,0 +1,111 @@
+import json
+import random
+
+import pytest
+
+import llm_ner
+from llm_stream import IncrementalEntityParser, format_sse, iter_stream_content
+
+ENTITIES = {
+    '疾病': [{'entity': '肺炎', 'position': 3}, {'entity': '{括号}"引号"\\', 'position': 10}],
+    '症状': [{'entity': '发热', 'position': 0}],
+}
+EXPECTED = [(entity_type, entity) for entity_type, entities in ENTITIES.items() for entity in entities]
+
+
+def parse(chunks):
+    parser = IncrementalEntityParser()
+    entities = []
+    for chunk in chunks:
+        entities.extend(parser.feed(chunk))
+    return entities, parser
+
+
+def random_chunks(text, rng):
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + rng.randint(1, 7)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+@pytest.mark.parametrize('reply', [
+    json.dumps(ENTITIES, ensure_ascii=False),
+    json.dumps(ENTITIES),
+    '```json\n' + json.dumps(ENTITIES, ensure_ascii=False, indent=2) + '\n```\n以上为识别结果{不是JSON}',
+])
+def test_arbitrary_chunk_splits(reply):
+    assert parse([reply])[0] == EXPECTED
+    assert parse(list(reply))[0] == EXPECTED
+    rng = random.Random(reply)
+    for _ in range(50):
+        entities, parser = parse(random_chunks(reply, rng))
+        assert entities == EXPECTED
+        assert parser.finished
+
+
+def test_escaped_type_keys_are_decoded():
+    entities, _ = parse(['{"\\u75be\\u75c5": [{"entity": "肺炎"}], "a\\"b": [{"entity": "x"}]}'])
+    assert entities == [('疾病', {'entity': '肺炎'}), ('a"b', {'entity': 'x'})]
+
+
+def test_preamble_braces_before_fence():
+    reply = '按{类型: [实体]}格式返回：\n```json\n{"疾病": [{"entity": "肺炎", "position": 3}]}\n```'
+    entities, parser = parse(list(reply))
+    assert entities == [('疾病', {'entity': '肺炎', 'position': 3})]
+    assert parser.finished
+
+
+def test_fenced_json_after_unfenced_example():
+    reply = '格式示例：{"疾病": []}。结果：\n```json\n{"疾病": [{"entity": "肺炎"}]}\n```\n```json\n{"症状": [{"entity": "x"}]}\n```'
+    entities, parser = parse(random_chunks(reply, random.Random(0)))
+    assert entities == [('疾病', {'entity': '肺炎'})]
+    assert parser.finished
+
+
+def test_invalid_and_truncated_replies_are_not_finished():
+    for reply in ['抱歉，我无法处理这个请求。', '按{类型: [实体]}格式返回', '{"疾病": [{"entity": "肺炎"}, {"entity": "发']:
+        _, parser = parse([reply])
+        assert not parser.finished
+    entities, parser = parse(['{"疾病": [{"entity": ""}, "肺炎", {"position": 1}]}'])
+    assert entities == [] and parser.finished
+
+
+class FakeResponse:
+    def __init__(self, lines):
+        self.lines = lines
+        self.encoding = None
+
+    def iter_lines(self, decode_unicode=False):
+        assert self.encoding == 'utf-8'
+        return iter(self.lines)
+
+
+def test_iter_stream_content():
+    lines = [
+        ': keep-alive',
+        '',
+        'data: ' + json.dumps({'choices': [{'delta': {'role': 'assistant'}}]}),
+        'data: ' + json.dumps({'choices': [{'delta': {'content': '{"疾病"'}}]}, ensure_ascii=False),
+        'data: not json',
+        'data: ' + json.dumps({'choices': []}),
+        'data:' + json.dumps({'choices': [{'delta': {'content': ': []}'}}]}),
+        'data: [DONE]',
+        'data: ' + json.dumps({'choices': [{'delta': {'content': '之后的内容'}}]}, ensure_ascii=False),
+    ]
+    assert list(iter_stream_content(FakeResponse(lines))) == ['{"疾病"', ': []}']
+
+
+def test_format_sse():
+    assert format_sse('entity', {'entity': '肺炎'}) == 'event: entity\ndata: {"entity": "肺炎"}\n\n'
+
+
+def test_unparsable_stream_is_not_cached(api_config, mock_server):
+    mock_server.malformed_rate = 1.0
+    events = list(llm_ner.stream_entities_with_api('患者发热。'))
+    assert ('error', {'message': '无法解析API返回的JSON'}) in events
+    assert events[-1][1]['source'] == 'rules'
+    mock_server.malformed_rate = 0.0
+    assert list(llm_ner.stream_entities_with_api('患者发热。'))[-1][1]['source'] == 'api'
@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+
+import llm_ner
+from ner_cache import NERCache, get_ner_cache
+from llm_ner import CACHE_BACKEND_TRANSFORMER, DEFAULT_CONFIG
+
+
+RESULT = {'症状': [{'entity': '发热', 'position': 2, 'context': '患者发热', 'score': 0.987}]}
+
+
+def test_round_trip_memory_and_disk(tmp_path):
+    path = str(tmp_path / 'ner_cache.db')
+    cache = NERCache(path)
+    cache.put('患者发热', 'api', 'v1', RESULT)
+    assert cache.get('患者发热', 'api', 'v1') == RESULT
+    assert cache.stats['memory_hits'] == 1
+    # 其他版本、其他后端不命中
+    assert cache.get('患者发热', 'api', 'v2') is None
+    assert cache.get('患者发热', 'transformer', 'v1') is None
+
+    # 另一个进程（新的实例）从磁盘读取
+    other = NERCache(path)
+    assert other.get('患者发热', 'api', 'v1') == RESULT
+    assert other.stats['disk_hits'] == 1
+    # 返回的是副本，修改不影响缓存
+    other.get('患者发热', 'api', 'v1')['症状'].clear()
+    assert other.get('患者发热', 'api', 'v1') == RESULT
+
+
+def test_memory_only_entries_are_not_persisted(tmp_path):
+    path = str(tmp_path / 'ner_cache.db')
+    cache = NERCache(path)
+    cache.put('头痛', 'rules', 'v1', {}, persist=False)
+    assert cache.get('头痛', 'rules', 'v1', persist=False) == {}
+    assert cache.disk_entries() == 0
+    assert NERCache(path).get('头痛', 'rules', 'v1') is None
+
+
+def test_unserializable_result_is_skipped(tmp_path, capsys):
+    cache = NERCache(str(tmp_path / 'ner_cache.db'))
+    cache.put('患者发热', 'transformer', 'v1', {'症状': [{'entity': '发热', 'score': np.float32(0.9)}]})
+    assert '无法缓存' in capsys.readouterr().out
+    assert cache.get('患者发热', 'transformer', 'v1') is None
+    assert cache.disk_entries() == 0
+
+
+class StubPipeline:
+    """模拟transformers的NER管道：识别文本段中的“发热”，分数为numpy.float32"""
+
+    tokenizer = None
+
+    def __call__(self, inputs, batch_size=None):
+        if isinstance(inputs, str):
+            return self._entities(inputs)
+        return [self._entities(segment) for segment in inputs]
+
+    def _entities(self, segment):
+        start = segment.find('发热')
+        if start == -1:
+            return []
+        return [{'entity_group': 'SYM', 'word': '发热', 'start': start, 'end': start + 2,
+                 'score': np.float32(0.98765)}]
+
+
+@pytest.mark.parametrize('sentence_memo', [True, False])
+def test_transformer_numpy_scores_are_cached(workdir, monkeypatch, sentence_memo):
+    config = dict(DEFAULT_CONFIG, api_mode=False, ner_server_socket='', sentence_memo=sentence_memo,
+                  custom_entity_types={'SYM': '症状'})
+    monkeypatch.setattr(llm_ner, 'get_llm_config', lambda: config)
+    monkeypatch.setattr(llm_ner, 'transformer_backend_available', lambda config=None: True)
+    monkeypatch.setattr(llm_ner, 'load_transformer_model', lambda model_name=None, reload=False: StubPipeline())
+    rule_calls = []
+    monkeypatch.setattr(llm_ner, 'recognize_entities_with_rules', lambda text: rule_calls.append(text) or {})
+
+    texts = ['患者发热三天。', '无不适，发热已退。']
+    results = llm_ner.recognize_entities_with_transformer_batch(texts, model_name='stub-model')
+    assert not rule_calls
+    for text, result in zip(texts, results):
+        entity, = result['症状']
+        assert type(entity['score']) is float and entity['score'] == 0.988
+        assert text[entity['position']:entity['position'] + 2] == '发热'
+        json.dumps(result)
+
+    # 结果已写入缓存，再次识别不需要加载模型
+    version = llm_ner.get_transformer_cache_version(config, 'stub-model')
+    assert get_ner_cache().get(texts[0], CACHE_BACKEND_TRANSFORMER, version) == results[0]
+    monkeypatch.setattr(llm_ner, 'load_transformer_model', lambda model_name=None, reload=False: None)
+    assert llm_ner.recognize_entities_with_transformer_batch(texts, model_name='stub-model') == results
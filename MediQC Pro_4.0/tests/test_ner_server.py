@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+import llm_ner
+from ner_server import MicroBatcher, NERClient, NERServer, NERServerBusy
+
+
+def echo(texts, model_name):
+    return [{'text': text, 'model': model_name} for text in texts]
+
+
+class BlockingRecognizer:
+    """记录每个批次；release()之前阻塞在识别中"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, texts, model_name):
+        self.batches.append((list(texts), model_name))
+        self.started.set()
+        self.released.wait(5)
+        return echo(texts, model_name)
+
+    def release(self):
+        self.released.set()
+
+
+def submit_in_thread(batcher, texts, model_name=None):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['results'] = batcher.submit(texts, model_name, timeout=5)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_full_queue_rejects_immediately():
+    recognizer = BlockingRecognizer()
+    batcher = MicroBatcher(recognizer, max_batch_texts=1, max_wait_ms=0, max_queue=2)
+    first = submit_in_thread(batcher, ['a'])
+    assert recognizer.started.wait(5)
+    # 识别线程被占用，后续请求在队列中等待，队列满时立即返回繁忙
+    queued = [submit_in_thread(batcher, [text]) for text in 'bc']
+    wait_for(lambda: batcher.queued() == 2)
+    start = time.monotonic()
+    with pytest.raises(NERServerBusy):
+        batcher.submit(['d'])
+    assert time.monotonic() - start < 1
+    assert batcher.stats['rejected'] == 1
+
+    recognizer.release()
+    for (thread, outcome), text in zip([first] + queued, 'abc'):
+        thread.join(5)
+        assert outcome['results'] == [{'text': text, 'model': None}]
+    assert batcher.stats['requests'] == 3
+    assert batcher.queued() == 0
+
+
+def test_concurrent_requests_are_batched_and_split_back():
+    recognizer = BlockingRecognizer()
+    batcher = MicroBatcher(recognizer, max_batch_texts=10, max_wait_ms=0, max_queue=10)
+    blocker = submit_in_thread(batcher, ['x'])
+    assert recognizer.started.wait(5)
+    submissions = []
+    for texts in (['a', 'b'], ['c'], ['d', 'e', 'f']):
+        submissions.append(submit_in_thread(batcher, texts))
+        wait_for(lambda: batcher._queue.qsize() == len(submissions))
+    other_model = submit_in_thread(batcher, ['g'], 'other')
+    wait_for(lambda: batcher.queued() == 4)
+    recognizer.release()
+
+    for thread, _ in [blocker] + submissions + [other_model]:
+        thread.join(5)
+    for (_, outcome), texts in zip(submissions, (['a', 'b'], ['c'], ['d', 'e', 'f'])):
+        assert outcome['results'] == [{'text': text, 'model': None} for text in texts]
+    assert other_model[1]['results'] == [{'text': 'g', 'model': 'other'}]
+    # 同一模型的三个请求合并为一批，其他模型的请求单独成批
+    assert recognizer.batches == [(['x'], None), (['a', 'b', 'c', 'd', 'e', 'f'], None), (['g'], 'other')]
+
+
+def test_batch_error_is_reported_to_every_request():
+    def fail(texts, model_name):
+        raise ValueError('模型出错')
+
+    batcher = MicroBatcher(fail, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match='模型出错'):
+        batcher.submit(['a'], timeout=5)
+    assert batcher.stats['errors'] == 1
+
+
+def test_server_round_trip_and_busy(tmp_path, monkeypatch):
+    recognizer = BlockingRecognizer()
+    monkeypatch.setattr(llm_ner, 'recognize_entities_with_transformer_batch',
+                        lambda texts, model_name=None, use_server=True: recognizer(texts, model_name))
+    server = NERServer(str(tmp_path / 'ner.sock'), max_wait_ms=0, max_queue=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = NERClient(server.socket_path, timeout=5)
+        results = {}
+        first = threading.Thread(target=lambda: results.setdefault('first', client.recognize(['头痛'])))
+        first.start()
+        assert recognizer.started.wait(5)
+        second = threading.Thread(target=lambda: results.setdefault('second', client.recognize(['发热'])))
+        second.start()
+        wait_for(lambda: server.batcher.queued() == 1)
+        with pytest.raises(NERServerBusy):
+            client.recognize(['咳嗽'])
+
+        recognizer.release()
+        first.join(5)
+        second.join(5)
+        assert results == {'first': [{'text': '头痛', 'model': None}], 'second': [{'text': '发热', 'model': None}]}
+        assert client.stats()['stats']['rejected'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class SteppedRecognizer:
+    """每个批次等待一次step()后才返回"""
+
+    def __init__(self):
+        self.batches = []
+        self._steps = threading.Semaphore(0)
+
+    def __call__(self, texts, model_name):
+        self.batches.append((list(texts), model_name))
+        assert self._steps.acquire(timeout=5)
+        return echo(texts, model_name)
+
+    def step(self, count=1):
+        for _ in range(count):
+            self._steps.release()
+
+
+def test_deferred_requests_count_against_queue_limit():
+    recognizer = SteppedRecognizer()
+    batcher = MicroBatcher(recognizer, max_batch_texts=10, max_wait_ms=0, max_queue=3)
+    submissions = [submit_in_thread(batcher, ['a'], 'm1')]
+    wait_for(lambda: len(recognizer.batches) == 1)
+    for queued, (text, model) in enumerate((('b', 'm2'), ('c', 'm1'), ('d', 'm1')), 1):
+        submissions.append(submit_in_thread(batcher, [text], model))
+        wait_for(lambda: batcher._queue.qsize() == queued)
+    with pytest.raises(NERServerBusy):
+        batcher.submit(['x'], 'm2')
+
+    # 第二批只含m2的请求，m1的两个请求留到以后的批次，仍占用等待队列
+    recognizer.step()
+    wait_for(lambda: len(recognizer.batches) == 2)
+    assert batcher.queued() == 2
+    submissions.append(submit_in_thread(batcher, ['e'], 'm2'))
+    wait_for(lambda: batcher.queued() == 3)
+    with pytest.raises(NERServerBusy):
+        batcher.submit(['y'], 'm1')
+
+    recognizer.step(10)
+    for thread, _ in submissions:
+        thread.join(5)
+    for (_, outcome), (text, model) in zip(submissions, [('a', 'm1'), ('b', 'm2'), ('c', 'm1'), ('d', 'm1'), ('e', 'm2')]):
+        assert outcome['results'] == [{'text': text, 'model': model}]
+    # 留下的同一模型的请求合并为一批
+    assert recognizer.batches == [(['a'], 'm1'), (['b'], 'm2'), (['c', 'd'], 'm1'), (['e'], 'm2')]
+    assert batcher.stats['rejected'] == 2
+    assert batcher.queued() == 0
@@ -0,0 +1,61 @@
+import random
+import re
+
+import pytest
+
+from llm_ner import MEDICAL_ENTITY_RULES
+from rule_matcher import RuleMatcher
+
+# 编译为查找表的规则形式（词表规则、带可选前缀的后缀规则）以及需要单独匹配的正则规则
+CUSTOM_RULES = {
+    '疾病': [r'(?<![一-龥])(急性|慢性)?([一-龥]{2,3})(炎|综合征)(?![一-龥])',
+             r'(?<![一-龥])(肺炎|胃炎|急性胃炎)(?![一-龥])'],
+    '症状': [r'(?<![一-龥])([一-龥]{1,2})(痛|不适)(?![一-龥])'],
+    '体征': [r'\d+次/分', r'(?<![一-龥])(心率|心率快)(?![一-龥])'],
+}
+
+
+def per_rule_matches(rules, text):
+    """对每条规则分别调用re.finditer"""
+    return {(match.start(), match.end(), entity_type)
+            for entity_type, patterns in rules.items() for pattern in patterns
+            for match in re.finditer(pattern, text)}
+
+
+def pieces(rules):
+    """生成测试文本的片段：规则中的词、前缀、后缀以及其他汉字、字母、数字和标点"""
+    words = set()
+    for patterns in rules.values():
+        for pattern in patterns:
+            for group in re.findall(r'\(([^()?]*)\)', pattern):
+                words.update(word for word in group.split('|') if re.fullmatch(r'[一-龥A-Za-z]+', word))
+    return sorted(words) + ['急性', '慢性', '患', '者', '左', '右', '的', '12次/分', '3', 'CT', 'x', '，', '。', ' ', '\n']
+
+
+@pytest.mark.parametrize('rules', [MEDICAL_ENTITY_RULES, CUSTOM_RULES], ids=['medical', 'custom'])
+def test_matches_per_rule_regex(rules):
+    matcher = RuleMatcher(rules)
+    alphabet = pieces(rules)
+    rng = random.Random(len(alphabet))
+    for _ in range(5000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        found = matcher.find(text)
+        # 同一规则类型的多条规则匹配同一段文本时只返回一次
+        assert len(found) == len(set(found))
+        assert set(found) == per_rule_matches(rules, text), text
+
+
+def test_compiled_rule_forms():
+    matcher = RuleMatcher(MEDICAL_ENTITY_RULES)
+    # 只有包含英文字母的检查规则需要单独匹配
+    assert matcher.regex_rule_count == 1
+    assert matcher.table_rule_count == sum(len(patterns) for patterns in MEDICAL_ENTITY_RULES.values()) - 1
+
+    matcher = RuleMatcher(CUSTOM_RULES)
+    assert matcher.regex_rule_count == 1
+    assert sorted(matcher.find('急性阑尾炎，心率快，120次/分')) == [
+        (0, 5, '疾病'), (6, 9, '体征'), (10, 16, '体征')]
+    # 可选前缀之外的部分长度不符时不匹配
+    assert matcher.find('急性胃肠炎') == [(0, 5, '疾病')]
+    assert matcher.find('急性胃炎') == [(0, 4, '疾病')]
+    assert matcher.find('急性胃') == []
@@ -0,0 +1,45 @@
+import pytest
+
+import llm_ner
+
+
+def entity_names(result):
+    return {entity_type: [e['entity'] for e in entities] for entity_type, entities in result.items() if entities}
+
+
+def test_regex_spans_do_not_swallow_dictionary_terms(workdir):
+    # 回归：规则匹配“患者发热咳嗽”“诊断为肺炎”不应覆盖其中的词典实体
+    result = llm_ner.recognize_entities_with_rules('患者发热咳嗽，诊断为肺炎')
+    assert entity_names(result) == {'疾病': ['肺炎'], '症状': ['发热', '咳嗽']}
+
+
+def test_unresolved_rules_keep_all_hits(workdir):
+    result = entity_names(llm_ner.recognize_entities_with_rules('患者发热咳嗽，诊断为肺炎', resolve_overlaps=False))
+    assert {'发热', '咳嗽', '患者发热咳嗽'} <= set(result['症状'])
+    assert {'肺炎', '诊断为肺炎'} <= set(result['疾病'])
+
+
+def test_positions_point_into_the_text(workdir):
+    text = '患者三天前出现头痛、发热。\n查体：腹部压痛，诊断为肺炎。'
+    for entities in llm_ner.recognize_entities_with_rules(text).values():
+        for entity in entities:
+            assert text[entity['position']:entity['position'] + len(entity['entity'])] == entity['entity']
+
+
+@pytest.mark.parametrize('sentence_memo', [True, False])
+def test_sentence_memo_config_is_honoured(workdir, monkeypatch, sentence_memo):
+    text = '患者发热咳嗽。\n诊断为肺炎。患者发热咳嗽。'
+    expected = llm_ner._match_rules(text, True)
+    config = dict(llm_ner.DEFAULT_CONFIG, sentence_memo=sentence_memo)
+    monkeypatch.setattr(llm_ner, 'get_llm_config', lambda: config)
+    memos = []
+    get_sentence_memo = llm_ner.get_sentence_memo
+
+    def recording_memo(backend, *args, **kwargs):
+        memos.append(backend)
+        return get_sentence_memo(backend, *args, **kwargs)
+
+    monkeypatch.setattr(llm_ner, 'get_sentence_memo', recording_memo)
+
+    assert llm_ner.recognize_entities_with_rules(text) == expected
+    assert bool(memos) == sentence_memo
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+import llm_ner
+from llm_ner import _owned_ranges, _run_pipeline_batched, _segment_text, _tokenize_offsets
+
+
+def token_count(segment):
+    return len(_tokenize_offsets(segment, None)[0])
+
+
+def random_text(rng, length):
+    pieces = ['头', '痛', '发', '热', '。', '，', ' ', '\n', 'CT', 'abc123', 'x', '；']
+    return ''.join(rng.choice(pieces) for _ in range(length))
+
+
+@pytest.mark.parametrize('max_tokens,stride', [(1, 0), (5, 0), (5, 2), (10, 4), (30, 8)])
+def test_segments_map_back_and_respect_budget(max_tokens, stride):
+    rng = random.Random(max_tokens * 100 + stride)
+    for _ in range(100):
+        text = random_text(rng, rng.randint(0, 60))
+        segments = _segment_text(text, max_tokens=max_tokens, stride=stride)
+        tokens = _tokenize_offsets(text, None)[0]
+        if not tokens:
+            assert segments == []
+            continue
+        covered = set()
+        for offset, segment in segments:
+            assert text[offset:offset + len(segment)] == segment
+            assert segment == segment.strip()
+            # 超长的词（如连续的字母数字）按token数上限切开，token数仍不超过上限
+            assert 0 < token_count(segment) <= max_tokens
+            covered.update(range(offset, offset + len(segment)))
+        offsets = [offset for offset, _ in segments]
+        assert offsets == sorted(set(offsets))
+        assert all(start in covered for start, _ in tokens)
+
+
+def test_cuts_prefer_sentence_ends():
+    text = '头痛三天。发热两天伴咳嗽。腹痛一天。'
+    assert _segment_text(text, max_tokens=8, stride=0) == [(0, '头痛三天。'), (5, '发热两天伴咳嗽。'), (13, '腹痛一天。')]
+
+
+def test_cuts_fall_back_to_word_boundaries():
+    text = 'fever cough headache abdominal'
+    segments = _segment_text(text, max_tokens=12, stride=0)
+    assert [segment for _, segment in segments] == ['fever cough', 'headache', 'abdominal']
+    # 单个词超过上限时按token数切开
+    assert [segment for _, segment in _segment_text('abcdefghij', max_tokens=4, stride=0)] == ['abcd', 'efgh', 'ij']
+
+
+def test_overlapping_windows_and_owned_ranges():
+    text = '甲' * 50
+    segments = _segment_text(text, max_tokens=20, stride=6)
+    assert [(offset, len(segment)) for offset, segment in segments] == [(0, 20), (14, 20), (28, 20), (42, 8)]
+    owned = _owned_ranges([(0, offset, segment) for offset, segment in segments])
+    # 重叠区域以中点为界
+    assert [owned[(0, offset)] for offset, _ in segments] == [(0, 17), (17, 31), (31, 45), (45, float('inf'))]
+
+
+class StubPipeline:
+    """在每个文本段中查找完整出现的词条，返回相对于文本段的位置"""
+
+    TERMS = {'阿司匹林': 'DRUG', '发热': 'SYM'}
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, inputs, batch_size=None):
+        if isinstance(inputs, str):
+            return self._find(inputs)
+        self.calls.append(len(inputs))
+        return [self._find(segment) for segment in inputs]
+
+    def _find(self, segment):
+        found = []
+        for term, label in self.TERMS.items():
+            start = segment.find(term)
+            while start != -1:
+                found.append({'entity_group': label, 'word': term, 'start': start, 'end': start + len(term),
+                              'score': 0.9})
+                start = segment.find(term, start + 1)
+        return found
+
+
+def test_entity_across_window_boundary_is_returned_once():
+    filler = '患者一般情况尚可无明显不适近期饮食睡眠正常大小便无异常' * 2
+    for position in range(0, 40):
+        text = filler[:position] + '阿司匹林' + filler[position:44]
+        segments = _segment_text(text, max_tokens=20, stride=8)
+        assert len(segments) > 1
+        entities = _run_pipeline_batched(
+            StubPipeline(), [(0, offset, segment) for offset, segment in segments], batch_size=2)[0]
+        assert [(entity['word'], entity['start'], entity['end']) for entity in entities] == \
+            [('阿司匹林', position, position + 4)]
+
+
+def test_pipeline_results_for_several_texts(monkeypatch):
+    config = dict(llm_ner.DEFAULT_CONFIG, transformer_stride=4, custom_entity_types={'DRUG': '药物', 'SYM': '症状'})
+    monkeypatch.setattr(llm_ner, '_token_budget', lambda tokenizer: 12)
+    texts = ['发热三天，服用阿司匹林后好转。' * 3, '', '无不适。', '阿司匹林']
+    pipeline = StubPipeline()
+    results = llm_ner._recognize_with_pipeline(pipeline, texts, 'stub-model', config, batch_size=3)
+    assert all(size <= 3 for size in pipeline.calls)
+    for text, result in zip(texts, results):
+        expected = sorted((start, term) for term in StubPipeline.TERMS
+                          for start in range(len(text)) if text.startswith(term, start))
+        found = sorted((entity['position'], entity['entity']) for entities in result.values() for entity in entities)
+        assert found == expected
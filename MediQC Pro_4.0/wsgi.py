@@ -0,0 +1,14 @@
+"""
+WSGI入口
+
+创建应用实例并在导入时完成预热。配合gunicorn的preload_app使用时，预热只在主进程中
+执行一次，工作进程fork后直接共享已加载的规则、字典和模型：
+
+    gunicorn -c gunicorn.conf.py
+
+设置环境变量MEDIQC_PRELOAD_MODEL=1可在预热时同时加载Transformer模型。
+"""
+import os
+from app import create_app
+
+app = create_app(run_warmup=True, load_model=os.environ.get('MEDIQC_PRELOAD_MODEL') == '1')